@@ -0,0 +1,250 @@
+import io
+import numpy as np
+from db_connection import transaction
+from stat_columns import SIDES, numeric_sql, stat_column, typed_storage
+from storage import embedded, get_backend
+
+# Statistics loaded when the caller doesn't ask for specific ones.
+DEFAULT_STATS = ["expected goals", "total shots", "shots on target", "ball possession", "big chances", "corner kicks"]
+
+class MatchTable:
+    """Columnar, in-memory copy of match_statistics (or a slice of it) for vectorized analytics.
+
+    Every match appears twice in the team view: once from the home side and once from the away
+    side, sorted by team and date, so per-team windows are contiguous slices.
+    """
+
+    def __init__(self, match_ids, dates, league_ids, home_team_ids, away_team_ids, stats,
+                 home_goals, away_goals, team_names, league_names):
+        self.match_ids = match_ids
+        self.dates = dates
+        self.league_ids = league_ids
+        self.home_team_ids = home_team_ids
+        self.away_team_ids = away_team_ids
+        self.stats = stats
+        self.home_goals = home_goals
+        self.away_goals = away_goals
+        self.team_names = team_names
+        self.league_names = league_names
+        self._build_team_view()
+
+    @classmethod
+    def load(cls, start_date=None, end_date=None, league_ids=None, stats=None):
+        """Loads match_statistics in one query, optionally limited to a date range and leagues."""
+        stats = list(stats or DEFAULT_STATS)
+        if embedded():
+            data, teams, leagues = _fetch_sqlite(stats, start_date, end_date, league_ids)
+        else:
+            data, teams, leagues = _fetch_postgres(stats, start_date, end_date, league_ids)
+
+        stat_arrays = {}
+        for i, name in enumerate(stats):
+            stat_arrays[name] = (data[:, 7 + 2 * i], data[:, 8 + 2 * i])
+        return cls(
+            match_ids=data[:, 0].astype(np.int64),
+            dates=data[:, 1].astype("datetime64[D]"),
+            league_ids=data[:, 2].astype(np.int64),
+            home_team_ids=data[:, 3].astype(np.int64),
+            away_team_ids=data[:, 4].astype(np.int64),
+            stats=stat_arrays,
+            home_goals=data[:, 5],
+            away_goals=data[:, 6],
+            team_names=_name_lookup(teams),
+            league_names=_name_lookup(leagues),
+        )
+
+    def __len__(self):
+        return len(self.match_ids)
+
+    def _build_team_view(self):
+        """Builds the doubled, (team, date)-sorted per-team arrays."""
+        n = len(self.match_ids)
+        team = np.concatenate([self.home_team_ids, self.away_team_ids])
+        dates = np.concatenate([self.dates, self.dates])
+        is_home = np.concatenate([np.ones(n, dtype=bool), np.zeros(n, dtype=bool)])
+        order = np.lexsort((dates, team))
+
+        self.team_order = order
+        self.team = team[order]
+        self.team_dates = dates[order]
+        self.team_is_home = is_home[order]
+        self.team_league = np.concatenate([self.league_ids, self.league_ids])[order]
+        self.team_stats = {
+            name: np.concatenate([home, away])[order] for name, (home, away) in self.stats.items()
+        }
+
+        # Index of the first row of each team's block, for every row.
+        boundaries = np.flatnonzero(np.r_[True, self.team[1:] != self.team[:-1]]) if len(self.team) else np.array([], dtype=np.int64)
+        block_sizes = np.diff(np.r_[boundaries, len(self.team)])
+        self.team_block_start = np.repeat(boundaries, block_sizes)
+        self.team_ids = self.team[boundaries]
+        self.team_block_end = boundaries + block_sizes
+
+    def rolling_mean(self, stat, last_n):
+        """Per-team rolling mean of a stat over each team's last `last_n` matches (NaNs skipped).
+
+        Returns an array aligned with the team view (self.team / self.team_dates).
+        """
+        values = self.team_stats[stat]
+        present = ~np.isnan(values)
+        sums = np.r_[0.0, np.cumsum(np.where(present, values, 0.0))]
+        counts = np.r_[0, np.cumsum(present)]
+        idx = np.arange(len(values))
+        lower = np.maximum(idx + 1 - last_n, self.team_block_start)
+        window_sum = sums[idx + 1] - sums[lower]
+        window_count = counts[idx + 1] - counts[lower]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(window_count > 0, window_sum / window_count, np.nan)
+
+    def team_form(self, stat, last_n=5):
+        """Returns {team name: mean of stat over the team's last `last_n` matches}."""
+        rolling = self.rolling_mean(stat, last_n)
+        latest = rolling[self.team_block_end - 1]
+        return {self.team_names[team_id]: value for team_id, value in zip(self.team_ids, latest)}
+
+    def home_away_split(self, stat):
+        """Returns {team name: (home mean, away mean)} of a stat."""
+        values = self.team_stats[stat]
+        present = ~np.isnan(values)
+        safe = np.where(present, values, 0.0)
+        # Dense per-team slot for every row, then bincount sums per (team, home/away).
+        slot = np.searchsorted(self.team_ids, self.team) * 2 + (~self.team_is_home)
+        size = len(self.team_ids) * 2
+        sums = np.bincount(slot, weights=safe, minlength=size)
+        counts = np.bincount(slot, weights=present, minlength=size)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = (sums / counts).reshape(-1, 2)
+        return {self.team_names[team_id]: (home, away) for team_id, (home, away) in zip(self.team_ids, means)}
+
+    def league_percentiles(self, stat, percentiles=(10, 25, 50, 75, 90)):
+        """Returns {league name: array of percentiles} of a stat across all team performances."""
+        values = self.team_stats[stat]
+        order = np.argsort(self.team_league, kind="stable")
+        leagues = self.team_league[order]
+        values = values[order]
+        starts = np.flatnonzero(np.r_[True, leagues[1:] != leagues[:-1]]) if len(leagues) else []
+        ends = np.r_[starts[1:], len(leagues)] if len(leagues) else []
+        result = {}
+        for start, end in zip(starts, ends):
+            block = values[start:end]
+            if np.isnan(block).all():
+                continue
+            result[self.league_names[leagues[start]]] = np.nanpercentile(block, percentiles)
+        return result
+
+    def league_table(self, league_id):
+        """Returns a standings list of (team, played, won, drawn, lost, goals for, goals against, points).
+
+        Only matches with a stored full-time score count.
+        """
+        scored = (self.league_ids == league_id) & ~np.isnan(self.home_goals) & ~np.isnan(self.away_goals)
+        home = self.home_team_ids[scored]
+        away = self.away_team_ids[scored]
+        home_goals = self.home_goals[scored]
+        away_goals = self.away_goals[scored]
+        if not len(home):
+            return []
+
+        teams, inverse = np.unique(np.concatenate([home, away]), return_inverse=True)
+        home_slot, away_slot = inverse[:len(home)], inverse[len(home):]
+        size = len(teams)
+
+        def per_team(home_weights, away_weights):
+            return (np.bincount(home_slot, weights=home_weights, minlength=size)
+                    + np.bincount(away_slot, weights=away_weights, minlength=size))
+
+        home_win = (home_goals > away_goals).astype(float)
+        away_win = (away_goals > home_goals).astype(float)
+        draw = (home_goals == away_goals).astype(float)
+        played = per_team(np.ones(len(home)), np.ones(len(home)))
+        won = per_team(home_win, away_win)
+        drawn = per_team(draw, draw)
+        goals_for = per_team(home_goals, away_goals)
+        goals_against = per_team(away_goals, home_goals)
+        points = won * 3 + drawn
+
+        order = np.lexsort((-goals_for, -(goals_for - goals_against), -points))
+        return [
+            (self.team_names[teams[i]], int(played[i]), int(won[i]), int(drawn[i]),
+             int(played[i] - won[i] - drawn[i]), int(goals_for[i]), int(goals_against[i]), int(points[i]))
+            for i in order
+        ]
+
+def _name_lookup(rows):
+    """Builds an array indexed by ID holding the names, for integer-indexed joins."""
+    size = max((row[0] for row in rows), default=0) + 1
+    names = np.empty(size + 1, dtype=object)
+    names[:] = None
+    for row_id, name in rows:
+        names[row_id] = name
+    # Index -1 (missing league) maps to the extra last slot.
+    names[-1] = None
+    return names
+
+def _fetch_postgres(stats, start_date, end_date, league_ids):
+    """Returns (rows as a float64 array, teams, leagues), streaming the rows out with COPY."""
+    typed = typed_storage()
+    columns = [
+        "match_id", "(date - DATE '1970-01-01')", "COALESCE(league_id, -1)",
+        "COALESCE(home_team_id, -1)", "COALESCE(away_team_id, -1)",
+        "COALESCE(home_normaltime::float8, 'NaN')", "COALESCE(away_normaltime::float8, 'NaN')",
+    ]
+    for name in stats:
+        for side in SIDES:
+            columns.append(numeric_sql(stat_column(name, side), typed, missing="'NaN'"))
+
+    conditions = []
+    params = []
+    if start_date is not None:
+        conditions.append("date >= %s")
+        params.append(start_date)
+    if end_date is not None:
+        conditions.append("date <= %s")
+        params.append(end_date)
+    if league_ids:
+        conditions.append("league_id = ANY(%s)")
+        params.append(list(league_ids))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    buffer = io.StringIO()
+    with transaction() as cursor:
+        query = cursor.mogrify(f"SELECT {', '.join(columns)} FROM match_statistics {where}", params).decode()
+        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", buffer)
+        cursor.execute("SELECT team_id, team_name FROM teams")
+        teams = cursor.fetchall()
+        cursor.execute("SELECT league_id, league_name FROM leagues")
+        leagues = cursor.fetchall()
+    buffer.seek(0)
+
+    data = np.loadtxt(buffer, delimiter=",", dtype=np.float64, ndmin=2)
+    if data.size == 0:
+        data = np.empty((0, len(columns)))
+    return data, teams, leagues
+
+def _fetch_sqlite(stats, start_date, end_date, league_ids):
+    """Returns (rows as a float64 array, teams, leagues) from the embedded store; NULLs become NaN."""
+    columns = [
+        "match_id", "julianday(date) - 2440587.5", "COALESCE(league_id, -1)",
+        "COALESCE(home_team_id, -1)", "COALESCE(away_team_id, -1)", "home_normaltime", "away_normaltime",
+    ]
+    columns += [stat_column(name, side) for name in stats for side in SIDES]
+
+    conditions = []
+    params = []
+    if start_date is not None:
+        conditions.append("date >= ?")
+        params.append(str(start_date))
+    if end_date is not None:
+        conditions.append("date <= ?")
+        params.append(str(end_date))
+    if league_ids:
+        conditions.append(f"league_id IN ({', '.join('?' * len(league_ids))})")
+        params.extend(league_ids)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    conn = get_backend().connection()
+    rows = conn.execute(f"SELECT {', '.join(columns)} FROM match_statistics {where}", params).fetchall()
+    teams = conn.execute("SELECT team_id, team_name FROM teams").fetchall()
+    leagues = conn.execute("SELECT league_id, league_name FROM leagues").fetchall()
+    data = np.array(rows, dtype=np.float64).reshape(len(rows), len(columns))
+    return data, teams, leagues
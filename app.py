@@ -1,6 +1,10 @@
 import re
-from db_operations import insert_match
-from match_statistics import fetch_match_statistics
+import argparse
+from batch_ingest import ingest_file
+from db_operations import insert_match, migrate_to_typed_storage, rebuild_team_aggregates
+from job_queue import enqueue, process_queue
+import metrics
+from match_statistics import FetchError, fetch_match
 
 # Function to extract match ID from SofaScore URL
 def extract_match_id(url):
@@ -11,7 +15,36 @@ def extract_match_id(url):
         print("Invalid URL format. Couldn't extract match ID.")
         return None
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingest SofaScore match statistics.")
+    parser.add_argument("--batch", metavar="FILE",
+                        help="file of match URLs/IDs to ingest concurrently ('-' for stdin)")
+    parser.add_argument("--workers", type=int, default=8,
+                        help="number of concurrent fetch workers in batch mode (default: 8)")
+    parser.add_argument("--queue", metavar="NAME",
+                        help="track matches in this persistent job queue; rerun with it to resume after a crash")
+    parser.add_argument("--migrate-typed-storage", action="store_true",
+                        help="convert match_statistics' text stat columns to numeric columns and exit")
+    parser.add_argument("--rebuild-team-aggregates", action="store_true",
+                        help="recompute the team season aggregates from match_statistics and exit")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+    metrics.start_from_env()
+    if args.migrate_typed_storage:
+        migrate_to_typed_storage()
+        raise SystemExit(0)
+    if args.rebuild_team_aggregates:
+        rebuild_team_aggregates()
+        raise SystemExit(0)
+    if args.batch:
+        ingest_file(args.batch, workers=args.workers, job_queue=args.queue)
+        raise SystemExit(0)
+    if args.queue:
+        # Finish whatever an earlier run of this queue left behind first.
+        process_queue(args.queue, workers=args.workers)
+
     while True:
         match_urls = input("Enter SofaScore match URLs (comma separated) or 'q' to quit: ").strip()
 
@@ -28,11 +61,19 @@ if __name__ == "__main__":
             print("No valid match IDs found. Please try again.")
             continue
 
+        if args.queue:
+            # Matches typed in again are fetched again, even if they were done before.
+            enqueue(match_ids, args.queue, reset=True)
+            process_queue(args.queue, workers=args.workers)
+            print("Processing complete. You can add more match IDs or type 'q' to quit.")
+            continue
+
         for match_id in match_ids:
             # Fetch match details and statistics using the provided match ID
-            match_details = fetch_match_statistics(match_id)
-            if not match_details:
-                print(f"Could not fetch details for match ID {match_id}. Skipping.")
+            try:
+                match_details = fetch_match(match_id)
+            except FetchError as e:
+                print(f"Could not fetch details for match ID {match_id} ({e.reason}). Skipping.")
                 continue
 
             match_date = match_details.get('date')
@@ -40,8 +81,10 @@ if __name__ == "__main__":
             away_team = match_details.get('away_team')
             league = match_details.get('league')
             statistics = match_details.get('statistics')
+            scores = match_details.get('scores')
+            periods = match_details.get('periods')
 
             # Insert the match into the database
-            insert_match(match_id, match_date, home_team, away_team, league, statistics)
+            insert_match(match_id, match_date, home_team, away_team, league, statistics, scores, periods)
 
         print("Processing complete. You can add more match IDs or type 'q' to quit.")
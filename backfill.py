@@ -0,0 +1,212 @@
+import os
+import sys
+import time
+import argparse
+import threading
+import subprocess
+from datetime import date
+from dotenv import load_dotenv
+import metrics
+from crawler import discover_by_dates, discover_by_season, missing_match_ids
+from batch_ingest import read_match_ids
+from db_connection import transaction
+from job_queue import (DEFAULT_QUEUE, enqueue, ensure_job_table, process_queue, queue_stats, recover,
+                       renew_leases, worker_name)
+from sofascore_client import shared_rate_limiter
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Requests per second for the whole backfill, shared out between the live workers on every host.
+BACKFILL_RATE_LIMIT = float(os.getenv("BACKFILL_RATE_LIMIT", os.getenv("SOFASCORE_RATE_LIMIT", "5")))
+BACKFILL_BURST = int(os.getenv("BACKFILL_BURST", os.getenv("SOFASCORE_BURST", "10")))
+# Seconds between worker heartbeats; a worker silent for three of them no longer counts as live.
+BACKFILL_HEARTBEAT = float(os.getenv("BACKFILL_HEARTBEAT", "5"))
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+def ensure_worker_table():
+    """Creates the backfill_workers table the workers heartbeat into."""
+    global _table_ready
+    if _table_ready:
+        return
+    ensure_job_table()
+    with _table_lock:
+        if _table_ready:
+            return
+        with transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS backfill_workers (
+                    queue text NOT NULL,
+                    worker text NOT NULL,
+                    started_at timestamptz NOT NULL DEFAULT now(),
+                    heartbeat_at timestamptz NOT NULL DEFAULT now(),
+                    PRIMARY KEY (queue, worker)
+                )
+            """)
+        _table_ready = True
+
+def heartbeat(queue, worker=None):
+    """Records that a worker is alive and returns the number of live workers on the queue."""
+    ensure_worker_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO backfill_workers (queue, worker) VALUES (%s, %s)
+            ON CONFLICT (queue, worker) DO UPDATE SET heartbeat_at = now()
+        """, (queue, worker or worker_name()))
+        cursor.execute("""
+            SELECT count(*) FROM backfill_workers
+            WHERE queue = %s AND heartbeat_at > now() - make_interval(secs => %s)
+        """, (queue, 3 * BACKFILL_HEARTBEAT))
+        return cursor.fetchone()[0]
+
+def leave(queue, worker=None):
+    """Removes a worker from the live set so the others take over its share of the rate limit."""
+    ensure_worker_table()
+    with transaction() as cursor:
+        cursor.execute("DELETE FROM backfill_workers WHERE queue = %s AND worker = %s",
+                       (queue, worker or worker_name()))
+
+def live_workers(queue):
+    """Returns the names of the workers that heartbeated recently."""
+    ensure_worker_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT worker FROM backfill_workers
+            WHERE queue = %s AND heartbeat_at > now() - make_interval(secs => %s) ORDER BY worker
+        """, (queue, 3 * BACKFILL_HEARTBEAT))
+        return [row[0] for row in cursor.fetchall()]
+
+def _keep_alive(queue, worker, stop):
+    """Heartbeats, renews this worker's leases and resizes its share of the rate limit until stopped."""
+    share = None
+    while True:
+        try:
+            live = max(1, heartbeat(queue, worker))
+            renew_leases(queue, worker)
+            if live != share:
+                share = live
+                shared_rate_limiter.set_rate(BACKFILL_RATE_LIMIT / live, max(1, BACKFILL_BURST // live))
+                print(f"{worker}: {live} live workers, fetching at {BACKFILL_RATE_LIMIT / live:.2f} requests/s.")
+        except Exception as e:
+            print(f"{worker}: heartbeat failed ({e}).")
+        if stop.wait(BACKFILL_HEARTBEAT):
+            return
+
+def work(queue=DEFAULT_QUEUE, threads=8, claim_size=50):
+    """Runs one backfill worker: claims shards of the queue until nothing is left to retry.
+
+    Any number of these can run on any number of hosts against the same database. Claims use
+    SKIP LOCKED, so no match is fetched by two workers; each claim is one shard.
+    """
+    worker = worker_name()
+    stop = threading.Event()
+    keep_alive = threading.Thread(target=_keep_alive, args=(queue, worker, stop), daemon=True)
+    keep_alive.start()
+    try:
+        return process_queue(queue, workers=threads, claim_size=claim_size, wait=True)
+    finally:
+        stop.set()
+        keep_alive.join()
+        leave(queue, worker)
+
+def plan(queue=DEFAULT_QUEUE, match_ids=(), tournament_id=None, season_ids=(), start=None, end=None):
+    """Queues the given matches plus those discovered by season or date, skipping ones already stored."""
+    discovered = {match_id: 0 for match_id in match_ids}
+    for season_id in season_ids:
+        discovered.update(discover_by_season(tournament_id, season_id))
+    if start is not None:
+        discovered.update(discover_by_dates(start, end or date.today(), tournament_id))
+    new_ids = missing_match_ids(sorted(discovered))
+    added = enqueue(new_ids, queue)
+    print(f"Queued {added} of {len(discovered)} matches in {queue} "
+          f"({len(discovered) - len(new_ids)} already stored).")
+    return added
+
+def progress(queue, previous=None):
+    """Returns (line, snapshot) describing the queue; with the previous snapshot it includes the rate."""
+    stats = queue_stats(queue)
+    now = time.monotonic()
+    total = sum(stats[state] for state in ("pending", "running", "done", "dead"))
+    finished = stats["done"] + stats["dead"]
+    line = (f"{queue}: {stats['done']}/{total} done ({100.0 * finished / total if total else 100.0:.1f}% finished), "
+            f"{stats['running']} running, {stats['pending']} pending, {stats['dead']} dead, "
+            f"{len(live_workers(queue))} workers")
+    if previous is not None and now > previous[0]:
+        rate = (stats["done"] - previous[1]) / (now - previous[0])
+        remaining = stats["pending"] + stats["running"]
+        line += f", {rate:.1f} matches/s"
+        if rate > 0:
+            line += f", ~{remaining / rate:.0f}s left"
+    return line, (now, stats["done"], stats)
+
+def run(queue=DEFAULT_QUEUE, processes=4, threads=8, claim_size=50, interval=5.0, verbose=False):
+    """Starts worker processes on this host and prints aggregate progress until they finish.
+
+    Workers started on other hosts with `backfill.py work` join in and show up in the progress.
+    """
+    recover(queue)
+    command = [sys.executable, os.path.abspath(__file__), "work", "--queue", queue,
+               "--threads", str(threads), "--claim-size", str(claim_size)]
+    output = None if verbose else subprocess.DEVNULL
+    # The coordinator serves the metrics; workers on one host would fight over the port.
+    env = dict(os.environ, METRICS_PORT="", METRICS_DUMP_PATH="")
+    children = [subprocess.Popen(command, stdout=output, env=env) for _ in range(processes)]
+    print(f"Started {processes} workers on queue {queue}.")
+    snapshot = None
+    metrics.register_collector("backfill", lambda: {
+        state: count for state, count in (snapshot[2] if snapshot else {}).items() if count is not None})
+    try:
+        while any(child.poll() is None for child in children):
+            time.sleep(interval)
+            line, snapshot = progress(queue, snapshot)
+            print(line)
+    except KeyboardInterrupt:
+        for child in children:
+            child.terminate()
+    for child in children:
+        child.wait()
+    failed = [child.returncode for child in children if child.returncode]
+    if failed:
+        print(f"{len(failed)} workers exited with an error (exit codes {failed}).")
+    print(progress(queue)[0])
+    return queue_stats(queue)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill matches with worker processes coordinated through the database.")
+    parser.add_argument("command", choices=["plan", "run", "work", "status"],
+                        help="plan: queue matches; run: start local workers and follow progress; "
+                             "work: run one worker (e.g. on another host); status: print progress")
+    parser.add_argument("--queue", default="backfill", help="job queue name (default: backfill)")
+    parser.add_argument("--file", help="with plan, a file of match URLs/IDs ('-' for stdin)")
+    parser.add_argument("--tournament", type=int, help="with plan, SofaScore unique tournament ID")
+    parser.add_argument("--season", type=int, action="append", default=[],
+                        help="with plan, SofaScore season ID of --tournament (repeatable)")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat, help="with plan, first date to scan")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="with plan, last date to scan")
+    parser.add_argument("--processes", type=int, default=4, help="worker processes for run (default: 4)")
+    parser.add_argument("--threads", type=int, default=8, help="fetch threads per worker (default: 8)")
+    parser.add_argument("--claim-size", type=int, default=50, help="matches per claimed shard (default: 50)")
+    parser.add_argument("--verbose", action="store_true", help="with run, show the workers' own output")
+    args = parser.parse_args()
+    if args.season and args.tournament is None:
+        parser.error("--season requires --tournament")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "plan":
+        match_ids = []
+        if args.file:
+            with (sys.stdin if args.file == "-" else open(args.file)) as f:
+                match_ids = read_match_ids(f)
+        plan(args.queue, match_ids, args.tournament, args.season, args.start, args.end)
+    elif args.command == "run":
+        metrics.start_from_env()
+        run(args.queue, args.processes, args.threads, args.claim_size, verbose=args.verbose)
+    elif args.command == "work":
+        metrics.start_from_env()
+        work(args.queue, args.threads, args.claim_size)
+    else:
+        print(progress(args.queue)[0])
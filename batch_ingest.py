@@ -0,0 +1,208 @@
+import re
+import sys
+import time
+import queue
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db_operations import insert_match, insert_matches
+from job_queue import enqueue, fail_job, process_queue
+import metrics
+from match_statistics import FetchError, fetch_match
+from sofascore_client import get_client
+
+# Sentinel telling the writer stage that no more matches are coming.
+_DONE = object()
+
+def parse_match_id(token):
+    """Extracts a match ID from a SofaScore URL or a bare numeric ID."""
+    token = token.strip()
+    if token.isdigit():
+        return int(token)
+    match = re.search(r'id:(\d+)', token)
+    if match:
+        return int(match.group(1))
+    return None
+
+def read_match_ids(lines):
+    """Reads match IDs from lines of URLs/IDs (comma or newline separated), dropping duplicates."""
+    match_ids = []
+    seen = set()
+    for line in lines:
+        for token in line.split(','):
+            if not token.strip():
+                continue
+            match_id = parse_match_id(token)
+            if match_id is None:
+                print(f"Invalid URL or ID '{token.strip()}'. Skipping.")
+                continue
+            if match_id not in seen:
+                seen.add(match_id)
+                match_ids.append(match_id)
+    return match_ids
+
+class StageStats:
+    """Counts successes and failures for one pipeline stage and times it."""
+
+    def __init__(self, name):
+        self.name = name
+        self.ok = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, ok, seconds):
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter() - seconds
+            self.finished = time.perf_counter()
+            self.busy_seconds += seconds
+            if ok:
+                self.ok += 1
+            else:
+                self.failed += 1
+
+    def report(self):
+        elapsed = (self.finished - self.started) if self.started is not None else 0.0
+        rate = self.ok / elapsed if elapsed > 0 else 0.0
+        return (f"{self.name}: {self.ok} ok, {self.failed} failed in {elapsed:.2f}s "
+                f"({rate:.1f} matches/s, {self.busy_seconds:.2f}s busy)")
+
+def _fetch(match_id):
+    """Fetch stage: returns (match_id, details or None, failure reason or None, start, seconds)."""
+    start = time.perf_counter()
+    try:
+        details, reason = fetch_match(match_id), None
+    except FetchError as e:
+        print(f"Error fetching match {match_id}: {e}")
+        details, reason = None, e.reason
+    return match_id, details, reason, start, time.perf_counter() - start
+
+def _write_one(match_id, details, job_queue=None):
+    """Writes a single match, returning True on success."""
+    return insert_match(match_id, details.get('date'), details.get('home_team'),
+                        details.get('away_team'), details.get('league'), details.get('statistics'),
+                        details.get('scores'), details.get('periods'), job_queue=job_queue) is not None
+
+def _writer(write_queue, write_stats, batch_size, failures, latencies, job_queue=None):
+    """Writer stage: drains fetched matches into the database in bulk batches.
+
+    Matches that couldn't be written are added to failures as db_error; written ones add
+    the seconds from the start of their fetch to latencies.
+    """
+    done = False
+    while not done:
+        # Block for the first item, then take whatever else is already waiting.
+        batch = []
+        item = write_queue.get()
+        while True:
+            if item is _DONE:
+                done = True
+                break
+            batch.append(item)
+            if len(batch) >= batch_size:
+                break
+            try:
+                item = write_queue.get_nowait()
+            except queue.Empty:
+                break
+        if not batch:
+            continue
+
+        start = time.perf_counter()
+        try:
+            insert_matches([
+                (match_id, details.get('date'), details.get('home_team'), details.get('away_team'),
+                 details.get('league'), details.get('statistics'), details.get('scores'), details.get('periods'))
+                for match_id, details, _ in batch
+            ], job_queue=job_queue)
+            written = time.perf_counter()
+            per_match = (written - start) / len(batch)
+            for _, _, fetch_start in batch:
+                write_stats.record(True, per_match)
+                latencies.append(written - fetch_start)
+        except Exception as e:
+            # Retry the matches one by one so a single bad row doesn't lose the whole batch.
+            metrics.inc("bulk_write_fallbacks_total")
+            print(f"Bulk write of {len(batch)} matches failed ({e}); retrying one at a time.")
+            for match_id, details, fetch_start in batch:
+                one_start = time.perf_counter()
+                ok = _write_one(match_id, details, job_queue)
+                written = time.perf_counter()
+                write_stats.record(ok, written - one_start)
+                if ok:
+                    latencies.append(written - fetch_start)
+                else:
+                    failures[match_id] = "db_error"
+
+def ingest_batch(match_ids, workers=8, queue_size=100, write_batch_size=200, job_queue=None):
+    """Fetches matches through a bounded worker pool while a separate writer stage stores them.
+
+    With job_queue, the matches are claimed jobs of that queue: writes check their jobs off
+    and failures are recorded for retry. The result's "failed" lists the matches that
+    couldn't be fetched or written and "failures" maps them to the fetch failure reason,
+    or db_error for a failed write. "latencies" holds, for every written match, the seconds
+    from the start of its fetch until its write committed.
+    """
+    fetch_stats = StageStats("fetch")
+    write_stats = StageStats("write")
+    failures = {}
+    latencies = []
+    failure_reasons = Counter()
+
+    # A bounded queue applies back-pressure on the fetchers if the database falls behind.
+    write_queue = queue.Queue(maxsize=queue_size)
+    writer = threading.Thread(target=_writer, args=(write_queue, write_stats, write_batch_size, failures,
+                                                     latencies, job_queue), daemon=True)
+    writer.start()
+
+    batch_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_fetch, match_id) for match_id in match_ids]
+        for future in as_completed(futures):
+            match_id, details, reason, fetch_start, seconds = future.result()
+            fetch_stats.record(bool(details), seconds)
+            if not details:
+                print(f"Could not fetch details for match ID {match_id} ({reason}). Skipping.")
+                failures[match_id] = reason
+                failure_reasons[reason] += 1
+                if job_queue:
+                    fail_job(job_queue, match_id, reason)
+                continue
+            write_queue.put((match_id, details, fetch_start))
+
+    write_queue.put(_DONE)
+    writer.join()
+    total = time.perf_counter() - batch_start
+
+    print(fetch_stats.report())
+    print(write_stats.report())
+    print(f"batch: {len(match_ids)} matches in {total:.2f}s "
+          f"({len(match_ids) / total if total > 0 else 0.0:.1f} matches/s overall)")
+    if failure_reasons:
+        print(f"fetch failures: {dict(failure_reasons)}")
+    print(f"http: {get_client().get_stats()}")
+    return {"fetch": fetch_stats, "write": write_stats, "failed": list(failures), "failures": failures,
+            "latencies": latencies, "failure_reasons": dict(failure_reasons), "seconds": total}
+
+def ingest_file(path, workers=8, job_queue=None):
+    """Runs a batch ingestion from a file of URLs/IDs, or stdin when path is '-'.
+
+    With job_queue the IDs are added to that persistent queue first and the queue is
+    processed, so rerunning after a crash picks up where the last run stopped.
+    """
+    if path == '-':
+        match_ids = read_match_ids(sys.stdin)
+    else:
+        with open(path) as f:
+            match_ids = read_match_ids(f)
+
+    if not match_ids:
+        print("No valid match IDs found.")
+        return None
+    if job_queue:
+        print(f"Queued {enqueue(match_ids, job_queue)} new of {len(match_ids)} matches in queue {job_queue}.")
+        return process_queue(job_queue, workers=workers)
+    return ingest_batch(match_ids, workers=workers)
@@ -0,0 +1,26 @@
+import io
+import os
+import psycopg2
+from pg_dump import read_dump
+
+DEFAULT_DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backup.sql")
+
+def seed_database(conn, path):
+    """Loads a pg_dump file into the database of a (fresh) connection and commits.
+
+    Like psql, a statement that fails (e.g. CREATE EXTENSION for an extension the server
+    doesn't have) is reported and skipped.
+    """
+    with conn.cursor() as cursor:
+        for part in read_dump(path):
+            if part[0] == "sql":
+                cursor.execute("SAVEPOINT seed_statement")
+                try:
+                    cursor.execute(part[1])
+                except psycopg2.Error as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT seed_statement")
+                    print(f"Skipped statement from {path}: {str(e).splitlines()[0]}")
+            else:
+                _, table, columns, data = part
+                cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", io.StringIO(data))
+    conn.commit()
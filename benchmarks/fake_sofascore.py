@@ -0,0 +1,258 @@
+import os
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.dump import DEFAULT_DUMP
+from pg_dump import copy_rows
+from stat_columns import FRACTION_STATS, SCORE_PERIODS, STAT_NAMES, SIDES, score_key, stat_column
+
+# SofaScore splits the statistics of a period into these groups; stats are spread over them in order.
+GROUP_NAMES = ["Match overview", "Shots", "Attack", "Passes", "Duels", "Defending", "Goalkeeping"]
+
+# Matches kick off at this hour (UTC) on their date.
+KICKOFF_HOUR = 15
+
+def _number(text):
+    """Returns the number in a stored stat value ('72%', '1.34', '15'), or None."""
+    try:
+        return float(text.rstrip('%'))
+    except (AttributeError, ValueError):
+        return None
+
+def _display_value(name, value, match_id):
+    """Rebuilds the display string SofaScore would send for a value stored in backup.sql.
+
+    The dump only kept the percentage of fraction stats, so a plausible attempt count is
+    made up around it: '47%' becomes e.g. '8/17 (47%)'.
+    """
+    if name in FRACTION_STATS and value.endswith('%'):
+        attempted = 10 + match_id % 17
+        made = round(_number(value) * attempted / 100)
+        return f"{made}/{attempted} ({value})"
+    return value
+
+def _half(value, first):
+    """Splits a full-match display value into a plausible half: counts are halved, the rest kept."""
+    number = _number(value)
+    if value.endswith('%') or '/' in value or number is None:
+        return value
+    if '.' in value:
+        part = round(number / 2, 2)
+        return f"{part if first else round(number - part, 2):.2f}"
+    part = int(number) // 2
+    return str(part if first else int(number) - part)
+
+def _statistics_payload(row, match_id):
+    """Builds an /event/{id}/statistics payload with ALL, 1ST and 2ND periods from a dump row."""
+    items = []
+    for name in STAT_NAMES:
+        values = [row.get(stat_column(name, side)) for side in SIDES]
+        if any(value in (None, 'N/A') for value in values):
+            # SofaScore leaves out statistics it doesn't have for a match.
+            continue
+        items.append((name, [_display_value(name, value, match_id) for value in values]))
+
+    periods = []
+    for period in ("ALL", "1ST", "2ND"):
+        period_items = []
+        for name, (home, away) in items:
+            if period != "ALL":
+                home, away = _half(home, period == "1ST"), _half(away, period == "1ST")
+            home_value, away_value = _number(home.split('/')[0]), _number(away.split('/')[0])
+            period_items.append({
+                "name": name[0].upper() + name[1:],
+                "home": home,
+                "away": away,
+                "homeValue": home_value,
+                "awayValue": away_value,
+                "compareCode": 1 if (home_value or 0) >= (away_value or 0) else 2,
+                "statisticsType": "positive",
+                "valueType": "event",
+            })
+        size = max(1, -(-len(period_items) // len(GROUP_NAMES)))
+        groups = [
+            {"groupName": group_name, "statisticsItems": period_items[i * size:(i + 1) * size]}
+            for i, group_name in enumerate(GROUP_NAMES) if period_items[i * size:(i + 1) * size]
+        ]
+        periods.append({"period": period, "groups": groups})
+    return {"statistics": periods}
+
+def _event_payload(row, match_id, teams, leagues):
+    """Builds a finished /event/{id} payload from a dump row."""
+    day = datetime.strptime(row["date"], "%Y-%m-%d").replace(hour=KICKOFF_HOUR, tzinfo=timezone.utc)
+    league_id = int(row["league_id"]) if row.get("league_id") else None
+    league = leagues.get(league_id, "Unknown League")
+    event = {
+        "id": match_id,
+        "startTimestamp": int(day.timestamp()),
+        "status": {"code": 100, "description": "Ended", "type": "finished"},
+        "tournament": {"name": league, "uniqueTournament": {"id": league_id, "name": league}},
+        "homeTeam": {"id": int(row["home_team_id"]), "name": teams[int(row["home_team_id"])]},
+        "awayTeam": {"id": int(row["away_team_id"]), "name": teams[int(row["away_team_id"])]},
+    }
+    for side in SIDES:
+        score = {period: int(row[score_key(side, period)]) for period in SCORE_PERIODS
+                 if row.get(score_key(side, period)) is not None}
+        if "normaltime" in score:
+            score["current"] = score["display"] = score["normaltime"]
+        event[f"{side}Score"] = score
+    return {"event": event}
+
+def synthesize_payloads(dump_path=DEFAULT_DUMP, limit=None):
+    """Builds {API path: JSON body} for every match in a pg_dump of the database.
+
+    Serves /event/{id}, /event/{id}/statistics and the scheduled-events listing of each date.
+    """
+    teams = {int(row["team_id"]): row["team_name"] for row in copy_rows(dump_path, "teams")}
+    leagues = {int(row["league_id"]): row["league_name"] for row in copy_rows(dump_path, "leagues")}
+    payloads = {}
+    schedule = {}
+    for row in copy_rows(dump_path, "match_statistics")[:limit]:
+        match_id = int(row["match_id"])
+        event = _event_payload(row, match_id, teams, leagues)
+        payloads[f"event/{match_id}"] = event
+        payloads[f"event/{match_id}/statistics"] = _statistics_payload(row, match_id)
+        schedule.setdefault(row["date"], []).append(event["event"])
+    for day, events in schedule.items():
+        payloads[f"sport/football/scheduled-events/{day}"] = {"events": events}
+    return payloads
+
+def load_recorded(directory):
+    """Loads recorded payloads saved as <directory>/<API path>.json."""
+    payloads = {}
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if name.endswith(".json"):
+                path = os.path.join(root, name)
+                with open(path) as f:
+                    payloads[os.path.relpath(path, directory)[:-len(".json")]] = json.load(f)
+    return payloads
+
+def save_payloads(payloads, directory):
+    """Writes payloads in the layout load_recorded reads."""
+    for api_path, payload in payloads.items():
+        path = os.path.join(directory, api_path + ".json")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(payload, f)
+
+class FakeSofaScore:
+    """Local stand-in for the SofaScore API serving canned payloads, with injected latency and errors.
+
+    Each request waits latency +/- jitter seconds; error_rate of them get a 500 and
+    throttle_rate a 429 with Retry-After: 0.
+    """
+
+    def __init__(self, payloads, host="127.0.0.1", port=0, latency=0.0, jitter=0.0,
+                 error_rate=0.0, throttle_rate=0.0, seed=None):
+        # Serialized once up front so serving costs the same as replaying a recording.
+        self.bodies = {path: json.dumps(payload).encode() for path, payload in payloads.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.random = random.Random(seed)
+        self.counters = {"requests": 0, "served": 0, "not_found": 0, "errors": 0, "throttled": 0}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; with Nagle on, keep-alive
+            # clients would wait for a delayed ACK on every response.
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                status, body, headers = fake.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def respond(self, path):
+        """Returns (status, body, headers) for a request path, applying latency and error injection."""
+        with self._lock:
+            self.counters["requests"] += 1
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            roll = self.random.random()
+        if delay:
+            time.sleep(delay)
+
+        if roll < self.error_rate:
+            self._count("errors")
+            return 500, b'{"error": {"code": 500}}', {}
+        if roll < self.error_rate + self.throttle_rate:
+            self._count("throttled")
+            return 429, b'{"error": {"code": 429}}', {"Retry-After": "0"}
+
+        api_path = path.split("?")[0].strip("/")
+        if api_path.startswith("api/v1/"):
+            api_path = api_path[len("api/v1/"):]
+        body = self.bodies.get(api_path)
+        if body is None:
+            self._count("not_found")
+            return 404, b'{"error": {"code": 404, "reason": "Not Found"}}', {}
+        self._count("served")
+        return 200, body, {}
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def start(self):
+        """Serves requests on a background thread; returns the API base URL."""
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve SofaScore-shaped payloads locally.")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (default: 8765)")
+    parser.add_argument("--dump", default=DEFAULT_DUMP, help="pg_dump to synthesize payloads from")
+    parser.add_argument("--payloads", help="directory of recorded payloads to serve instead")
+    parser.add_argument("--record", metavar="DIR", help="write the payloads to DIR and exit")
+    parser.add_argument("--latency-ms", type=float, default=0, help="added latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random +/- variation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    payloads = load_recorded(args.payloads) if args.payloads else synthesize_payloads(args.dump)
+    if args.record:
+        save_payloads(payloads, args.record)
+        raise SystemExit(f"Wrote {len(payloads)} payloads to {args.record}.")
+    fake = FakeSofaScore(payloads, port=args.port, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                         error_rate=args.error_rate, throttle_rate=args.throttle_rate)
+    print(f"Serving {len(payloads)} payloads at {fake.base_url} (set SOFASCORE_BASE_URL to it).")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        fake.stop()
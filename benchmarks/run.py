@@ -0,0 +1,365 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+import psycopg2
+from psycopg2 import sql
+from benchmarks.dump import DEFAULT_DUMP, seed_database
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+# End-to-end scenarios write to the database; the others time the parsing code on its own.
+END_TO_END = ["app", "batch"]
+ISOLATED = ["extract_statistics", "clean_stat_value_text", "clean_stat_value_typed"]
+
+# Metrics compared between runs, and whether a higher value is better.
+COMPARED_METRICS = {"matches_per_sec": True, "p50_ms": False, "p99_ms": False,
+                    "db_round_trips_per_match": False, "peak_rss_mb": False}
+# How far db_round_trips_per_match may rise over the baseline before --compare fails the run;
+# pool health checks make it vary slightly between runs.
+ROUND_TRIP_TOLERANCE = 0.02
+
+def percentile(values, q):
+    """Returns the q-th percentile of a list of numbers (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def peak_rss_mb():
+    """Returns this process's peak resident set size in MB.
+
+    VmHWM starts over at exec, unlike ru_maxrss, which a spawned process inherits from its parent.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux.
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def summarize(matches, seconds, latencies=None, round_trips=None, failed=0, **extra):
+    """Builds a scenario's result record; latencies are per match, in seconds.
+
+    round_trips None (scenarios not touching the database, or the SQLite backend, which runs
+    in-process) leaves db_round_trips_per_match out.
+    """
+    result = {
+        "matches": matches,
+        "failed": failed,
+        "seconds": round(seconds, 4),
+        "matches_per_sec": round(matches / seconds, 2) if seconds > 0 else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4) if latencies else None,
+        "db_round_trips_per_match": round(round_trips / matches, 2) if matches and round_trips is not None else None,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if round_trips is None:
+        del result["db_round_trips_per_match"]
+    result.update(extra)
+    return result
+
+def _round_trips():
+    """Returns the statements sent to PostgreSQL so far, or None on the SQLite backend."""
+    from db_connection import get_pool_stats
+    from storage import embedded
+    return None if embedded() else get_pool_stats()["round_trips"]
+
+def _round_trips_since(before):
+    return None if before is None else _round_trips() - before
+
+def _details_args(match_id, details):
+    return (match_id, details.get('date'), details.get('home_team'), details.get('away_team'),
+            details.get('league'), details.get('statistics'), details.get('scores'), details.get('periods'))
+
+def scenario_app(match_ids, payloads, options):
+    """The app.py path: fetch and insert_match one match after the other."""
+    from db_operations import insert_match
+    from match_statistics import fetch_match_statistics
+    from sofascore_client import get_client
+
+    latencies = []
+    failed = 0
+    round_trips = _round_trips()
+    start = time.perf_counter()
+    for match_id in match_ids:
+        match_start = time.perf_counter()
+        details = fetch_match_statistics(match_id)
+        if details:
+            insert_match(*_details_args(match_id, details))
+        else:
+            failed += 1
+        latencies.append(time.perf_counter() - match_start)
+    seconds = time.perf_counter() - start
+    return summarize(len(match_ids), seconds, latencies, _round_trips_since(round_trips), failed,
+                     http=get_client().get_stats())
+
+def scenario_batch(match_ids, payloads, options):
+    """The app.py --batch path: concurrent fetches feeding the bulk writer."""
+    from batch_ingest import ingest_batch
+    from sofascore_client import get_client
+
+    round_trips = _round_trips()
+    start = time.perf_counter()
+    result = ingest_batch(match_ids, workers=options["workers"])
+    seconds = time.perf_counter() - start
+    return summarize(len(match_ids), seconds, result["latencies"], _round_trips_since(round_trips),
+                     len(result["failed"]), http=get_client().get_stats())
+
+def scenario_extract_statistics(match_ids, payloads, options):
+    """extract_statistics alone over every statistics payload, options["repeat"] times."""
+    from match_statistics import extract_statistics
+
+    documents = [payloads[f"event/{match_id}/statistics"] for match_id in match_ids]
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(options["repeat"]):
+        for document in documents:
+            call_start = time.perf_counter()
+            extract_statistics(document)
+            latencies.append(time.perf_counter() - call_start)
+    return summarize(len(latencies), time.perf_counter() - start, latencies)
+
+def _clean_stat_values(match_ids, payloads):
+    from db_operations import clean_stat_value
+    from match_statistics import extract_statistics
+    from stat_columns import STAT_KINDS
+
+    matches = []
+    for match_id in match_ids:
+        statistics = extract_statistics(payloads[f"event/{match_id}/statistics"])
+        matches.append([(value, STAT_KINDS.get(key.rpartition('_')[0], "count")) for key, value in statistics.items()])
+    return clean_stat_value, matches
+
+def _scenario_clean(match_ids, payloads, options, typed):
+    clean_stat_value, matches = _clean_stat_values(match_ids, payloads)
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(options["repeat"]):
+        for values in matches:
+            match_start = time.perf_counter()
+            for value, kind in values:
+                clean_stat_value(value, kind, typed)
+            latencies.append(time.perf_counter() - match_start)
+    return summarize(len(latencies), time.perf_counter() - start, latencies)
+
+def scenario_clean_stat_value_text(match_ids, payloads, options):
+    """clean_stat_value alone over every value of a match, in text storage mode."""
+    return _scenario_clean(match_ids, payloads, options, typed=False)
+
+def scenario_clean_stat_value_typed(match_ids, payloads, options):
+    """clean_stat_value alone over every value of a match, in typed storage mode."""
+    return _scenario_clean(match_ids, payloads, options, typed=True)
+
+def _run_scenario(name, match_ids, options, results):
+    """Child process entry point: runs one scenario with its output silenced and reports the result."""
+    from benchmarks.fake_sofascore import load_recorded, synthesize_payloads
+
+    sys.stdout = open(os.devnull, "w")
+    payloads = None
+    if name in ISOLATED:
+        # End-to-end scenarios get their payloads over HTTP; don't count them in their RSS.
+        payloads = load_recorded(options["payloads"]) if options["payloads"] else synthesize_payloads(options["dump"])
+    results.put(globals()[f"scenario_{name}"](match_ids, payloads, options))
+
+def _admin_connection():
+    """Connects to the maintenance database of the server configured in .env."""
+    conn = psycopg2.connect(dbname="postgres", user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"),
+                            host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"))
+    conn.autocommit = True
+    return conn
+
+def create_database(name, dump):
+    """Creates a throwaway database and seeds it from a pg_dump file."""
+    admin = _admin_connection()
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+            cursor.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+    finally:
+        admin.close()
+    conn = psycopg2.connect(dbname=name, user=os.getenv("DB_USER"), password=os.getenv("DB_PASSWORD"),
+                            host=os.getenv("DB_HOST"), port=os.getenv("DB_PORT"))
+    try:
+        seed_database(conn, dump)
+    finally:
+        conn.close()
+
+def create_sqlite_database(path, dump):
+    """Creates a throwaway SQLite database file and imports a pg_dump file into it."""
+    from sqlite_storage import SQLiteStore
+    drop_sqlite_database(path)
+    store = SQLiteStore(path)
+    store.import_dump(dump)
+    return store
+
+def drop_sqlite_database(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+def drop_database(name):
+    admin = _admin_connection()
+    try:
+        with admin.cursor() as cursor:
+            cursor.execute(sql.SQL("DROP DATABASE IF EXISTS {} WITH (FORCE)").format(sql.Identifier(name)))
+    finally:
+        admin.close()
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(RESULTS_DIR), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current):
+    """Prints how each scenario's metrics moved against a baseline result file.
+
+    Returns the scenarios whose db_round_trips_per_match went up by more than ROUND_TRIP_TOLERANCE,
+    among those that ran over as many matches as in the baseline (the setup statements are spread
+    over all of them).
+    """
+    regressed = []
+    for name, result in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            old, new = before.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            changes.append(f"{metric} {old} -> {new} ({change:+.1f}%{' worse' if worse and abs(change) >= 5 else ''})")
+        print(f"{name}: " + "; ".join(changes))
+        old, new = before.get("db_round_trips_per_match"), result.get("db_round_trips_per_match")
+        if (old is not None and new is not None and before.get("matches") == result.get("matches")
+                and new > old * (1 + ROUND_TRIP_TOLERANCE)):
+            regressed.append(name)
+    return regressed
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion against a local SofaScore stand-in.")
+    parser.add_argument("--scenarios", nargs="+", choices=END_TO_END + ISOLATED, default=END_TO_END + ISOLATED)
+    parser.add_argument("--matches", type=int, help="number of matches to ingest (default: all in the dump)")
+    parser.add_argument("--workers", type=int, default=8, help="fetch workers for the batch scenario")
+    parser.add_argument("--repeat", type=int, default=20, help="passes over the matches in isolated scenarios")
+    parser.add_argument("--latency-ms", type=float, default=20, help="fake server latency per request")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="random +/- variation of the latency")
+    parser.add_argument("--error-rate", type=float, default=0, help="fraction of requests answered with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0, help="fraction of requests answered with 429")
+    parser.add_argument("--dump", default=DEFAULT_DUMP, help="pg_dump seeding the database and the payloads")
+    parser.add_argument("--payloads", help="directory of recorded payloads to serve instead of synthesized ones")
+    parser.add_argument("--storage", choices=["postgres", "sqlite"], default="postgres",
+                        help="storage backend to write to (sqlite uses a throwaway file)")
+    parser.add_argument("--typed", action="store_true", help="migrate the database to typed storage first")
+    parser.add_argument("--updates", action="store_true",
+                        help="re-ingest matches already in the database instead of inserting them fresh")
+    parser.add_argument("--keep-db", action="store_true", help="keep the throwaway database afterwards")
+    parser.add_argument("--output", help="result file (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", metavar="BASELINE", help="result file to compare against")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    # Set before importing the fake server, whose stat_columns import pulls in the storage modules.
+    os.environ["STORAGE_BACKEND"] = args.storage
+    from benchmarks.fake_sofascore import FakeSofaScore, load_recorded, synthesize_payloads
+
+    started_at = datetime.now(timezone.utc)
+    payloads = load_recorded(args.payloads) if args.payloads else synthesize_payloads(args.dump)
+    match_ids = sorted(int(path.split("/")[1]) for path in payloads
+                       if path.startswith("event/") and path.count("/") == 1)[:args.matches]
+
+    fake = FakeSofaScore(payloads, latency=args.latency_ms / 1000, jitter=args.jitter_ms / 1000,
+                         error_rate=args.error_rate, throttle_rate=args.throttle_rate, seed=0)
+    db_name = f"football_bench_{os.getpid()}"
+    # Scenario processes inherit these; load_dotenv() doesn't override variables already set.
+    os.environ.update({
+        "DB_NAME": db_name,
+        "SOFASCORE_BASE_URL": fake.start(),
+        "SOFASCORE_CACHE_PATH": "",
+        "SOFASCORE_RATE_LIMIT": "1000000",
+        "SOFASCORE_BURST": "1000000",
+        "SOFASCORE_BACKOFF": "0.01",
+        "STAT_STORAGE": "typed" if args.typed else "text",
+        "SQLITE_PATH": os.path.join(tempfile.gettempdir(), f"{db_name}.db"),
+    })
+    sqlite_path = os.environ["SQLITE_PATH"] if args.storage == "sqlite" else None
+    options = {"workers": args.workers, "repeat": args.repeat, "dump": args.dump, "payloads": args.payloads}
+
+    from db_connection import close_pool
+    from storage import get_backend
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    store = None
+    try:
+        setup_start = time.perf_counter()
+        if sqlite_path:
+            store = create_sqlite_database(sqlite_path, args.dump)
+        else:
+            create_database(db_name, args.dump)
+            if args.typed:
+                from db_operations import migrate_to_typed_storage
+                migrate_to_typed_storage()
+        setup_seconds = round(time.perf_counter() - setup_start, 3)
+        print(f"Database ready in {setup_seconds}s.")
+        for name in args.scenarios:
+            if name in END_TO_END and not args.updates:
+                # Through the store, so the team aggregates lose the deleted matches too.
+                (store or get_backend()).delete_matches(match_ids)
+            # A fresh process per scenario keeps peak RSS and warm caches from leaking between them.
+            queue = context.Queue()
+            server_before = dict(fake.counters)
+            process = context.Process(target=_run_scenario, args=(name, match_ids, options, queue))
+            process.start()
+            results[name] = queue.get()
+            process.join()
+            if name in END_TO_END:
+                results[name]["server"] = {key: fake.counters[key] - server_before[key] for key in fake.counters}
+            print(f"{name}: {json.dumps({key: value for key, value in results[name].items() if key not in ('http', 'server')})}")
+    finally:
+        fake.stop()
+        close_pool()
+        if args.keep_db:
+            print(f"Kept database {sqlite_path or db_name}.")
+        elif sqlite_path:
+            drop_sqlite_database(sqlite_path)
+        else:
+            drop_database(db_name)
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "setup_seconds": setup_seconds,
+        "scenarios": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, started_at.strftime("%Y%m%dT%H%M%SZ") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {output}.")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), report)
+        if regressed:
+            raise SystemExit(f"db_round_trips_per_match regressed in: {', '.join(regressed)}")
+
+if __name__ == "__main__":
+    main()
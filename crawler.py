@@ -0,0 +1,179 @@
+import argparse
+from datetime import date, datetime, timedelta, timezone
+import metrics
+from batch_ingest import ingest_batch
+from db_connection import transaction
+from job_queue import record_dead
+from sofascore_client import get_client
+from storage import embedded
+
+# Days re-scanned before the high-water mark so late-finishing or late-published matches are caught.
+DATE_OVERLAP_DAYS = 1
+
+# Failure reasons worth retrying on the next run (besides any http_5xx); the high-water mark
+# stays before matches that failed with them. Other failures are dead-lettered and skipped.
+TRANSIENT_REASONS = {"timeout", "connection", "http_429", "db_error"}
+
+def transient(reason):
+    """Returns True for a failure reason the next sync should retry."""
+    return reason in TRANSIENT_REASONS or reason.startswith("http_5")
+
+def ensure_sync_state_table():
+    """Creates the table holding the crawler's high-water marks."""
+    if embedded():
+        raise RuntimeError("The crawler needs PostgreSQL (STORAGE_BACKEND=postgres).")
+    with transaction() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sync_state (
+                sync_key text PRIMARY KEY,
+                high_water bigint NOT NULL,
+                updated_at timestamptz NOT NULL DEFAULT now()
+            )
+        """)
+
+def get_high_water(sync_key):
+    """Returns the stored high-water mark (a Unix timestamp) for a sync key, or None."""
+    with transaction() as cursor:
+        cursor.execute("SELECT high_water FROM sync_state WHERE sync_key = %s", (sync_key,))
+        row = cursor.fetchone()
+    return row[0] if row else None
+
+def set_high_water(sync_key, high_water, held_back=False):
+    """Stores the high-water mark for a sync key.
+
+    It only moves forwards, unless held_back says it stops before a failure to retry: then it
+    is set as given, even below the stored mark (after a --full or --from run).
+    """
+    value = "EXCLUDED.high_water" if held_back else "GREATEST(sync_state.high_water, EXCLUDED.high_water)"
+    with transaction() as cursor:
+        cursor.execute(f"""
+            INSERT INTO sync_state (sync_key, high_water) VALUES (%s, %s)
+            ON CONFLICT (sync_key) DO UPDATE SET high_water = {value}, updated_at = now()
+        """, (sync_key, high_water))
+
+def missing_match_ids(match_ids):
+    """Returns the IDs not yet in match_statistics, using one set-difference query."""
+    if not match_ids:
+        return []
+    if embedded():
+        raise RuntimeError("The crawler needs PostgreSQL (STORAGE_BACKEND=postgres).")
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT t.id FROM unnest(%s::int[]) AS t(id)
+            WHERE NOT EXISTS (SELECT 1 FROM match_statistics m WHERE m.match_id = t.id)
+        """, (list(match_ids),))
+        missing = {row[0] for row in cursor.fetchall()}
+    # Keep the discovery order.
+    return [match_id for match_id in match_ids if match_id in missing]
+
+def _finished(events, tournament_id=None):
+    """Yields (id, startTimestamp) of finished events, optionally for one unique tournament."""
+    for event in events:
+        if event.get('status', {}).get('type') != 'finished':
+            continue
+        if tournament_id is not None:
+            unique_tournament = event.get('tournament', {}).get('uniqueTournament', {})
+            if unique_tournament.get('id') != tournament_id:
+                continue
+        yield event['id'], event.get('startTimestamp', 0)
+
+def discover_by_dates(start, end, tournament_id=None, client=None):
+    """Returns {event_id: startTimestamp} for finished events scheduled between two dates."""
+    client = client or get_client()
+    found = {}
+    day = start
+    while day <= end:
+        data = client.get_json(f"sport/football/scheduled-events/{day.isoformat()}")
+        found.update(_finished(data.get('events', []), tournament_id))
+        day += timedelta(days=1)
+    return found
+
+def discover_by_season(tournament_id, season_id, since=None, client=None):
+    """Returns {event_id: startTimestamp} for finished events of a tournament season.
+
+    Pages are read newest first and reading stops at the first page that is entirely
+    at or before `since`, so an incremental run only touches new matches.
+    """
+    client = client or get_client()
+    found = {}
+    page = 0
+    while True:
+        data = client.get_json(f"unique-tournament/{tournament_id}/season/{season_id}/events/last/{page}")
+        events = data.get('events', [])
+        page_events = dict(_finished(events))
+        found.update({event_id: ts for event_id, ts in page_events.items() if since is None or ts > since})
+        oldest = min((event.get('startTimestamp', 0) for event in events), default=0)
+        if not data.get('hasNextPage') or not events or (since is not None and oldest <= since):
+            break
+        page += 1
+    return found
+
+def _sync(sync_key, discovered, workers):
+    """Ingests the discovered matches that aren't stored yet and advances the high-water mark.
+
+    Matches that failed for good are dead-lettered in the job queue named after the sync key
+    (see `python job_queue.py dead --queue <key>`) and don't hold the mark back.
+    """
+    new_ids = missing_match_ids(sorted(discovered, key=discovered.get))
+    print(f"{sync_key}: discovered {len(discovered)} finished matches, {len(new_ids)} new.")
+
+    failures = {}
+    if new_ids:
+        failures = ingest_batch(new_ids, workers=workers)["failures"]
+
+    permanent = {match_id: reason for match_id, reason in failures.items() if not transient(reason)}
+    if permanent:
+        record_dead(sync_key, permanent)
+        print(f"{sync_key}: {len(permanent)} matches failed for good; dead-lettered in queue {sync_key}.")
+
+    if discovered:
+        retry = [match_id for match_id in failures if match_id not in permanent]
+        if retry:
+            # Stop just short of the oldest retryable failure so the next run picks it up.
+            set_high_water(sync_key, min(discovered[match_id] for match_id in retry) - 1, held_back=True)
+        else:
+            set_high_water(sync_key, max(discovered.values()))
+    return new_ids, list(failures)
+
+def sync_dates(start=None, end=None, tournament_id=None, workers=8):
+    """Syncs finished matches by date; without a start date it resumes from the high-water mark."""
+    ensure_sync_state_table()
+    sync_key = f"dates:{tournament_id}" if tournament_id is not None else "dates"
+    end = end or datetime.now(timezone.utc).date()
+    if start is None:
+        high_water = get_high_water(sync_key)
+        if high_water is None:
+            start = end - timedelta(days=1)
+        else:
+            start = datetime.fromtimestamp(high_water, timezone.utc).date() - timedelta(days=DATE_OVERLAP_DAYS)
+    discovered = discover_by_dates(start, end, tournament_id)
+    return _sync(sync_key, discovered, workers)
+
+def sync_season(tournament_id, season_id, full=False, workers=8):
+    """Syncs finished matches of a tournament season, only reading pages newer than the high-water mark."""
+    ensure_sync_state_table()
+    sync_key = f"season:{tournament_id}:{season_id}"
+    since = None if full else get_high_water(sync_key)
+    discovered = discover_by_season(tournament_id, season_id, since)
+    return _sync(sync_key, discovered, workers)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Discover and ingest finished SofaScore matches.")
+    parser.add_argument("--from", dest="start", type=date.fromisoformat,
+                        help="first date to scan (YYYY-MM-DD); default: resume from the last sync")
+    parser.add_argument("--to", dest="end", type=date.fromisoformat, help="last date to scan (default: today)")
+    parser.add_argument("--tournament", type=int, help="SofaScore unique tournament ID")
+    parser.add_argument("--season", type=int, help="SofaScore season ID (requires --tournament)")
+    parser.add_argument("--full", action="store_true", help="ignore the high-water mark for a season sync")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent fetch workers (default: 8)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    metrics.start_from_env()
+    if args.season is not None:
+        if args.tournament is None:
+            raise SystemExit("--season requires --tournament")
+        sync_season(args.tournament, args.season, full=args.full, workers=args.workers)
+    else:
+        sync_dates(args.start, args.end, args.tournament, workers=args.workers)
@@ -1,10 +1,61 @@
 import psycopg2
+import psycopg2.pool
 import os
+import time
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+import metrics
+from storage import get_backend
 
 # Load environment variables from .env file
 load_dotenv()
 
+POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Connections idle for longer than this are pinged before being handed out again.
+HEALTHCHECK_INTERVAL = float(os.getenv("DB_HEALTHCHECK_INTERVAL", "30"))
+
+# First keys of the two-key advisory locks (pg_advisory_xact_lock(namespace, key)), one per kind
+# of lock, so a match ID can never collide with another lock's key.
+MATCH_LOCK_NAMESPACE = 1
+PARTITION_LOCK_NAMESPACE = 2
+AGGREGATE_LOCK_NAMESPACE = 3
+
+class _Cursor(psycopg2.extensions.cursor):
+    """Cursor that counts the statements it sends in the pool metrics."""
+
+    def execute(self, query, vars=None):
+        _record("round_trips", 1)
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        _record("round_trips", 1)
+        return super().executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _record("round_trips", 1)
+        return super().copy_expert(sql, file, size)
+
+class _Connection(psycopg2.extensions.connection):
+    """Connection that remembers which statements it has prepared on the server."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared_statements = set()
+        self.cursor_factory = _Cursor
+
+    def commit(self):
+        # Nothing is sent to the server when no transaction is open.
+        if self.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _record("round_trips", 1)
+        return super().commit()
+
+    def rollback(self):
+        if self.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            _record("round_trips", 1)
+        return super().rollback()
+
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
     return psycopg2.connect(
@@ -12,65 +63,161 @@ def get_db_connection():
         user=os.getenv("DB_USER"),
         password=os.getenv("DB_PASSWORD"),
         host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT")
+        port=os.getenv("DB_PORT"),
+        connection_factory=_Connection
     )
 
+class _TimedPool(psycopg2.pool.ThreadedConnectionPool):
+    """ThreadedConnectionPool that builds connections with get_db_connection and times them."""
+
+    def _connect(self, key=None):
+        start = time.perf_counter()
+        conn = get_db_connection()
+        _record("connects", 1, "connect_seconds", time.perf_counter() - start)
+        if key is not None:
+            self._used[key] = conn
+            self._rused[id(conn)] = key
+        else:
+            self._pool.append(conn)
+        return conn
+
+_pool = None
+_pool_lock = threading.Lock()
+# Bounds checkouts to POOL_MAX so callers wait instead of getting a PoolError.
+_slots = threading.BoundedSemaphore(POOL_MAX)
+_last_used = {}
+_metrics = {
+    "in_use": 0, "checkouts": 0, "waits": 0, "wait_seconds": 0.0,
+    "connects": 0, "connect_seconds": 0.0, "reconnects": 0, "round_trips": 0
+}
+_metrics_lock = threading.Lock()
+
+def _record(*pairs):
+    """Adds (name, amount) pairs to the pool metrics."""
+    with _metrics_lock:
+        for name, amount in zip(pairs[::2], pairs[1::2]):
+            _metrics[name] += amount
+
+def get_pool():
+    """Returns the process-wide connection pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _TimedPool(POOL_MIN, POOL_MAX)
+        return _pool
+
+def close_pool():
+    """Closes every pooled connection."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+            _last_used.clear()
+
+def get_pool_stats():
+    """Returns a snapshot of the pool metrics."""
+    with _metrics_lock:
+        stats = dict(_metrics)
+    stats["max_size"] = POOL_MAX
+    return stats
+
+metrics.register_collector("db_pool", get_pool_stats)
+
+def _is_healthy(conn):
+    """Pings connections that have been idle for a while; cheap checks otherwise."""
+    if conn.closed:
+        return False
+    if time.monotonic() - _last_used.get(id(conn), 0) < HEALTHCHECK_INTERVAL:
+        return True
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        conn.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+@contextmanager
+def get_connection():
+    """Checks a healthy connection out of the pool and returns it when the block ends."""
+    start = time.perf_counter()
+    if not _slots.acquire(blocking=False):
+        _slots.acquire()
+        _record("waits", 1, "wait_seconds", time.perf_counter() - start)
+
+    pool = get_pool()
+    conn = None
+    try:
+        conn = pool.getconn()
+        if not _is_healthy(conn):
+            # Dropped by the server (restart, idle timeout): replace it with a fresh one.
+            pool.putconn(conn, close=True)
+            _record("reconnects", 1)
+            conn = pool.getconn()
+        _record("in_use", 1, "checkouts", 1)
+        try:
+            yield conn
+        finally:
+            _record("in_use", -1)
+    finally:
+        if conn is not None:
+            broken = conn.closed or conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN
+            if broken:
+                _last_used.pop(id(conn), None)
+            else:
+                _last_used[id(conn)] = time.monotonic()
+            pool.putconn(conn, close=broken)
+        _slots.release()
+
+@contextmanager
+def transaction():
+    """Yields a cursor inside a transaction that commits on success and rolls back on error."""
+    with get_connection() as conn:
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+            conn.commit()
+        except Exception:
+            if not conn.closed:
+                conn.rollback()
+            raise
+
 def get_or_create_league_id(cursor, league_name):
     """Gets or creates a league ID."""
-    cursor.execute("SELECT league_id FROM leagues WHERE league_name = %s", (league_name,))
-    league_id = cursor.fetchone()
-    if not league_id:
-        cursor.execute("INSERT INTO leagues (league_name) VALUES (%s) RETURNING league_id", (league_name,))
-        league_id = cursor.fetchone()[0]
-    else:
-        league_id = league_id[0]
-    return league_id
+    return get_backend().resolve("leagues", [league_name], cursor)[league_name]
 
 def get_or_create_team_id(cursor, team_name):
     """Gets or creates a team ID."""
-    cursor.execute("SELECT team_id FROM teams WHERE team_name = %s", (team_name,))
-    team_id = cursor.fetchone()
-    if not team_id:
-        cursor.execute("INSERT INTO teams (team_name) VALUES (%s) RETURNING team_id", (team_name,))
-        team_id = cursor.fetchone()[0]
-    else:
-        team_id = team_id[0]
-    return team_id
+    return get_backend().resolve("teams", [team_name], cursor)[team_name]
 
 def insert_match(match_id, match_date, home_team, away_team, league, home_score, away_score):
     """Inserts match data into the database."""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Get or create league ID
-        league_id = get_or_create_league_id(cursor, league)
-        
-        # Get or create team IDs
-        home_team_id = get_or_create_team_id(cursor, home_team)
-        away_team_id = get_or_create_team_id(cursor, away_team)
-
-        # Insert the match data
-        cursor.execute("""
-            INSERT INTO matches (match_id, date, league_id, home_team_id, away_team_id, home_score, away_score)
-            VALUES (%s, %s, %s, %s, %s, %s, %s)
-            ON CONFLICT (match_id) DO NOTHING
-        """, (
-            match_id,
-            match_date,
-            league_id,
-            home_team_id,
-            away_team_id,
-            home_score,
-            away_score
-        ))
-
-        conn.commit()
+        with transaction() as cursor:
+            # Get or create league ID
+            league_id = get_or_create_league_id(cursor, league)
+
+            # Get or create team IDs
+            home_team_id = get_or_create_team_id(cursor, home_team)
+            away_team_id = get_or_create_team_id(cursor, away_team)
+
+            # Insert the match data
+            cursor.execute("""
+                INSERT INTO matches (match_id, date, league_id, home_team_id, away_team_id, home_score, away_score)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                ON CONFLICT (match_id) DO NOTHING
+            """, (
+                match_id,
+                match_date,
+                league_id,
+                home_team_id,
+                away_team_id,
+                home_score,
+                away_score
+            ))
+
         print(f"Match {match_id} inserted successfully.")
 
     except Exception as e:
         print(f"Error inserting match {match_id}: {e}")
-
-    finally:
-        cursor.close()
-        conn.close()
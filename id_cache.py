@@ -0,0 +1,88 @@
+import threading
+from db_connection import transaction
+
+class IdCache:
+    """In-memory name -> ID map for a lookup table, with batched, race-safe get-or-create."""
+
+    def __init__(self, table, id_column, name_column):
+        self.table = table
+        self.id_column = id_column
+        self.name_column = name_column
+        self._ids = {}
+        self._warm = False
+        self._lock = threading.Lock()
+
+    def warm(self, cursor=None):
+        """Loads every existing row into memory."""
+        if cursor is None:
+            with transaction() as cursor:
+                return self.warm(cursor)
+        cursor.execute(f"SELECT {self.name_column}, {self.id_column} FROM {self.table}")
+        rows = cursor.fetchall()
+        with self._lock:
+            self._ids.update(rows)
+            self._warm = True
+        return len(rows)
+
+    def clear(self):
+        """Forgets every cached ID; the next lookup warms the cache again."""
+        with self._lock:
+            self._ids.clear()
+            self._warm = False
+
+    def resolve(self, names, cursor=None):
+        """Returns {name: id} for all names, creating unknown ones in a single statement.
+
+        Without a cursor the lookup commits in its own short transaction, so every ID it
+        caches is durable. With the caller's cursor, IDs created inside that (not yet
+        committed) transaction are returned but not cached, as the caller may still roll back.
+        """
+        if not self._warm:
+            self.warm(cursor)
+
+        names = set(names)
+        with self._lock:
+            found = {name: self._ids[name] for name in names if name in self._ids}
+        missing = sorted(names - found.keys())
+        if not missing:
+            return found
+
+        if cursor is None:
+            with transaction() as cursor:
+                created, existing = self._create(cursor, missing)
+            cacheable = {**created, **existing}
+        else:
+            created, existing = self._create(cursor, missing)
+            cacheable = existing
+
+        with self._lock:
+            self._ids.update(cacheable)
+        found.update(created)
+        found.update(existing)
+        return found
+
+    def _create(self, cursor, names):
+        """Inserts names that don't exist yet; returns ({created name: id}, {existing name: id})."""
+        # ON CONFLICT DO NOTHING lets concurrent workers discovering the same new name both
+        # succeed: the loser waits for the winner's insert and then simply reads its row.
+        cursor.execute(f"""
+            INSERT INTO {self.table} ({self.name_column})
+            SELECT unnest(%s::text[])
+            ON CONFLICT ({self.name_column}) DO NOTHING
+            RETURNING {self.name_column}, {self.id_column}
+        """, (names,))
+        created = dict(cursor.fetchall())
+
+        remaining = [name for name in names if name not in created]
+        existing = {}
+        if remaining:
+            cursor.execute(
+                f"SELECT {self.name_column}, {self.id_column} FROM {self.table} "
+                f"WHERE {self.name_column} = ANY(%s)", (remaining,)
+            )
+            existing = dict(cursor.fetchall())
+        return created, existing
+
+league_ids = IdCache("leagues", "league_id", "league_name")
+team_ids = IdCache("teams", "team_id", "team_name")
+statistic_ids = IdCache("statistic_names", "stat_id", "stat_name")
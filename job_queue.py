@@ -0,0 +1,332 @@
+import os
+import time
+import socket
+import argparse
+import threading
+from dotenv import load_dotenv
+import metrics
+from db_connection import transaction
+from storage import embedded
+
+# Load environment variables from .env file
+load_dotenv()
+
+# A job that failed this many times is moved to the dead-letter state.
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+# Seconds before the first retry; doubles with every further attempt.
+JOB_RETRY_DELAY = float(os.getenv("JOB_RETRY_DELAY", "60"))
+# How long a claim is held; a worker that dies loses its jobs to others once it runs out.
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "600"))
+
+DEFAULT_QUEUE = "default"
+
+# Job states: waiting (possibly for a retry), claimed by a worker, written, or given up on.
+STATES = ("pending", "running", "done", "dead")
+
+_table_ready = False
+_table_lock = threading.Lock()
+
+def worker_name():
+    """Identifies this process in the jobs it claims, e.g. "host:1234"."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def ensure_job_table():
+    """Creates the ingest_jobs table."""
+    global _table_ready
+    if _table_ready:
+        return
+    if embedded():
+        raise RuntimeError("The ingest job queue needs PostgreSQL (STORAGE_BACKEND=postgres).")
+    with _table_lock:
+        if _table_ready:
+            return
+        with transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_jobs (
+                    queue text NOT NULL,
+                    match_id integer NOT NULL,
+                    state text NOT NULL DEFAULT 'pending',
+                    attempts integer NOT NULL DEFAULT 0,
+                    next_attempt_at timestamptz NOT NULL DEFAULT now(),
+                    worker text,
+                    lease_until timestamptz,
+                    last_reason text,
+                    last_error text,
+                    created_at timestamptz NOT NULL DEFAULT now(),
+                    updated_at timestamptz NOT NULL DEFAULT now(),
+                    PRIMARY KEY (queue, match_id)
+                )
+            """)
+            # Claims only ever look at pending and running jobs.
+            cursor.execute("""
+                CREATE INDEX IF NOT EXISTS ingest_jobs_claimable
+                ON ingest_jobs (queue, next_attempt_at) WHERE state IN ('pending', 'running')
+            """)
+        _table_ready = True
+
+def enqueue(match_ids, queue=DEFAULT_QUEUE, reset=False):
+    """Adds match IDs to a queue and returns the number added.
+
+    IDs already in the queue are left alone, so re-adding a list resumes it; with reset=True
+    their done or dead jobs are made pending again instead.
+    """
+    ensure_job_table()
+    on_conflict = "DO NOTHING"
+    if reset:
+        on_conflict = ("DO UPDATE SET state = 'pending', attempts = 0, next_attempt_at = now(), updated_at = now() "
+                       "WHERE ingest_jobs.state IN ('done', 'dead')")
+    with transaction() as cursor:
+        cursor.execute(f"""
+            INSERT INTO ingest_jobs (queue, match_id)
+            SELECT %s, unnest(%s::int[])
+            ON CONFLICT (queue, match_id) {on_conflict}
+        """, (queue, list(match_ids)))
+        added = cursor.rowcount
+    metrics.inc("jobs_enqueued_total", added, queue=queue)
+    return added
+
+def claim(queue=DEFAULT_QUEUE, limit=100, worker=None):
+    """Claims up to `limit` due jobs for this worker and returns their match IDs.
+
+    Pending jobs whose retry time has come are claimable, and so are running jobs whose
+    lease ran out because their worker died. SKIP LOCKED lets concurrent workers claim
+    different jobs without waiting on each other.
+    """
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs j
+            SET state = 'running', attempts = j.attempts + 1, worker = %s,
+                lease_until = now() + make_interval(secs => %s), updated_at = now()
+            FROM (
+                SELECT queue, match_id FROM ingest_jobs
+                WHERE queue = %s
+                  AND ((state = 'pending' AND next_attempt_at <= now())
+                       OR (state = 'running' AND lease_until < now()))
+                ORDER BY next_attempt_at, match_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ) due
+            WHERE j.queue = due.queue AND j.match_id = due.match_id
+            RETURNING j.match_id
+        """, (worker or worker_name(), JOB_LEASE_SECONDS, queue, limit))
+        match_ids = sorted(row[0] for row in cursor.fetchall())
+    metrics.inc("jobs_claimed_total", len(match_ids), queue=queue)
+    return match_ids
+
+def renew_leases(queue=DEFAULT_QUEUE, worker=None):
+    """Extends the leases of the jobs a live worker holds, so slow batches aren't taken over."""
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs SET lease_until = now() + make_interval(secs => %s)
+            WHERE queue = %s AND worker = %s AND state = 'running'
+        """, (JOB_LEASE_SECONDS, queue, worker or worker_name()))
+        return cursor.rowcount
+
+def complete_jobs(cursor, queue, match_ids, worker=None):
+    """Marks this worker's running jobs done using the caller's cursor, so the checkpoint commits
+    with the match data. Returns the match IDs completed.
+
+    A job whose lease ran out and was claimed by another worker is left to that worker; the
+    match data written here is the same, so it is only counted as a lost lease.
+    """
+    ensure_job_table()
+    cursor.execute("""
+        UPDATE ingest_jobs
+        SET state = 'done', worker = NULL, lease_until = NULL, last_reason = NULL, last_error = NULL,
+            updated_at = now()
+        WHERE queue = %s AND match_id = ANY(%s) AND worker = %s AND state = 'running'
+        RETURNING match_id
+    """, (queue, list(match_ids), worker or worker_name()))
+    completed = [row[0] for row in cursor.fetchall()]
+    lost = len(set(match_ids)) - len(completed)
+    if lost:
+        metrics.inc("jobs_lease_lost_total", lost, queue=queue)
+        print(f"{lost} jobs of queue {queue} were no longer held by this worker; left to their new owner.")
+    return completed
+
+def fail_job(queue, match_id, reason, error=None):
+    """Records a failed attempt: the job is retried with exponential backoff, or dead-lettered
+    after JOB_MAX_ATTEMPTS attempts. Returns the job's new state.
+    """
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET state = CASE WHEN attempts >= %s THEN 'dead' ELSE 'pending' END,
+                next_attempt_at = now() + make_interval(secs => %s * power(2, greatest(attempts - 1, 0))),
+                worker = NULL, lease_until = NULL, last_reason = %s, last_error = %s, updated_at = now()
+            WHERE queue = %s AND match_id = %s
+            RETURNING state
+        """, (JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY, reason, error, queue, match_id))
+        row = cursor.fetchone()
+    state = row[0] if row else None
+    metrics.inc("jobs_failed_total", queue=queue, state=state or "missing")
+    if state == "dead":
+        print(f"Match {match_id} failed {JOB_MAX_ATTEMPTS} times ({reason}); moved to the dead-letter list.")
+    return state
+
+def record_dead(queue, failures):
+    """Dead-letters matches that failed for good outside the queue ({match_id: reason}), e.g. in a
+    crawler sync, so dead_letters lists them and requeue_dead can retry them. Returns the number recorded.
+    """
+    if not failures:
+        return 0
+    ensure_job_table()
+    match_ids = list(failures)
+    with transaction() as cursor:
+        cursor.execute("""
+            INSERT INTO ingest_jobs (queue, match_id, state, attempts, last_reason)
+            SELECT %s, t.match_id, 'dead', 1, t.reason FROM unnest(%s::int[], %s::text[]) AS t(match_id, reason)
+            ON CONFLICT (queue, match_id) DO UPDATE
+            SET state = 'dead', attempts = ingest_jobs.attempts + 1, last_reason = EXCLUDED.last_reason,
+                worker = NULL, lease_until = NULL, updated_at = now()
+            WHERE ingest_jobs.state <> 'running'
+        """, (queue, match_ids, [failures[match_id] for match_id in match_ids]))
+        recorded = cursor.rowcount
+    metrics.inc("jobs_failed_total", recorded, queue=queue, state="dead")
+    return recorded
+
+def release(queue=DEFAULT_QUEUE, worker=None):
+    """Hands this worker's running jobs back without counting the attempt (on a clean shutdown)."""
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET state = 'pending', attempts = greatest(attempts - 1, 0), worker = NULL, lease_until = NULL,
+                updated_at = now()
+            WHERE queue = %s AND state = 'running' AND worker = %s
+        """, (queue, worker or worker_name()))
+        return cursor.rowcount
+
+def recover(queue=DEFAULT_QUEUE):
+    """Returns jobs of crashed workers on this host to pending without waiting for their lease.
+
+    A worker is known dead when it ran on this host and its process no longer exists;
+    jobs of workers on other hosts are only taken over once their lease runs out.
+    """
+    ensure_job_table()
+    host = socket.gethostname()
+    with transaction() as cursor:
+        cursor.execute("SELECT DISTINCT worker FROM ingest_jobs WHERE queue = %s AND state = 'running'", (queue,))
+        workers = [row[0] for row in cursor.fetchall()]
+    dead = []
+    for worker in workers:
+        worker_host, _, pid = (worker or "").rpartition(":")
+        if worker_host == host and pid.isdigit() and not _process_alive(int(pid)):
+            dead.append(worker)
+    if not dead:
+        return 0
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET state = 'pending', worker = NULL, lease_until = NULL, last_reason = 'worker_died', updated_at = now()
+            WHERE queue = %s AND state = 'running' AND worker = ANY(%s)
+        """, (queue, dead))
+        recovered = cursor.rowcount
+    print(f"Recovered {recovered} jobs from crashed workers {', '.join(dead)}.")
+    return recovered
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def queue_stats(queue=DEFAULT_QUEUE):
+    """Returns {state: count} for a queue, plus "due": pending jobs claimable right now."""
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("SELECT state, count(*) FROM ingest_jobs WHERE queue = %s GROUP BY state", (queue,))
+        stats = {state: 0 for state in STATES}
+        stats.update(dict(cursor.fetchall()))
+        cursor.execute("""
+            SELECT count(*) FROM ingest_jobs
+            WHERE queue = %s AND ((state = 'pending' AND next_attempt_at <= now())
+                                  OR (state = 'running' AND lease_until < now()))
+        """, (queue,))
+        stats["due"] = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT EXTRACT(EPOCH FROM min(next_attempt_at) - now()) FROM ingest_jobs
+            WHERE queue = %s AND state = 'pending'
+        """, (queue,))
+        wait = cursor.fetchone()[0]
+    stats["next_retry_in"] = None if wait is None else max(0.0, float(wait))
+    return stats
+
+def dead_letters(queue=DEFAULT_QUEUE):
+    """Returns (match_id, attempts, last_reason, last_error, updated_at) of the dead-lettered jobs."""
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT match_id, attempts, last_reason, last_error, updated_at FROM ingest_jobs
+            WHERE queue = %s AND state = 'dead' ORDER BY updated_at
+        """, (queue,))
+        return cursor.fetchall()
+
+def requeue_dead(queue=DEFAULT_QUEUE, match_ids=None):
+    """Moves dead-lettered jobs (all, or the given IDs) back to pending with a fresh attempt count."""
+    ensure_job_table()
+    with transaction() as cursor:
+        cursor.execute("""
+            UPDATE ingest_jobs
+            SET state = 'pending', attempts = 0, next_attempt_at = now(), updated_at = now()
+            WHERE queue = %s AND state = 'dead' AND (%s::int[] IS NULL OR match_id = ANY(%s::int[]))
+        """, (queue, match_ids, match_ids))
+        return cursor.rowcount
+
+def process_queue(queue=DEFAULT_QUEUE, workers=8, claim_size=200, wait=False):
+    """Claims and ingests jobs until none are due (or, with wait=True, until none are left to retry).
+
+    Every claimed batch goes through batch_ingest.ingest_batch, whose writes mark their
+    jobs done in the same transaction. If the process dies, rerunning this resumes with
+    the jobs that were not checkpointed.
+    """
+    # Imported here because batch_ingest writes through db_operations, which imports this module.
+    from batch_ingest import ingest_batch
+
+    recover(queue)
+    worker = worker_name()
+    totals = {"claimed": 0, "failed": 0}
+    try:
+        while True:
+            match_ids = claim(queue, claim_size, worker)
+            if not match_ids:
+                stats = queue_stats(queue)
+                if wait and stats["next_retry_in"] is not None:
+                    time.sleep(min(stats["next_retry_in"] + 0.1, JOB_RETRY_DELAY))
+                    continue
+                break
+            totals["claimed"] += len(match_ids)
+            result = ingest_batch(match_ids, workers=workers, job_queue=queue)
+            totals["failed"] += len(result["failed"])
+    finally:
+        release(queue, worker)
+    stats = queue_stats(queue)
+    print(f"queue {queue}: {totals['claimed']} jobs claimed, {totals['failed']} failed; "
+          f"{stats['done']} done, {stats['pending']} pending, {stats['dead']} dead.")
+    return stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Inspect and manage the ingest job queue.")
+    parser.add_argument("command", choices=["status", "dead", "requeue-dead", "recover"])
+    parser.add_argument("--queue", default=DEFAULT_QUEUE, help=f"queue name (default: {DEFAULT_QUEUE})")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "status":
+        print(queue_stats(args.queue))
+    elif args.command == "dead":
+        for match_id, attempts, reason, error, updated_at in dead_letters(args.queue):
+            print(f"{match_id}\t{attempts} attempts\t{reason}\t{updated_at:%Y-%m-%d %H:%M:%S}\t{error or ''}")
+    elif args.command == "requeue-dead":
+        print(f"Requeued {requeue_dead(args.queue)} dead-lettered jobs.")
+    elif not recover(args.queue):
+        print("No jobs of crashed workers to recover.")
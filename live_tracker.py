@@ -0,0 +1,215 @@
+import time
+import heapq
+import sqlite3
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+import metrics
+from db_operations import (insert_match, replace_match_periods, stat_params, update_match_columns,
+                           write_failure_reason)
+from match_statistics import build_match_details, failure_reason
+from sofascore_client import get_client
+from stat_columns import registry, typed_storage
+
+# SofaScore status codes of the periods that matter for the polling cadence.
+FIRST_HALF = 6
+SECOND_HALF = 7
+HALFTIME = 31
+
+# Poll intervals in seconds. Before kickoff events sleep until KICKOFF_LEAD seconds before it.
+KICKOFF_LEAD = 10 * 60
+INTERVAL_NEAR_KICKOFF = 60
+INTERVAL_IN_PLAY = 60
+INTERVAL_CLOSING_MINUTES = 20
+INTERVAL_HALFTIME = 2 * 60
+INTERVAL_OTHER = 5 * 60
+
+def match_minute(event, now):
+    """Estimates the current match minute from the period start timestamp."""
+    period_start = event.get('time', {}).get('currentPeriodStartTimestamp')
+    if not period_start:
+        return None
+    minute = (now - period_start) / 60
+    if event.get('status', {}).get('code') == SECOND_HALF:
+        minute += 45
+    return minute
+
+def next_poll_delay(event, now):
+    """Returns how long to wait before polling an event again, or None once it is over."""
+    status = event.get('status', {})
+    status_type = status.get('type')
+
+    if status_type == 'finished':
+        return None
+    if status_type == 'notstarted':
+        until_kickoff = event.get('startTimestamp', now) - now
+        if until_kickoff > KICKOFF_LEAD:
+            return min(until_kickoff - KICKOFF_LEAD, 60 * 60)
+        return INTERVAL_NEAR_KICKOFF
+    if status_type == 'inprogress':
+        if status.get('code') == HALFTIME:
+            return INTERVAL_HALFTIME
+        minute = match_minute(event, now)
+        if minute is not None and (minute >= 80 or (status.get('code') == FIRST_HALF and minute >= 42)):
+            return INTERVAL_CLOSING_MINUTES
+        return INTERVAL_IN_PLAY
+    # Postponed, interrupted, canceled: check back occasionally, stop on canceled.
+    if status_type == 'canceled':
+        return None
+    return INTERVAL_OTHER
+
+class LiveTracker:
+    """Polls a set of events on adaptive intervals and writes only statistics that changed."""
+
+    def __init__(self, client=None, workers=4):
+        self.client = client or get_client()
+        self.workers = workers
+        self.schedule = []
+        self.tracked = set()
+        self.last_rows = {}
+        self.last_periods = {}
+        self.counters = {"polls": 0, "unchanged": 0, "partial_writes": 0, "full_writes": 0,
+                         "columns_written": 0, "errors": 0}
+
+    def track(self, match_id, when=None):
+        """Adds an event to the polling schedule."""
+        if match_id in self.tracked:
+            return
+        self.tracked.add(match_id)
+        heapq.heappush(self.schedule, (when or time.time(), match_id))
+
+    def poll(self, match_id):
+        """Fetches one event; returns (event, details or None)."""
+        # Live payloads change every poll, so go around the response cache.
+        event_data = self.client.get_json(f"event/{match_id}")
+        event = event_data.get('event', {})
+        if event.get('status', {}).get('type') == 'notstarted':
+            return event, None
+        statistics_data = self.client.get_json(f"event/{match_id}/statistics")
+        return event, build_match_details(event_data, statistics_data)
+
+    def write_changes(self, match_id, details):
+        """Diffs the new statistics against the last write and stores only the changed columns.
+
+        Returns the changed columns, or None when the write failed (nothing is remembered
+        then, so the next poll writes the changes again).
+        """
+        try:
+            typed = typed_storage()
+            registry.ensure_stats(details['statistics'], typed)
+            plan = registry.plan(typed)
+            row = dict(zip(plan.column_names[5:], stat_params(plan, typed, details['statistics'], details['scores'])))
+
+            periods = details.get('periods') or {}
+            previous = self.last_rows.get(match_id)
+            periods_changed = periods != self.last_periods.get(match_id)
+            changes = row
+            if previous is not None:
+                changes = {column: value for column, value in row.items() if previous.get(column) != value}
+                if not changes and not periods_changed:
+                    self.counters["unchanged"] += 1
+                    return {}
+
+            if previous is not None and (not changes or update_match_columns(match_id, changes)):
+                if periods_changed and periods:
+                    replace_match_periods(match_id, periods)
+                self.counters["partial_writes"] += 1
+                self.counters["columns_written"] += len(changes)
+                print(f"Match {match_id}: updated {len(changes)} columns.")
+            else:
+                # First sighting (or the row vanished): write the whole row with its teams and league.
+                # insert_match reports its own failures.
+                if insert_match(match_id, details['date'], details['home_team'], details['away_team'],
+                                details['league'], details['statistics'], details['scores'], periods) is None:
+                    self.counters["errors"] += 1
+                    return None
+                self.counters["full_writes"] += 1
+        except (psycopg2.Error, sqlite3.Error) as e:
+            metrics.record_failure("write", write_failure_reason(e))
+            print(f"Error writing match {match_id}: {e}")
+            self.counters["errors"] += 1
+            return None
+        self.last_rows[match_id] = row
+        self.last_periods[match_id] = periods
+        return changes
+
+    def _retry_later(self, match_id, stage, reason, error):
+        """Counts a failed poll or write and schedules the match to be polled again."""
+        metrics.record_failure(stage, reason)
+        print(f"Error {'polling' if stage == 'poll' else 'writing'} match {match_id}: {error}")
+        self.counters["errors"] += 1
+        heapq.heappush(self.schedule, (time.time() + INTERVAL_IN_PLAY, match_id))
+
+    def run(self, max_polls=None):
+        """Polls until every tracked event has finished (or max_polls polls were made)."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while self.schedule and (max_polls is None or self.counters["polls"] < max_polls):
+                due_at = self.schedule[0][0]
+                now = time.time()
+                if due_at > now:
+                    time.sleep(min(due_at - now, 5))
+                    continue
+
+                due = []
+                while self.schedule and self.schedule[0][0] <= now:
+                    due.append(heapq.heappop(self.schedule)[1])
+
+                futures = {match_id: pool.submit(self.poll, match_id) for match_id in due}
+                for match_id, future in futures.items():
+                    self.counters["polls"] += 1
+                    # Any error only affects its own match, which is polled again soon.
+                    try:
+                        event, details = future.result()
+                    except Exception as e:
+                        self._retry_later(match_id, "poll", failure_reason(e), e)
+                        continue
+                    try:
+                        written = self.write_changes(match_id, details) if details else {}
+                    except Exception as e:
+                        self._retry_later(match_id, "write", write_failure_reason(e), e)
+                        continue
+                    if written is None:
+                        # Poll again soon, even if the match just finished, so the write is retried.
+                        heapq.heappush(self.schedule, (time.time() + INTERVAL_IN_PLAY, match_id))
+                        continue
+                    delay = next_poll_delay(event, time.time())
+                    if delay is None:
+                        print(f"Match {match_id} is over; no longer tracking it.")
+                        self.tracked.discard(match_id)
+                        self.last_rows.pop(match_id, None)
+                        self.last_periods.pop(match_id, None)
+                    else:
+                        heapq.heappush(self.schedule, (time.time() + delay, match_id))
+        print(f"Live tracking stopped: {self.counters}")
+        return self.counters
+
+def live_event_ids(client=None, tournament_id=None):
+    """Returns the IDs of football events currently in progress."""
+    client = client or get_client()
+    events = client.get_json("sport/football/events/live").get('events', [])
+    return [
+        event['id'] for event in events
+        if tournament_id is None
+        or event.get('tournament', {}).get('uniqueTournament', {}).get('id') == tournament_id
+    ]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Follow live matches and store statistics as they change.")
+    parser.add_argument("match_ids", nargs="*", type=int, help="SofaScore event IDs to follow")
+    parser.add_argument("--live", action="store_true", help="also follow every match currently in progress")
+    parser.add_argument("--tournament", type=int, help="with --live, only follow this unique tournament")
+    parser.add_argument("--workers", type=int, default=4, help="concurrent polls (default: 4)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    metrics.start_from_env()
+    tracker = LiveTracker(workers=args.workers)
+    match_ids = list(args.match_ids)
+    if args.live:
+        match_ids += live_event_ids(tournament_id=args.tournament)
+    if not match_ids:
+        raise SystemExit("No matches to follow.")
+    for match_id in match_ids:
+        tracker.track(match_id)
+    tracker.run()
@@ -1,71 +1,146 @@
 import requests
 from datetime import datetime
+import metrics
+from response_cache import CacheMiss
+from sofascore_client import get_client
+from stat_columns import SCORE_PERIODS, score_key, stat_index
 
-def fetch_match_statistics(match_id):
-    """Fetch match details and statistics from SofaScore using the correct API endpoint."""
-    url = f"https://www.sofascore.com/api/v1/event/{match_id}/statistics"
+class FetchError(Exception):
+    """A match that couldn't be fetched; reason is a short category such as "http_404" or "timeout"."""
 
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+def failure_reason(error):
+    """Categorizes an exception raised while fetching a match."""
+    if isinstance(error, FetchError):
+        return error.reason
+    if isinstance(error, CacheMiss):
+        return "not_cached"
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"http_{error.response.status_code}"
+    if isinstance(error, requests.Timeout):
+        return "timeout"
+    if isinstance(error, requests.ConnectionError):
+        return "connection"
+    # requests' JSONDecodeError is also a RequestException, so check it first.
+    if isinstance(error, ValueError):
+        return "invalid_json"
+    if isinstance(error, requests.RequestException):
+        return "http_error"
+    return "error"
+
+def fetch_match(match_id, client=None):
+    """Fetches match details and statistics, raising FetchError with the reason when that fails."""
+    client = client or get_client()
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        # Fetch additional match information such as date, teams, and league
-        match_info_url = f"https://www.sofascore.com/api/v1/event/{match_id}"
-        match_info_response = requests.get(match_info_url)
-        match_info_response.raise_for_status()
-        match_info_data = match_info_response.json()
-
-        # Extract league name properly from the match_info_data
-        league = match_info_data.get('event', {}).get('tournament', {}).get('name')
-        if not league:
-            league = "Unknown League"
-
-        # Convert the Unix timestamp to a date
-        match_timestamp = match_info_data.get('event', {}).get('startTimestamp')
-        if match_timestamp:
-            match_date = datetime.utcfromtimestamp(match_timestamp).date()
-        else:
-            return None
-
-        home_team = match_info_data.get('event', {}).get('homeTeam', {}).get('name')
-        away_team = match_info_data.get('event', {}).get('awayTeam', {}).get('name')
-
-        if not home_team or not away_team:
-            return None
-
-        # Extract relevant statistics
-        statistics = extract_statistics(data)
-
-        return {
-            "date": match_date,
-            "home_team": home_team,
-            "away_team": away_team,
-            "league": league,
-            "statistics": statistics
-        }
-
-    except requests.RequestException as e:
-        return None
+        with metrics.span("fetch"):
+            # Fetch the match information (date, teams, league, status) first so that the
+            # statistics payload is cached with the right expiry.
+            match_info_data = client.get_event(match_id)
+            data = client.get_statistics(match_id)
+        with metrics.span("parse"):
+            details = build_match_details(match_info_data, data)
+        if details is None:
+            event = match_info_data.get('event', {})
+            reason = "missing_date" if not event.get('startTimestamp') else "missing_teams"
+            raise FetchError(reason, f"Match {match_id} has no {reason.split('_')[1]} in its event payload")
+        return details
     except Exception as e:
+        reason = failure_reason(e)
+        metrics.record_failure("fetch", reason)
+        if isinstance(e, FetchError):
+            raise
+        raise FetchError(reason, f"Could not fetch match {match_id}: {e}") from e
+
+def fetch_match_statistics(match_id, client=None):
+    """Fetch match details and statistics from SofaScore using the correct API endpoint.
+
+    Returns None when the match can't be fetched; the reason is counted in the metrics
+    (use fetch_match to get it).
+    """
+    try:
+        return fetch_match(match_id, client)
+    except FetchError:
         return None
 
-def extract_statistics(data):
-    """Extracts statistics from the API response."""
-    statistics = {}
+def build_match_details(match_info_data, data):
+    """Builds the match details dict from the event and statistics payloads (None if incomplete)."""
+    # Extract league name properly from the match_info_data
+    league = match_info_data.get('event', {}).get('tournament', {}).get('name')
+    if not league:
+        league = "Unknown League"
+
+    # Convert the Unix timestamp to a date
+    match_timestamp = match_info_data.get('event', {}).get('startTimestamp')
+    if match_timestamp:
+        match_date = datetime.utcfromtimestamp(match_timestamp).date()
+    else:
+        return None
+
+    home_team = match_info_data.get('event', {}).get('homeTeam', {}).get('name')
+    away_team = match_info_data.get('event', {}).get('awayTeam', {}).get('name')
+
+    if not home_team or not away_team:
+        return None
+
+    # Extract relevant statistics, every period in one pass
+    periods = extract_periods(data)
+    statistics = period_statistics(full_match_period(periods))
+    periods.pop('ALL', None)
+
+    return {
+        "date": match_date,
+        "home_team": home_team,
+        "away_team": away_team,
+        "league": league,
+        "statistics": statistics,
+        "periods": periods,
+        "scores": extract_scores(match_info_data.get('event', {}))
+    }
+
+def extract_periods(data):
+    """Extracts every period of a statistics payload in a single pass.
+
+    Returns {period: {stat ID: (home, away)}}, e.g. {"ALL": {0: ("60%", "40%"), ...}, "1ST": ...,
+    "2ND": ...}, with IDs from stat_columns.stat_index.
+    """
+    periods = {}
+    resolve = stat_index.resolve
     try:
-        # Check if the expected structure exists
-        if 'statistics' in data and len(data['statistics']) > 0:
-            groups = data['statistics'][0].get('groups', [])
-
-            for group in groups:
-                group_name = group.get('groupName', '').lower()
-                
-                for stat in group.get('statisticsItems', []):
-                    stat_name = stat['name'].lower()
-                    statistics[f"{stat_name}_home"] = str(stat.get('home', 'N/A'))
-                    statistics[f"{stat_name}_away"] = str(stat.get('away', 'N/A'))
-    except (KeyError, IndexError, TypeError):
+        for block in data.get('statistics') or ():
+            stats = periods.setdefault(block.get('period', 'ALL'), {})
+            for group in block.get('groups') or ():
+                for stat in group.get('statisticsItems') or ():
+                    stats[resolve(stat['name']).id] = (str(stat.get('home', 'N/A')), str(stat.get('away', 'N/A')))
+    except (KeyError, TypeError, AttributeError):
         pass
+    return periods
 
+def period_statistics(stats):
+    """Flattens one period's {stat ID: (home, away)} into {"ball possession_home": "60%", ...}."""
+    refs = stat_index.refs
+    statistics = {}
+    for stat_id, (home, away) in stats.items():
+        ref = refs[stat_id]
+        statistics[ref.home_key] = home
+        statistics[ref.away_key] = away
     return statistics
+
+def full_match_period(periods):
+    """Returns the full-match stats of extract_periods' result: the "ALL" period, or else the first one sent."""
+    return periods.get('ALL') or next(iter(periods.values()), {})
+
+def extract_statistics(data):
+    """Extracts the full-match statistics from the API response."""
+    return period_statistics(full_match_period(extract_periods(data)))
+
+def extract_scores(event):
+    """Extracts the per-period scores (home_period1, ..., away_normaltime) from an event."""
+    scores = {}
+    for side in ("home", "away"):
+        score = event.get(f"{side}Score") or {}
+        for period in SCORE_PERIODS:
+            scores[score_key(side, period)] = score.get(period)
+    return scores
@@ -0,0 +1,183 @@
+import os
+import json
+import time
+import bisect
+import atexit
+import threading
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Serve /metrics (Prometheus text) and /metrics.json on this port; unset disables it.
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# Write a JSON snapshot to this file every METRICS_DUMP_INTERVAL seconds and at exit.
+METRICS_DUMP_PATH = os.getenv("METRICS_DUMP_PATH")
+METRICS_DUMP_INTERVAL = float(os.getenv("METRICS_DUMP_INTERVAL", "60"))
+
+PREFIX = "football_"
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond parsing to slow retries.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_collectors = {}
+_started = False
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+def inc(name, amount=1, **labels):
+    """Adds to a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+def observe(name, value, **labels):
+    """Records one value (seconds) in a histogram."""
+    key = _key(name, labels)
+    index = bisect.bisect_left(DEFAULT_BUCKETS, value)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(DEFAULT_BUCKETS) + 1), 0.0, 0]
+        histogram[0][index] += 1
+        histogram[1] += value
+        histogram[2] += 1
+
+@contextmanager
+def span(stage, **labels):
+    """Times a block into stage_seconds{stage=...}; an exception also counts in stage_errors_total."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        inc("stage_errors_total", stage=stage, **labels)
+        raise
+    finally:
+        observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+
+def record_failure(stage, reason):
+    """Counts a match that failed at a stage, e.g. ("fetch", "http_404") or ("write", "db_error")."""
+    inc("match_failures_total", stage=stage, reason=reason)
+
+def register_collector(name, collect):
+    """Adds a function returning {metric: number} that is read on every snapshot, as gauges."""
+    with _lock:
+        _collectors[name] = collect
+
+def snapshot():
+    """Returns every counter, histogram and collected gauge as a JSON-friendly dict."""
+    with _lock:
+        counters = [{"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(_counters.items())]
+        histograms = [
+            {"name": name, "labels": dict(labels), "count": count, "sum": round(total, 6),
+             "buckets": dict(zip([str(bound) for bound in DEFAULT_BUCKETS] + ["+Inf"], bucket_counts))}
+            for (name, labels), (bucket_counts, total, count) in sorted(_histograms.items())
+        ]
+        collectors = dict(_collectors)
+    gauges = {}
+    for name, collect in collectors.items():
+        try:
+            gauges[name] = collect()
+        except Exception as e:
+            gauges[name] = {"error": str(e)}
+    return {"time": time.time(), "counters": counters, "histograms": histograms, "gauges": gauges}
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels_text(labels, extra=None):
+    labels = {**labels, **(extra or {})}
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+def render_prometheus():
+    """Returns the snapshot in the Prometheus text exposition format."""
+    data = snapshot()
+    lines = []
+    typed = set()
+
+    def declare(name, kind):
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} {kind}")
+
+    for counter in data["counters"]:
+        name = PREFIX + counter["name"]
+        declare(name, "counter")
+        lines.append(f"{name}{_labels_text(counter['labels'])} {counter['value']}")
+    for histogram in data["histograms"]:
+        name = PREFIX + histogram["name"]
+        declare(name, "histogram")
+        cumulative = 0
+        for bound, count in histogram["buckets"].items():
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels_text(histogram['labels'], {'le': bound})} {cumulative}")
+        lines.append(f"{name}_sum{_labels_text(histogram['labels'])} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels_text(histogram['labels'])} {histogram['count']}")
+    for collector, values in data["gauges"].items():
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                name = f"{PREFIX}{collector}_{key}"
+                declare(name, "gauge")
+                lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+def dump_json(path):
+    """Writes the snapshot to a JSON file, replacing it atomically."""
+    with open(path + ".tmp", "w") as f:
+        json.dump(snapshot(), f, indent=2)
+    os.replace(path + ".tmp", path)
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = render_prometheus().encode(), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode(), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(port, host=METRICS_HOST):
+    """Serves /metrics and /metrics.json on a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _dump_periodically(path, interval):
+    while True:
+        time.sleep(interval)
+        dump_json(path)
+
+def start_from_env():
+    """Starts the metrics endpoint and/or the periodic JSON dump configured in .env (once)."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    if METRICS_PORT:
+        serve(int(METRICS_PORT))
+        print(f"Metrics at http://{METRICS_HOST}:{METRICS_PORT}/metrics")
+    if METRICS_DUMP_PATH:
+        threading.Thread(target=_dump_periodically, args=(METRICS_DUMP_PATH, METRICS_DUMP_INTERVAL),
+                         daemon=True).start()
+        atexit.register(dump_json, METRICS_DUMP_PATH)
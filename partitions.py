@@ -0,0 +1,305 @@
+import os
+import re
+import gzip
+import argparse
+import threading
+from datetime import date
+from dotenv import load_dotenv
+import psycopg2
+import stat_columns
+from db_connection import PARTITION_LOCK_NAMESPACE, transaction
+from queries import notify_matches
+from stat_columns import partitioned_storage, registry, typed_storage
+from team_aggregates import MAINTAIN_AGGREGATES, add_matches, ensure_aggregate_tables, subtract_matches
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Where archive_season writes detached seasons.
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "archive")
+
+_known_seasons = set()
+_seasons_lock = threading.Lock()
+
+def season_of(day):
+    """Returns the season a date belongs to, named by its starting year (seasons start in July)."""
+    if isinstance(day, str):
+        day = date.fromisoformat(day)
+    return day.year if day.month >= 7 else day.year - 1
+
+def season_bounds(season):
+    """Returns the [start, end) date range of a season's partition."""
+    return date(season, 7, 1), date(season + 1, 7, 1)
+
+def partition_name(season):
+    """Returns the table name of a season's partition, e.g. match_statistics_2024 for 2024/25."""
+    return f"match_statistics_{int(season)}"
+
+def _attached_seasons(cursor):
+    cursor.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'match_statistics'::regclass
+    """)
+    return {int(name.rsplit("_", 1)[1]) for (name,) in cursor.fetchall() if re.fullmatch(r"match_statistics_\d+", name)}
+
+def _create_partition(cursor, season):
+    start, end = season_bounds(season)
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {partition_name(season)} PARTITION OF match_statistics "
+                   f"FOR VALUES FROM (%s) TO (%s)", (start, end))
+
+def ensure_partitions(dates, recheck=False):
+    """Creates the season partitions the given match dates fall into, if they're missing.
+
+    A no-op unless match_statistics is partitioned. Seasons already seen by this process
+    are skipped without a query, so the ingestion path only pays for it once per season;
+    recheck looks them up again.
+    """
+    if not partitioned_storage():
+        return
+    seasons = {season_of(day) for day in dates if day}
+    if not recheck:
+        seasons -= _known_seasons
+    if not seasons:
+        return
+    with _seasons_lock, transaction() as cursor:
+        # Taken so concurrent writers don't race to create the same partition.
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (PARTITION_LOCK_NAMESPACE,))
+        attached = _attached_seasons(cursor)
+        for season in sorted(seasons - attached):
+            _create_partition(cursor, season)
+            print(f"Created partition {partition_name(season)}.")
+        _known_seasons.update(seasons | attached)
+
+def write_partitioned(dates, write):
+    """Runs write() (one transaction) after making sure the dates' partitions exist.
+
+    The seasons this process has seen can go stale when another process archives or swaps
+    one; when the write then fails for want of a partition, they're checked again and the
+    write retried once.
+    """
+    ensure_partitions(dates)
+    try:
+        return write()
+    except psycopg2.errors.CheckViolation as e:
+        if not partitioned_storage() or "no partition" not in str(e):
+            raise
+    ensure_partitions(dates, recheck=True)
+    return write()
+
+def partition_match_statistics():
+    """Converts match_statistics into a table range-partitioned by season, in one transaction.
+
+    The primary key becomes (match_id, date), since it has to include the partition key.
+    Indexes, foreign keys, row level security and the match_id sequence carry over. Writers
+    should be stopped while it runs; readers wait for it.
+    """
+    if partitioned_storage():
+        print("match_statistics is already partitioned.")
+        return
+    with transaction() as cursor:
+        cursor.execute("LOCK TABLE match_statistics IN ACCESS EXCLUSIVE MODE")
+        cursor.execute("""
+            SELECT pg_get_indexdef(indexrelid) FROM pg_index
+            WHERE indrelid = 'match_statistics'::regclass AND NOT indisprimary
+        """)
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+            WHERE conrelid = 'match_statistics'::regclass AND contype IN ('f', 'c')
+        """)
+        constraints = cursor.fetchall()
+        cursor.execute("SELECT relrowsecurity FROM pg_class WHERE oid = 'match_statistics'::regclass")
+        row_security = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_get_serial_sequence('match_statistics', 'match_id')")
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT DISTINCT EXTRACT(YEAR FROM date - INTERVAL '6 months')::int FROM match_statistics")
+        seasons = sorted(row[0] for row in cursor.fetchall())
+
+        cursor.execute("CREATE TABLE match_statistics_partitioned (LIKE match_statistics INCLUDING DEFAULTS) "
+                       "PARTITION BY RANGE (date)")
+        if sequence:
+            cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY match_statistics_partitioned.match_id")
+        cursor.execute("ALTER TABLE match_statistics RENAME TO match_statistics_unpartitioned")
+        cursor.execute("ALTER TABLE match_statistics_partitioned RENAME TO match_statistics")
+        for season in seasons:
+            _create_partition(cursor, season)
+        cursor.execute("INSERT INTO match_statistics SELECT * FROM match_statistics_unpartitioned")
+        moved = cursor.rowcount
+        cursor.execute("DROP TABLE match_statistics_unpartitioned")
+
+        cursor.execute("ALTER TABLE match_statistics ADD CONSTRAINT match_statistics_pkey PRIMARY KEY (match_id, date)")
+        for name, definition in constraints:
+            cursor.execute(f"ALTER TABLE match_statistics ADD CONSTRAINT {name} {definition}")
+        for definition in indexes:
+            cursor.execute(definition)
+        if row_security:
+            cursor.execute("ALTER TABLE match_statistics ENABLE ROW LEVEL SECURITY")
+
+    # The write plans and their prepared statements follow the new key from here on.
+    stat_columns._partitioned_storage = True
+    _known_seasons.update(seasons)
+    print(f"Partitioned match_statistics into {len(seasons)} seasons ({moved} rows).")
+    return seasons
+
+def list_partitions():
+    """Returns (name, season, estimated rows, size in bytes) of every attached season partition."""
+    with transaction() as cursor:
+        cursor.execute("""
+            SELECT c.relname, c.reltuples::bigint, pg_total_relation_size(c.oid)
+            FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'match_statistics'::regclass
+            ORDER BY c.relname
+        """)
+        return [(name, int(name.rsplit("_", 1)[1]), max(rows, 0), size) for name, rows, size in cursor.fetchall()]
+
+def _require_partitioned():
+    if not partitioned_storage():
+        raise RuntimeError("match_statistics isn't partitioned; run `python partitions.py migrate` first.")
+
+def archive_season(season, directory=PARTITION_ARCHIVE_DIR):
+    """Exports a season to a gzipped CSV file, then detaches and drops its partition.
+
+    The file is complete and synced before the partition is touched, so a failed export
+    leaves the table as it was. Match writes pause while the season is exported. The
+    season's matches leave the team aggregates with them (restore_season adds them back);
+    their per-half statistics are kept. Returns the file path.
+    """
+    _require_partitioned()
+    name = partition_name(season)
+    start, end = season_bounds(season)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.csv.gz")
+    with transaction() as cursor:
+        if season not in _attached_seasons(cursor):
+            raise ValueError(f"There is no partition for season {season}.")
+        # Writes wait until the season is gone, so none is lost from the file; reads carry on
+        # until the detach.
+        cursor.execute("LOCK TABLE match_statistics IN SHARE MODE")
+        with open(path + ".tmp", "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                cursor.copy_expert(f"COPY {name} TO STDOUT WITH (FORMAT csv, HEADER)", f)
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(path + ".tmp", path)
+        typed = typed_storage()
+        subtract_matches(cursor, registry.plan(typed), typed, "m.date >= %s AND m.date < %s", (start, end))
+        notify_matches(cursor, "m.date >= %s AND m.date < %s", (start, end))
+        cursor.execute(f"ALTER TABLE match_statistics DETACH PARTITION {name}")
+        cursor.execute(f"DROP TABLE {name}")
+    _known_seasons.discard(season)
+    print(f"Archived season {season} to {path}.")
+    return path
+
+def create_season_table(season, name=None):
+    """Creates an empty standalone table shaped like match_statistics to rebuild a season in.
+
+    Its CHECK constraint matches the partition bounds, so swap_season can attach it without
+    scanning it. Returns the table name.
+    """
+    _require_partitioned()
+    name = name or f"{partition_name(season)}_new"
+    start, end = season_bounds(season)
+    with transaction() as cursor:
+        cursor.execute(f"""
+            CREATE TABLE {name} (
+                LIKE match_statistics INCLUDING DEFAULTS,
+                CONSTRAINT {name}_season CHECK (date >= %s AND date < %s)
+            )
+        """, (start, end))
+    return name
+
+def _index_like_partitions(table):
+    """Builds the partitioned table's indexes on a standalone table, so attaching it doesn't."""
+    with transaction() as cursor:
+        cursor.execute(f"""
+            SELECT pg_get_indexdef(p.indexrelid), p.indisprimary FROM pg_index p
+            WHERE p.indrelid = 'match_statistics'::regclass
+              AND NOT EXISTS (SELECT 1 FROM pg_index t
+                              WHERE t.indrelid = '{table}'::regclass AND t.indkey = p.indkey)
+        """)
+        for definition, primary in cursor.fetchall():
+            if primary:
+                cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (match_id, date)")
+            else:
+                cursor.execute(re.sub(r"^CREATE (UNIQUE )?INDEX \S+ ON ONLY \S+", rf"CREATE \1INDEX ON {table}",
+                                      definition))
+
+def swap_season(season, table):
+    """Atomically replaces a season's partition (if any) with a rebuilt standalone table.
+
+    In one transaction the old rows' aggregate contribution is subtracted, the old partition
+    is detached and dropped, the new table is attached in its place and its contribution is
+    added. Rows of the new table whose match is stored under another season are moved.
+    Readers see either the old season or the new one.
+    """
+    _require_partitioned()
+    name = partition_name(season)
+    start, end = season_bounds(season)
+    _index_like_partitions(table)
+    typed = typed_storage()
+    plan = registry.plan(typed)
+    in_season = "m.date >= %s AND m.date < %s"
+    replaced = f"({in_season}) OR m.match_id IN (SELECT match_id FROM {table})"
+    if MAINTAIN_AGGREGATES:
+        # Before the exclusive lock, which filling a new aggregates table would wait on.
+        ensure_aggregate_tables(plan, typed)
+    with transaction() as cursor:
+        cursor.execute("LOCK TABLE match_statistics IN ACCESS EXCLUSIVE MODE")
+        subtract_matches(cursor, plan, typed, replaced, (start, end))
+        notify_matches(cursor, replaced, (start, end))
+        cursor.execute(f"DELETE FROM match_statistics m WHERE m.match_id IN (SELECT match_id FROM {table}) "
+                       f"AND NOT ({in_season})", (start, end))
+        if season in _attached_seasons(cursor):
+            cursor.execute(f"ALTER TABLE match_statistics DETACH PARTITION {name}")
+            cursor.execute(f"DROP TABLE {name}")
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {name}")
+        cursor.execute(f"ALTER TABLE match_statistics ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)",
+                       (start, end))
+        add_matches(cursor, plan, typed, in_season, (start, end))
+        notify_matches(cursor, in_season, (start, end))
+        cursor.execute(f"SELECT count(*) FROM {name}")
+        rows = cursor.fetchone()[0]
+    _known_seasons.add(season)
+    print(f"Swapped in season {season} ({rows} rows).")
+    return rows
+
+def restore_season(season, path):
+    """Loads an archive_season file into a new table and swaps it in as the season's partition."""
+    table = create_season_table(season, f"{partition_name(season)}_restore")
+    with gzip.open(path, "rt") as f:
+        columns = f.readline().strip()
+    with transaction() as cursor, gzip.open(path, "rb") as f:
+        cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv, HEADER)", f)
+    return swap_season(season, table)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage the season partitions of match_statistics.")
+    parser.add_argument("command", choices=["migrate", "list", "archive", "restore", "new-table", "swap"],
+                        help="migrate: partition the table; archive: export and drop a season; "
+                             "restore: load an archive back; new-table: create a table to rebuild a "
+                             "season in; swap: replace a season's partition with such a table")
+    parser.add_argument("season", type=int, nargs="?", help="season, by its starting year (2024 for 2024/25)")
+    parser.add_argument("--dir", default=PARTITION_ARCHIVE_DIR,
+                        help=f"archive directory (default: {PARTITION_ARCHIVE_DIR})")
+    parser.add_argument("--file", help="with restore, the archive file (default: the one in --dir)")
+    parser.add_argument("--table", help="with swap, the rebuilt table (default: match_statistics_<season>_new)")
+    args = parser.parse_args()
+    if args.command not in ("migrate", "list") and args.season is None:
+        parser.error(f"{args.command} needs a season")
+    return args
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.command == "migrate":
+        partition_match_statistics()
+    elif args.command == "list":
+        for name, season, rows, size in list_partitions():
+            print(f"{name}\t{season}/{(season + 1) % 100:02d}\t~{rows} rows\t{size / 1e6:.1f} MB")
+    elif args.command == "archive":
+        archive_season(args.season, args.dir)
+    elif args.command == "restore":
+        restore_season(args.season, args.file or os.path.join(args.dir, f"{partition_name(args.season)}.csv.gz"))
+    elif args.command == "new-table":
+        print(f"Created {create_season_table(args.season)}; fill it and run `python partitions.py swap {args.season}`.")
+    else:
+        swap_season(args.season, args.table or f"{partition_name(args.season)}_new")
@@ -0,0 +1,47 @@
+import re
+
+_COPY_RE = re.compile(r'^COPY ([\w.]+) \(([^)]*)\) FROM stdin;$')
+_ESCAPES = {"\\t": "\t", "\\n": "\n", "\\r": "\r", "\\\\": "\\"}
+
+def read_dump(path):
+    """Yields the parts of a plain-format pg_dump file.
+
+    ("sql", statement) for ordinary statements and ("copy", table, columns, data) for
+    COPY ... FROM stdin blocks, where data is the block's text without the closing "\\.".
+    """
+    statement = []
+    with open(path, encoding="utf-8") as f:
+        lines = iter(f)
+        for line in lines:
+            stripped = line.rstrip("\n")
+            if not statement and (not stripped or stripped.startswith("--")):
+                continue
+            match = _COPY_RE.match(stripped)
+            if match and not statement:
+                data = []
+                for row in lines:
+                    if row.rstrip("\n") == "\\.":
+                        break
+                    data.append(row)
+                columns = [column.strip() for column in match.group(2).split(",")]
+                yield "copy", match.group(1), columns, "".join(data)
+                continue
+            statement.append(line)
+            if stripped.endswith(";"):
+                yield "sql", "".join(statement)
+                statement = []
+
+def unescape_copy_value(value):
+    """Decodes one COPY text-format field."""
+    if value == "\\N":
+        return None
+    return re.sub(r"\\[tnr\\]", lambda m: _ESCAPES[m.group(0)], value)
+
+def copy_rows(path, table):
+    """Returns the rows of a table's COPY block in a pg_dump file as dicts."""
+    for part in read_dump(path):
+        if part[0] == "copy" and part[1].split(".")[-1] == table:
+            _, _, columns, data = part
+            return [dict(zip(columns, map(unescape_copy_value, line.split("\t"))))
+                    for line in data.splitlines() if line]
+    return []
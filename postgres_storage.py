@@ -0,0 +1,320 @@
+import io
+import threading
+import metrics
+from db_connection import transaction
+from db_operations import _row_params, period_rows
+from id_cache import league_ids, statistic_ids, team_ids
+from job_queue import complete_jobs
+from partitions import write_partitioned
+from queries import NOTIFY_WRITES, notify_matches, notify_sql
+from stat_columns import match_key, partitioned_storage, registry, stat_index, typed_storage
+from team_aggregates import (MAINTAIN_AGGREGATES, add_matches, ensure_aggregate_tables, lock_matches,
+                             rebuild_aggregates, replace_sql, subtract_matches)
+
+# The columns read_api's cache entries are keyed on besides match_id.
+IDENTITY_COLUMNS = {"date", "league_id", "home_team_id", "away_team_id"}
+
+# Lookup tables by name, as in sqlite_storage.LOOKUPS.
+LOOKUPS = {"leagues": league_ids, "teams": team_ids, "statistic_names": statistic_ids}
+
+_period_tables_ready = False
+_period_tables_lock = threading.Lock()
+_write_sql = {}
+
+def _copy_value(value):
+    """Formats a value for COPY text format."""
+    if value is None:
+        return "\\N"
+    return (str(value).replace("\\", "\\\\").replace("\t", "\\t")
+            .replace("\n", "\\n").replace("\r", "\\r"))
+
+def ensure_period_tables():
+    """Creates the statistic name lookup and match_period_statistics tables."""
+    global _period_tables_ready
+    if _period_tables_ready:
+        return
+    with _period_tables_lock:
+        if _period_tables_ready:
+            return
+        with transaction() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS statistic_names (
+                    stat_id serial PRIMARY KEY,
+                    stat_name text NOT NULL UNIQUE
+                )
+            """)
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS match_period_statistics (
+                    match_id integer NOT NULL,
+                    period text NOT NULL,
+                    stat_id integer NOT NULL REFERENCES statistic_names (stat_id),
+                    home numeric,
+                    away numeric,
+                    home_attempted integer,
+                    away_attempted integer,
+                    PRIMARY KEY (match_id, period, stat_id)
+                )
+            """)
+        _period_tables_ready = True
+
+def _write_statement(plan, typed, periods):
+    """Generates the single statement PostgresStore._write_match runs, with $n parameters for a PREPARE.
+
+    The parameters are the plan's row values and, with periods, the match_period_statistics
+    rows as seven arrays. All parts see the table as it was before the statement, so `old`
+    holds the match's previous row and `new` the one written. It returns whether the row is new.
+    """
+    cache_key = (plan.name, periods)
+    sql = _write_sql.get(cache_key)
+    if sql is not None:
+        return sql
+    count = len(plan.column_names)
+    updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in plan.column_names[1:])
+    parts = ["old AS (SELECT * FROM match_statistics WHERE match_id = $1)"]
+    if partitioned_storage():
+        # Rows are keyed by (match_id, date) there, so a rescheduled match would otherwise be
+        # stored twice.
+        parts.append("moved AS (DELETE FROM match_statistics WHERE match_id = $1 AND date <> $2)")
+    parts.append(f"""new AS (
+        INSERT INTO match_statistics ({', '.join(plan.column_names)})
+        VALUES ({', '.join(f'${i}' for i in range(1, count + 1))})
+        ON CONFLICT ({match_key()}) DO UPDATE SET {updates}
+        RETURNING *
+    )""")
+    if MAINTAIN_AGGREGATES:
+        parts.append(f"totals AS ({replace_sql(plan, typed, 'old', 'new')})")
+    if periods:
+        arrays = ", ".join(f"${count + i}::{sql_type}[]" for i, sql_type in
+                           enumerate(("int", "text", "int", "numeric", "numeric", "int", "int"), 1))
+        # Upserted rather than deleted and inserted: both would see the old rows, so the inserts
+        # would collide with them.
+        parts.append(f"""cleared AS (
+            DELETE FROM match_period_statistics
+            WHERE match_id = $1 AND (period, stat_id) NOT IN (SELECT * FROM unnest(${count + 2}::text[], ${count + 3}::int[]))
+        )""")
+        parts.append(f"""period_rows AS (
+            INSERT INTO match_period_statistics
+                (match_id, period, stat_id, home, away, home_attempted, away_attempted)
+            SELECT * FROM unnest({arrays})
+            ON CONFLICT (match_id, period, stat_id) DO UPDATE
+            SET home = EXCLUDED.home, away = EXCLUDED.away,
+                home_attempted = EXCLUDED.home_attempted, away_attempted = EXCLUDED.away_attempted
+        )""")
+    result = "NOT EXISTS (SELECT 1 FROM old)"
+    if NOTIFY_WRITES:
+        # For the old date, league and teams too, in case the write changes them; PostgreSQL
+        # drops the duplicates when it doesn't.
+        parts.append(f"notified AS ({notify_sql('(SELECT * FROM old UNION ALL SELECT * FROM new)')})")
+        result += ", (SELECT count(*) FROM notified)"
+    sql = f"WITH {', '.join(parts)} SELECT {result}"
+    _write_sql[cache_key] = sql
+    return sql
+
+class PostgresStore:
+    """PostgreSQL storage backend: match_statistics (text or typed, optionally partitioned) through the pool.
+
+    Team season aggregates are kept in the writing transaction, under a per-match advisory
+    lock, and every write queues a match_written notification for read_api's cache.
+    """
+
+    def resolve(self, table, names, cursor=None):
+        """Returns {name: id} for a lookup table, creating unknown names (see IdCache.resolve)."""
+        return LOOKUPS[table].resolve(names, cursor)
+
+    def resolve_match_ids(self, league, home_team, away_team):
+        """Returns (league_id, home_team_id, away_team_id) for one match."""
+        teams = team_ids.resolve([home_team, away_team])
+        return league_ids.resolve([league])[league], teams[home_team], teams[away_team]
+
+    def table_columns(self):
+        """Returns the columns match_statistics currently has."""
+        with transaction() as cursor:
+            cursor.execute("SELECT column_name FROM information_schema.columns "
+                           "WHERE table_name = 'match_statistics'")
+            return {row[0] for row in cursor.fetchall()}
+
+    def add_columns(self, columns, typed=True):
+        """Adds stat columns to match_statistics."""
+        # New stats are numeric in typed mode; 'N/A'-style strings otherwise.
+        sql_type = "numeric" if typed else "text"
+        actions = [f"ADD COLUMN IF NOT EXISTS {column} {sql_type}" for column in columns]
+        with transaction() as cursor:
+            cursor.execute(f"ALTER TABLE match_statistics {', '.join(actions)}")
+
+    def write_match(self, match_id, match_date, league_id, home_team_id, away_team_id, statistics,
+                    scores=None, periods=None, job_queue=None):
+        """Inserts or updates one match with resolved IDs; returns "inserted" or "updated".
+
+        With job_queue, the match's job is marked done in the same transaction, unless this
+        worker's lease on it was lost.
+        """
+        def write():
+            with transaction() as cursor:
+                action = self._write_match(cursor, match_id, match_date, league_id, home_team_id, away_team_id,
+                                           statistics, scores, periods)
+                if job_queue:
+                    complete_jobs(cursor, job_queue, [match_id])
+            return action
+
+        return write_partitioned([match_date], write)
+
+    def _write_match(self, cursor, match_id, match_date, league_id, home_team_id, away_team_id, statistics,
+                     scores=None, periods=None):
+        """Writes one match using the caller's cursor; the caller owns the transaction.
+
+        After taking the match's lock, the row, the team season aggregates (the previous
+        contribution out, the new one in), the per-period statistics and the notifications are
+        written by one prepared statement (see _write_statement). Returns "inserted" or "updated".
+        """
+        typed = typed_storage()
+        plan = registry.plan(typed)
+        with metrics.span("clean"):
+            params = _row_params(plan, typed, match_id, match_date, league_id, home_team_id, away_team_id,
+                                 statistics, scores)
+        if periods:
+            ensure_period_tables()
+            db_ids = statistic_ids.resolve({stat_index.refs[stat_id].name for stats in periods.values()
+                                            for stat_id in stats}, cursor)
+            rows = period_rows({match_id: periods}, db_ids)
+            params += tuple(list(column) for column in zip(*rows)) or ([],) * 7
+        if MAINTAIN_AGGREGATES:
+            ensure_aggregate_tables(plan, typed)
+        # Taken in its own statement: the write statement's snapshot has to come after it.
+        lock_matches(cursor, [match_id])
+
+        name = f"write_{plan.name}{'_periods' if periods else ''}"
+        prepared = cursor.connection.prepared_statements
+        if name not in prepared:
+            cursor.execute(f"PREPARE {name} AS {_write_statement(plan, typed, bool(periods))}")
+            prepared.add(name)
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        return "inserted" if cursor.fetchone()[0] else "updated"
+
+    def write_matches(self, matches, job_queue=None):
+        """Bulk inserts or updates insert_matches-style tuples with COPY and one merge; returns the rows written.
+
+        Everything is written in a single transaction, which with job_queue also marks the
+        matches' jobs done.
+        """
+        typed = typed_storage()
+        for match in matches:
+            registry.ensure_stats(match[5], typed)
+        plan = registry.plan(typed)
+
+        # Resolve every distinct league and team for the whole batch up front.
+        with metrics.span("bulk_resolve_ids"):
+            batch_league_ids = league_ids.resolve({match[4] for match in matches})
+            batch_team_ids = team_ids.resolve({team for match in matches for team in (match[2], match[3])})
+
+        with metrics.span("bulk_clean"):
+            periods = {}
+            buffer = io.StringIO()
+            for match_id, match_date, home_team, away_team, league, statistics, *rest in matches:
+                row = _row_params(plan, typed, match_id, match_date, batch_league_ids[league],
+                                  batch_team_ids[home_team], batch_team_ids[away_team], statistics,
+                                  rest[0] if rest else None)
+                if len(rest) > 1 and rest[1]:
+                    periods[match_id] = rest[1]
+                buffer.write("\t".join(_copy_value(value) for value in row))
+                buffer.write("\n")
+
+        def write():
+            buffer.seek(0)
+            with transaction() as cursor:
+                return self._merge_staged(cursor, plan, typed, buffer, matches, periods, job_queue)
+
+        return write_partitioned({match[1] for match in matches}, write)
+
+    def _merge_staged(self, cursor, plan, typed, buffer, matches, periods, job_queue):
+        """COPies the buffered rows into a staging table and merges them; returns the rows written."""
+        columns = ", ".join(plan.column_names)
+        updates = ", ".join(f"{col} = EXCLUDED.{col}" for col in plan.column_names[1:])
+        cursor.execute("CREATE TEMP TABLE match_statistics_staging "
+                       "(LIKE match_statistics INCLUDING DEFAULTS) ON COMMIT DROP")
+        cursor.copy_expert(f"COPY match_statistics_staging ({columns}) FROM STDIN", buffer)
+        staged = "m.match_id IN (SELECT match_id FROM match_statistics_staging)"
+        lock_matches(cursor, [match[0] for match in matches])
+        subtract_matches(cursor, plan, typed, staged, ())
+        # The existing rows' old values, as in _write_match.
+        notify_matches(cursor, staged, ())
+        if partitioned_storage():
+            cursor.execute("DELETE FROM match_statistics m USING match_statistics_staging s "
+                           "WHERE m.match_id = s.match_id AND m.date <> s.date")
+        # DISTINCT ON keeps a batch containing the same match twice from hitting a row twice.
+        cursor.execute(f"""
+            INSERT INTO match_statistics ({columns})
+            SELECT DISTINCT ON (match_id) {columns} FROM match_statistics_staging ORDER BY match_id
+            ON CONFLICT ({match_key()}) DO UPDATE SET {updates}
+        """)
+        written = cursor.rowcount
+        add_matches(cursor, plan, typed, staged, ())
+        notify_matches(cursor, staged, ())
+        if periods:
+            self._write_periods(cursor, periods)
+        if job_queue:
+            complete_jobs(cursor, job_queue, [match[0] for match in matches])
+        return written
+
+    def _write_periods(self, cursor, periods_by_match):
+        """Replaces the per-period statistics of matches ({match_id: {period: {stat ID: (home, away)}}})."""
+        ensure_period_tables()
+        refs = stat_index.refs
+        names = {refs[stat_id].name for periods in periods_by_match.values()
+                 for stats in periods.values() for stat_id in stats}
+        db_ids = statistic_ids.resolve(names, cursor)
+        columns = [list(column) for column in zip(*period_rows(periods_by_match, db_ids))] or [[]] * 7
+
+        cursor.execute("DELETE FROM match_period_statistics WHERE match_id = ANY(%s)", (list(periods_by_match),))
+        cursor.execute("""
+            INSERT INTO match_period_statistics
+                (match_id, period, stat_id, home, away, home_attempted, away_attempted)
+            SELECT * FROM unnest(%s::int[], %s::text[], %s::int[], %s::numeric[], %s::numeric[], %s::int[], %s::int[])
+        """, columns)
+
+    def write_periods(self, match_id, periods):
+        """Replaces the per-period statistics of one match in its own transaction."""
+        with transaction() as cursor:
+            self._write_periods(cursor, {match_id: periods})
+
+    def update_match_columns(self, match_id, changes):
+        """Writes only the given {column: value} changes of an existing match; returns True if a row was updated."""
+        columns = list(changes)
+        typed = typed_storage()
+        plan = registry.plan(typed)
+        with transaction() as cursor:
+            lock_matches(cursor, [match_id])
+            subtract_matches(cursor, plan, typed, "m.match_id = %s", (match_id,))
+            if IDENTITY_COLUMNS.intersection(changes):
+                # The old values, as in _write_match.
+                notify_matches(cursor, "m.match_id = %s", (match_id,))
+            cursor.execute(
+                f"UPDATE match_statistics SET {', '.join(f'{col} = %s' for col in columns)} WHERE match_id = %s",
+                [changes[col] for col in columns] + [match_id]
+            )
+            updated = cursor.rowcount == 1
+            add_matches(cursor, plan, typed, "m.match_id = %s", (match_id,))
+            notify_matches(cursor, "m.match_id = %s", (match_id,))
+        return updated
+
+    def delete_matches(self, match_ids):
+        """Deletes matches with their period statistics and aggregate contribution; returns the rows deleted."""
+        typed = typed_storage()
+        plan = registry.plan(typed)
+        ensure_period_tables()
+        with transaction() as cursor:
+            lock_matches(cursor, match_ids)
+            subtract_matches(cursor, plan, typed, "m.match_id = ANY(%s)", (list(match_ids),))
+            # Sent before the delete, while the rows still carry the keys read_api's entries use.
+            notify_matches(cursor, "m.match_id = ANY(%s)", (list(match_ids),))
+            cursor.execute("DELETE FROM match_period_statistics WHERE match_id = ANY(%s)", (list(match_ids),))
+            cursor.execute("DELETE FROM match_statistics WHERE match_id = ANY(%s)", (list(match_ids),))
+            return cursor.rowcount
+
+    def migrate_to_typed_storage(self):
+        """Converts match_statistics' text stat columns to typed columns in place."""
+        registry.migrate_to_typed_storage()
+
+    def rebuild_aggregates(self):
+        """Recomputes the team season aggregates from match_statistics."""
+        typed = typed_storage()
+        return rebuild_aggregates(registry.plan(typed), typed)
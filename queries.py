@@ -0,0 +1,208 @@
+import os
+import threading
+from datetime import date
+from dotenv import load_dotenv
+from db_connection import get_connection, transaction
+from stat_columns import partitioned_storage, registry, typed_storage
+from team_aggregates import SEASON_SQL
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Send a match_written notification for every PostgreSQL match write, for read_api's cache.
+NOTIFY_WRITES = os.getenv("NOTIFY_MATCH_WRITES", "1") == "1"
+CHANNEL = "match_written"
+
+MAX_PAGE_SIZE = 100
+
+# Composite indexes for the lookups below; (date, match_id) is the pagination key everywhere.
+INDEXES = {
+    "match_statistics_home_team_date": "(home_team_id, date DESC, match_id DESC)",
+    "match_statistics_away_team_date": "(away_team_id, date DESC, match_id DESC)",
+    "match_statistics_pair_date": "(home_team_id, away_team_id, date DESC, match_id DESC)",
+    "match_statistics_league_date": "(league_id, date DESC, match_id DESC)",
+    "match_statistics_date": "(date, match_id)",
+}
+
+# Keyset bounds used when a page has no cursor: newer than any match, and older than any.
+NEWEST = (date.max, 2 ** 31 - 1)
+OLDEST = (date.min, 0)
+
+_indexes_ready = False
+_indexes_lock = threading.Lock()
+
+def ensure_query_indexes():
+    """Creates the indexes the read queries use (CONCURRENTLY, so writers keep going).
+
+    A partitioned table can't be indexed concurrently; its indexes are created normally and
+    every partition, including ones created later, gets them.
+    """
+    global _indexes_ready
+    if _indexes_ready:
+        return
+    with _indexes_lock:
+        if _indexes_ready:
+            return
+        with transaction() as cursor:
+            cursor.execute("SELECT indexname FROM pg_indexes WHERE tablename = 'match_statistics'")
+            existing = {row[0] for row in cursor.fetchall()}
+        missing = {name: columns for name, columns in INDEXES.items() if name not in existing}
+        if missing:
+            with get_connection() as conn:
+                # CREATE INDEX CONCURRENTLY can't run inside a transaction block.
+                conn.autocommit = True
+                try:
+                    with conn.cursor() as cursor:
+                        for name, columns in missing.items():
+                            concurrently = "" if partitioned_storage() else "CONCURRENTLY "
+                            cursor.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+                                           f"ON match_statistics {columns}")
+                finally:
+                    conn.autocommit = False
+            print(f"Created indexes: {', '.join(missing)}")
+        _indexes_ready = True
+
+def notify_matches(cursor, where, params):
+    """Queues a match_written notification for every match_statistics row matching `where` (alias m).
+
+    PostgreSQL delivers them when the caller's transaction commits, and drops them on rollback.
+    The payload is "match_id,date,league_id,home_team_id,away_team_id".
+    """
+    if not NOTIFY_WRITES:
+        return
+    cursor.execute(f"{notify_sql('match_statistics')} WHERE {where}", params)
+
+def notify_sql(source):
+    """Returns the SELECT queuing notify_matches' notification for every row of `source` (alias m)."""
+    return f"""
+        SELECT pg_notify('{CHANNEL}', concat_ws(',', m.match_id, m.date, COALESCE(m.league_id, -1),
+                                                COALESCE(m.home_team_id, -1), COALESCE(m.away_team_id, -1)))
+        FROM {source} m
+    """
+
+def parse_notification(payload):
+    """Returns (match_id, date, league_id, home_team_id, away_team_id) from a notification payload."""
+    match_id, day, league_id, home_team_id, away_team_id = payload.split(",")
+    return int(match_id), date.fromisoformat(day), int(league_id), int(home_team_id), int(away_team_id)
+
+def encode_cursor(row):
+    """Returns the keyset cursor continuing after a row, e.g. "2024-05-01.12499391"."""
+    return f"{row['date']}.{row['match_id']}"
+
+def decode_cursor(cursor_text, default):
+    """Parses a keyset cursor; returns `default` for None. Raises ValueError when malformed."""
+    if not cursor_text:
+        return default
+    day, _, match_id = cursor_text.partition(".")
+    return date.fromisoformat(day), int(match_id)
+
+def _select_list(plan):
+    columns = [f"m.{name}" for name in plan.column_names]
+    return ", ".join(columns + ["l.league_name AS league", "ht.team_name AS home_team", "at.team_name AS away_team"])
+
+_JOINS = """
+    LEFT JOIN leagues l ON l.league_id = m.league_id
+    LEFT JOIN teams ht ON ht.team_id = m.home_team_id
+    LEFT JOIN teams at ON at.team_id = m.away_team_id
+"""
+
+# Each lookup: parameter types and the statement, with {select} for the column list.
+# Newest-first lookups page with (date, match_id) < cursor, the date range oldest-first with >.
+# The plain date bound repeats the cursor's so a partitioned table skips seasons past it.
+LOOKUPS = {
+    "team_history": (["integer", "date", "integer", "integer"], """
+        SELECT {select} FROM (
+            (SELECT * FROM match_statistics WHERE home_team_id = $1
+               AND date <= $2 AND (date, match_id) < ($2, $3)
+             ORDER BY date DESC, match_id DESC LIMIT $4)
+            UNION ALL
+            (SELECT * FROM match_statistics WHERE away_team_id = $1
+               AND date <= $2 AND (date, match_id) < ($2, $3)
+             ORDER BY date DESC, match_id DESC LIMIT $4)
+        ) m {joins}
+        ORDER BY m.date DESC, m.match_id DESC LIMIT $4
+    """),
+    "head_to_head": (["integer", "integer", "date", "integer", "integer"], """
+        SELECT {select} FROM (
+            (SELECT * FROM match_statistics WHERE home_team_id = $1 AND away_team_id = $2
+               AND date <= $3 AND (date, match_id) < ($3, $4) ORDER BY date DESC, match_id DESC LIMIT $5)
+            UNION ALL
+            (SELECT * FROM match_statistics WHERE home_team_id = $2 AND away_team_id = $1
+               AND date <= $3 AND (date, match_id) < ($3, $4) ORDER BY date DESC, match_id DESC LIMIT $5)
+        ) m {joins}
+        ORDER BY m.date DESC, m.match_id DESC LIMIT $5
+    """),
+    "league_matches": (["integer", "date", "date", "date", "integer", "integer"], """
+        SELECT {select} FROM match_statistics m {joins}
+        WHERE m.league_id = $1 AND m.date >= $2 AND m.date < $3 AND m.date <= $4
+          AND (m.date, m.match_id) < ($4, $5)
+        ORDER BY m.date DESC, m.match_id DESC LIMIT $6
+    """),
+    "date_range": (["date", "date", "date", "integer", "integer"], """
+        SELECT {select} FROM match_statistics m {joins}
+        WHERE m.date >= $1 AND m.date <= $2 AND m.date >= $3 AND (m.date, m.match_id) > ($3, $4)
+        ORDER BY m.date, m.match_id LIMIT $5
+    """),
+    "match": (["integer"], """
+        SELECT {select} FROM match_statistics m {joins} WHERE m.match_id = $1
+    """),
+}
+
+def _run(lookup, params):
+    """Runs a lookup through a per-connection prepared statement; returns the rows as dicts."""
+    plan = registry.plan(typed_storage())
+    # Named after the registry version too, so added stat columns get a new statement.
+    name = f"q_{lookup}_{plan.name}"
+    with transaction() as cursor:
+        prepared = cursor.connection.prepared_statements
+        if name not in prepared:
+            types, sql = LOOKUPS[lookup]
+            cursor.execute(f"PREPARE {name} ({', '.join(types)}) AS "
+                           f"{sql.format(select=_select_list(plan), joins=_JOINS)}")
+            prepared.add(name)
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+        columns = [column.name for column in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def _page(rows, limit):
+    return {"matches": rows, "next": encode_cursor(rows[-1]) if len(rows) == limit else None}
+
+def _limit(limit):
+    return max(1, min(int(limit), MAX_PAGE_SIZE))
+
+def team_history(team_id, limit=10, after=None):
+    """Returns a page of a team's matches, home and away, newest first."""
+    limit = _limit(limit)
+    return _page(_run("team_history", (team_id, *decode_cursor(after, NEWEST), limit)), limit)
+
+def head_to_head(team_id, other_team_id, limit=10, after=None):
+    """Returns a page of the matches between two teams, at either ground, newest first."""
+    limit = _limit(limit)
+    return _page(_run("head_to_head", (team_id, other_team_id, *decode_cursor(after, NEWEST), limit)), limit)
+
+def league_matches(league_id, season=None, limit=50, after=None):
+    """Returns a page of a league's matches, newest first, optionally of one season (its starting year)."""
+    limit = _limit(limit)
+    if season is None:
+        start, end = date.min, date.max
+    else:
+        # Seasons start in July, as in team_aggregates.SEASON_SQL.
+        start, end = date(season, 7, 1), date(season + 1, 7, 1)
+    return _page(_run("league_matches", (league_id, start, end, *decode_cursor(after, NEWEST), limit)), limit)
+
+def matches_between(start, end, limit=100, after=None):
+    """Returns a page of the matches played between two dates (inclusive), oldest first."""
+    limit = _limit(limit)
+    return _page(_run("date_range", (start, end, *decode_cursor(after, OLDEST), limit)), limit)
+
+def get_match(match_id):
+    """Returns one match with its team and league names, or None."""
+    rows = _run("match", (match_id,))
+    return rows[0] if rows else None
+
+def league_seasons(league_id):
+    """Returns the seasons a league has matches in, newest first."""
+    with transaction() as cursor:
+        cursor.execute(f"SELECT DISTINCT {SEASON_SQL} AS season FROM match_statistics m "
+                       f"WHERE m.league_id = %s ORDER BY season DESC", (league_id,))
+        return [row[0] for row in cursor.fetchall()]
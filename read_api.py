@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import select
+import argparse
+import threading
+from collections import OrderedDict, deque
+from datetime import date
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from dotenv import load_dotenv
+import psycopg2
+import metrics
+import queries
+from db_connection import get_db_connection
+
+# Load environment variables from .env file
+load_dotenv()
+
+READ_API_HOST = os.getenv("READ_API_HOST", "127.0.0.1")
+READ_API_PORT = int(os.getenv("READ_API_PORT", "8080"))
+# Responses kept in memory; the least recently used one is dropped first.
+READ_API_CACHE_SIZE = int(os.getenv("READ_API_CACHE_SIZE", "5000"))
+# Recent invalidations a put is checked against; a response computed before older ones isn't cached.
+INVALIDATION_LOG_SIZE = 1024
+
+class ResponseLRU:
+    """Thread-safe LRU of encoded responses, each tagged with the teams, leagues and dates it covers."""
+
+    def __init__(self, max_entries=READ_API_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; put compares it with the invalidations logged since.
+        self.generation = 0
+        self._cleared = 0
+        self._recent = deque(maxlen=INVALIDATION_LOG_SIZE)
+        self.counters = {"hits": 0, "misses": 0, "invalidated": 0, "evicted": 0, "stale_puts": 0}
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def put(self, key, body, tags, dates=None, generation=None):
+        """Stores a body; tags are ("team", id) / ("league", id) / ("match", id) pairs, dates an inclusive range.
+
+        With the generation read before the body was queried, the body is dropped if an
+        invalidation of its tags or dates came in meanwhile, as it may predate the write that
+        caused it.
+        """
+        tags = frozenset(tags)
+        with self._lock:
+            if generation is not None and generation != self.generation and self._stale(generation, tags, dates):
+                self.counters["stale_puts"] += 1
+                return
+            self._entries[key] = (body, tags, dates)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evicted"] += 1
+
+    def _stale(self, generation, tags, dates):
+        """Whether an invalidation since `generation` covers these tags or dates; call with the lock held."""
+        if self._cleared > generation or not self._recent or self._recent[0][0] > generation + 1:
+            # Cleared, or the invalidations since then are no longer all logged.
+            return True
+        for logged, invalidated_tags, day in reversed(self._recent):
+            if logged <= generation:
+                break
+            if invalidated_tags & tags or (dates is not None and dates[0] <= day <= dates[1]):
+                return True
+        return False
+
+    def invalidate(self, match_id, day, league_id, home_team_id, away_team_id):
+        """Drops every response a write of this match could have changed."""
+        tags = {("match", match_id), ("team", home_team_id), ("team", away_team_id), ("league", league_id)}
+        with self._lock:
+            self.generation += 1
+            self._recent.append((self.generation, tags, day))
+            stale = [key for key, (_, entry_tags, dates) in self._entries.items()
+                     if entry_tags & tags or (dates is not None and dates[0] <= day <= dates[1])]
+            for key in stale:
+                del self._entries[key]
+            self.counters["invalidated"] += len(stale)
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._cleared = self.generation
+            self.counters["invalidated"] += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "max_entries": self.max_entries}
+
+cache = ResponseLRU()
+metrics.register_collector("read_api_cache", cache.stats)
+
+def listen_for_writes(lru=cache, stop=None):
+    """Invalidates the cache on every match_written notification, reconnecting if the connection drops.
+
+    After a reconnect the whole cache is cleared, as notifications sent meanwhile were missed.
+    """
+    while stop is None or not stop.is_set():
+        conn = None
+        try:
+            conn = get_db_connection()
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f"LISTEN {queries.CHANNEL}")
+            lru.clear()
+            while stop is None or not stop.is_set():
+                if select.select([conn], [], [], 5)[0]:
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        lru.invalidate(*queries.parse_notification(notification.payload))
+        except psycopg2.Error as e:
+            print(f"Cache invalidation listener lost its connection ({e}); reconnecting.")
+            time.sleep(1)
+        finally:
+            if conn is not None:
+                conn.close()
+
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _int(params, name, default=None):
+    value = params.get(name, [None])[0]
+    return default if value is None else int(value)
+
+def _date(params, name):
+    value = params.get(name, [None])[0]
+    return None if value is None else date.fromisoformat(value)
+
+def route(path, params):
+    """Answers one request; returns (body object, tags, date range or None), or None for unknown paths.
+
+    Raises ValueError for malformed parameters.
+    """
+    parts = [part for part in path.split("/") if part]
+    after = params.get("after", [None])[0]
+    if len(parts) == 3 and parts[0] == "teams" and parts[2] == "matches":
+        team_id = int(parts[1])
+        return (queries.team_history(team_id, _int(params, "limit", 10), after),
+                [("team", team_id)], None)
+    if len(parts) == 3 and parts[0] == "head-to-head":
+        team_id, other_team_id = int(parts[1]), int(parts[2])
+        return (queries.head_to_head(team_id, other_team_id, _int(params, "limit", 10), after),
+                [("team", team_id), ("team", other_team_id)], None)
+    if len(parts) == 3 and parts[0] == "leagues" and parts[2] == "matches":
+        league_id = int(parts[1])
+        return (queries.league_matches(league_id, _int(params, "season"), _int(params, "limit", 50), after),
+                [("league", league_id)], None)
+    if len(parts) == 3 and parts[0] == "leagues" and parts[2] == "seasons":
+        league_id = int(parts[1])
+        return {"seasons": queries.league_seasons(league_id)}, [("league", league_id)], None
+    if parts == ["matches"]:
+        start, end = _date(params, "from"), _date(params, "to")
+        if start is None or end is None:
+            raise ValueError("from and to are required")
+        return queries.matches_between(start, end, _int(params, "limit", 100), after), [], (start, end)
+    if len(parts) == 2 and parts[0] == "matches":
+        match_id = int(parts[1])
+        return {"match": queries.get_match(match_id)}, [("match", match_id)], None
+    return None
+
+class _ReadHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        start = time.perf_counter()
+        url = urlsplit(self.path)
+        if url.path == "/stats":
+            self._send(200, json.dumps(cache.stats()).encode(), "bypass")
+            return
+
+        # Parameters are sorted so equivalent URLs share a cache entry.
+        params = parse_qs(url.query)
+        key = url.path + "?" + "&".join(f"{name}={value}" for name in sorted(params) for value in params[name])
+        body = cache.get(key)
+        status = "hit"
+        if body is None:
+            status = "miss"
+            generation = cache.generation
+            try:
+                result = route(url.path, params)
+            except ValueError as e:
+                self._send(400, json.dumps({"error": str(e)}).encode(), "bypass")
+                return
+            except psycopg2.Error as e:
+                print(f"Query for {self.path} failed: {e}")
+                metrics.inc("read_api_errors_total")
+                self._send(500, b'{"error": "database error"}', "bypass")
+                return
+            if result is None:
+                self._send(404, b'{"error": "not found"}', "bypass")
+                return
+            payload, tags, dates = result
+            body = json.dumps(payload, default=_json_default, separators=(",", ":")).encode()
+            cache.put(key, body, tags, dates, generation)
+        self._send(200, body, status)
+        metrics.observe("read_api_seconds", time.perf_counter() - start, cache=status)
+
+    def _send(self, code, body, cache_status):
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", cache_status)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def serve(host=READ_API_HOST, port=READ_API_PORT):
+    """Creates the indexes, starts the invalidation listener and serves requests until interrupted."""
+    queries.ensure_query_indexes()
+    threading.Thread(target=listen_for_writes, daemon=True).start()
+    server = ThreadingHTTPServer((host, port), _ReadHandler)
+    server.daemon_threads = True
+    print(f"Serving match queries at http://{host}:{server.server_address[1]}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Read-only JSON API over the match database.")
+    parser.add_argument("--host", default=READ_API_HOST, help=f"address to listen on (default: {READ_API_HOST})")
+    parser.add_argument("--port", type=int, default=READ_API_PORT, help=f"port (default: {READ_API_PORT})")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    metrics.start_from_env()
+    serve(args.host, args.port)
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from dotenv import load_dotenv
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Load environment variables from .env file
+load_dotenv()
+
+# How long payloads stay fresh, by SofaScore event status type. Finished matches never change.
+STATUS_TTLS = {
+    "finished": None,
+    "inprogress": 30,
+    "notstarted": 15 * 60,
+}
+# Anything else (postponed, canceled, interrupted, unknown) is rechecked hourly.
+DEFAULT_TTL = 60 * 60
+# A hit only rewrites an entry's last_access once it is older than this, so most reads don't write.
+ACCESS_UPDATE_INTERVAL = 60
+
+class CacheMiss(LookupError):
+    """Raised in offline mode when a payload is not in the cache."""
+
+def ttl_for_status(status):
+    """Returns the time-to-live in seconds for a payload of the given event status (None = never expires)."""
+    if status in STATUS_TTLS:
+        return STATUS_TTLS[status]
+    return DEFAULT_TTL
+
+class ResponseCache:
+    """Compressed SQLite blob store for SofaScore payloads, keyed by endpoint and match ID.
+
+    Triggers keep the total payload size in the one-row cache_size table, so checking it
+    against max_bytes doesn't scan the cache.
+    """
+
+    def __init__(self, path, max_bytes=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._evict_lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = self._connection()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                endpoint TEXT NOT NULL,
+                match_id INTEGER NOT NULL,
+                status TEXT,
+                payload BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                expires_at REAL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (endpoint, match_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        conn.execute("CREATE TABLE IF NOT EXISTS cache_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL)")
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS responses_added AFTER INSERT ON responses
+            BEGIN UPDATE cache_size SET bytes = bytes + NEW.size; END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS responses_replaced AFTER UPDATE OF size ON responses
+            BEGIN UPDATE cache_size SET bytes = bytes + NEW.size - OLD.size; END
+        """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS responses_removed AFTER DELETE ON responses
+            BEGIN UPDATE cache_size SET bytes = bytes - OLD.size; END
+        """)
+        # Counted once for caches created before the table; the triggers keep it from then on.
+        conn.execute("INSERT OR IGNORE INTO cache_size SELECT 0, COALESCE(SUM(size), 0) FROM responses")
+        conn.commit()
+
+    def _connection(self):
+        """Returns this thread's SQLite connection."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, endpoint, match_id, allow_stale=False):
+        """Returns the cached payload, or None if it is missing or expired."""
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT payload, expires_at, last_access FROM responses WHERE endpoint = ? AND match_id = ?",
+            (endpoint, match_id)
+        ).fetchone()
+        if row is None:
+            return None
+        payload, expires_at, last_access = row
+        now = time.time()
+        if expires_at is not None and expires_at < now and not allow_stale:
+            return None
+        if now - last_access >= ACCESS_UPDATE_INTERVAL:
+            conn.execute("UPDATE responses SET last_access = ? WHERE endpoint = ? AND match_id = ?",
+                         (now, endpoint, match_id))
+            conn.commit()
+        return (orjson or json).loads(zlib.decompress(payload))
+
+    def get_status(self, match_id):
+        """Returns the last known event status for a match, if any."""
+        row = self._connection().execute(
+            "SELECT status FROM responses WHERE endpoint = 'event' AND match_id = ?", (match_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put(self, endpoint, match_id, payload, status=None):
+        """Stores a payload with an expiry derived from the match status."""
+        if orjson is not None:
+            blob = zlib.compress(orjson.dumps(payload), 6)
+        else:
+            blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), 6)
+        now = time.time()
+        ttl = ttl_for_status(status)
+        expires_at = None if ttl is None else now + ttl
+        conn = self._connection()
+        # An upsert rather than INSERT OR REPLACE, whose implicit delete wouldn't fire the size trigger.
+        conn.execute("""
+            INSERT INTO responses (endpoint, match_id, status, payload, size, stored_at, expires_at, last_access)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (endpoint, match_id) DO UPDATE SET
+                status = excluded.status, payload = excluded.payload, size = excluded.size,
+                stored_at = excluded.stored_at, expires_at = excluded.expires_at, last_access = excluded.last_access
+        """, (endpoint, match_id, status, blob, len(blob), now, expires_at, now))
+        conn.commit()
+        if self.max_bytes and self._total(conn) > self.max_bytes:
+            self.evict()
+
+    @staticmethod
+    def _total(conn):
+        return conn.execute("SELECT bytes FROM cache_size").fetchone()[0]
+
+    def evict(self):
+        """Drops least recently used entries until the cache fits in max_bytes."""
+        with self._evict_lock:
+            conn = self._connection()
+            total = self._total(conn)
+            removed = 0
+            while total > self.max_bytes:
+                # Oldest first, a page at a time, rather than reading every entry.
+                rows = conn.execute("SELECT endpoint, match_id, size FROM responses "
+                                    "ORDER BY last_access LIMIT 100").fetchall()
+                if not rows:
+                    break
+                for endpoint, match_id, size in rows:
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE endpoint = ? AND match_id = ?", (endpoint, match_id))
+                    total -= size
+                    removed += 1
+            conn.commit()
+            return removed
+
+    def stats(self):
+        """Returns the number of entries and their compressed size in bytes."""
+        conn = self._connection()
+        count = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"entries": count, "bytes": self._total(conn)}
+
+def cache_from_env():
+    """Builds the cache configured in .env, or returns None when caching is disabled."""
+    path = os.getenv("SOFASCORE_CACHE_PATH", ".cache/sofascore.sqlite3")
+    if not path:
+        return None
+    max_mb = float(os.getenv("SOFASCORE_CACHE_MAX_MB", "512"))
+    return ResponseCache(path, max_bytes=int(max_mb * 1024 * 1024) if max_mb > 0 else None)
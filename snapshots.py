@@ -0,0 +1,246 @@
+import os
+import json
+import shutil
+import argparse
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from db_connection import get_connection, transaction
+from stat_columns import KEY_COLUMNS, numeric_sql
+from team_aggregates import SEASON_SQL
+
+# Rows fetched from the server-side cursor and written per record batch.
+BATCH_ROWS = 5000
+
+MANIFEST = "manifest.json"
+FORMATS = {"arrow": "part.arrow", "parquet": "part.parquet"}
+
+# Columns every snapshot starts with; all statistic and score columns follow as float64.
+BASE_FIELDS = [
+    pa.field("match_id", pa.int32()),
+    pa.field("date", pa.date32()),
+    pa.field("season", pa.int32()),
+    pa.field("league_id", pa.int32()),
+    pa.field("league", pa.string()),
+    pa.field("home_team_id", pa.int32()),
+    pa.field("home_team", pa.string()),
+    pa.field("away_team_id", pa.int32()),
+    pa.field("away_team", pa.string()),
+]
+BASE_SQL = [
+    "m.match_id", "m.date", SEASON_SQL, "m.league_id", "l.league_name",
+    "m.home_team_id", "ht.team_name", "m.away_team_id", "at.team_name",
+]
+JOINS = """
+    FROM match_statistics m
+    LEFT JOIN leagues l ON l.league_id = m.league_id
+    LEFT JOIN teams ht ON ht.team_id = m.home_team_id
+    LEFT JOIN teams at ON at.team_id = m.away_team_id
+"""
+
+def partition_key(league_id, season):
+    """Returns a partition's directory, relative to the snapshot root, e.g. "league=1/season=2024"."""
+    return f"league={'none' if league_id is None else league_id}/season={season}"
+
+def _stat_columns(cursor):
+    """Returns the match_statistics columns exported as float64, in table order."""
+    cursor.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_name = 'match_statistics' ORDER BY ordinal_position
+    """)
+    return [(name, data_type) for name, data_type in cursor.fetchall() if name not in KEY_COLUMNS]
+
+def _fingerprints(cursor):
+    """Returns {partition key: (league_id, season, rows, fingerprint)} for the current table.
+
+    The fingerprint hashes every row with its team and league names, so any change to a
+    partition's rows changes it, while untouched partitions keep theirs.
+    """
+    cursor.execute(f"""
+        SELECT m.league_id, {SEASON_SQL}, count(*),
+               md5(string_agg(md5(ROW(m.*, l.league_name, ht.team_name, at.team_name)::text), ''
+                              ORDER BY m.match_id))
+        {JOINS}
+        GROUP BY 1, 2
+    """)
+    return {partition_key(league_id, season): (league_id, season, rows, fingerprint)
+            for league_id, season, rows, fingerprint in cursor.fetchall()}
+
+def _load_manifest(directory):
+    """Returns the snapshot manifest of a directory, or None without one."""
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_manifest(directory, manifest):
+    """Replaces the manifest atomically, so readers never see a half-written one."""
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+class _PartitionWriter:
+    """Writes one partition to a temporary file and moves it into place when closed."""
+
+    def __init__(self, directory, key, schema, file_format):
+        self.key = key
+        self.path = os.path.join(directory, key, FORMATS[file_format])
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.rows = 0
+        if file_format == "parquet":
+            self.writer = pq.ParquetWriter(self.path + ".tmp", schema, compression="zstd")
+        else:
+            # Uncompressed IPC so readers can memory-map columns without copying them.
+            self.writer = pa.ipc.new_file(self.path + ".tmp", schema)
+
+    def write(self, table):
+        self.writer.write_table(table)
+        self.rows += table.num_rows
+
+    def close(self):
+        self.writer.close()
+        os.replace(self.path + ".tmp", self.path)
+
+def export_snapshot(directory, file_format="arrow", full=False):
+    """Exports match_statistics, partitioned by league and season, into a snapshot directory.
+
+    Only partitions whose fingerprint differs from the last export's manifest are rewritten
+    (all of them with full=True or a different format); partitions without matches anymore
+    are removed. Rows are streamed through a server-side cursor, BATCH_ROWS at a time.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with transaction() as cursor:
+        stat_columns = _stat_columns(cursor)
+        current = _fingerprints(cursor)
+    columns = [name for name, _ in stat_columns]
+
+    previous = _load_manifest(directory)
+    if previous is None or previous["format"] != file_format or previous["columns"] != columns:
+        full = True
+    old_partitions = {} if previous is None else previous["partitions"]
+    changed = sorted(
+        key for key, (_, _, _, fingerprint) in current.items()
+        if full or old_partitions.get(key, {}).get("fingerprint") != fingerprint
+    )
+
+    schema = pa.schema(BASE_FIELDS + [pa.field(name, pa.float64()) for name in columns])
+    # Text stat columns ('72%', 'N/A') are parsed; numeric ones are cast.
+    select = BASE_SQL + [numeric_sql(f"m.{name}", data_type != "text") for name, data_type in stat_columns]
+
+    written = {}
+    if changed:
+        # -1 stands in for matches without a league, on both sides of the comparison.
+        league_filter = [-1 if current[key][0] is None else current[key][0] for key in changed]
+        season_filter = [current[key][1] for key in changed]
+        with get_connection() as conn:
+            try:
+                # A named cursor keeps the result on the server and fetches it in batches.
+                with conn.cursor(name="snapshot_export") as cursor:
+                    cursor.itersize = BATCH_ROWS
+                    cursor.execute(f"""
+                        SELECT {', '.join(select)}
+                        {JOINS}
+                        WHERE (COALESCE(m.league_id, -1), {SEASON_SQL}) IN
+                              (SELECT * FROM unnest(%s::int[], %s::int[]))
+                        ORDER BY m.league_id, {SEASON_SQL}, m.match_id
+                    """, (league_filter, season_filter))
+                    writer = None
+                    while True:
+                        rows = cursor.fetchmany(BATCH_ROWS)
+                        if not rows:
+                            break
+                        # Rows arrive grouped by partition; split the batch where the partition changes.
+                        start = 0
+                        for i in range(1, len(rows) + 1):
+                            if i < len(rows) and rows[i][2:4] == rows[start][2:4]:
+                                continue
+                            key = partition_key(rows[start][3], rows[start][2])
+                            if writer is None or writer.key != key:
+                                if writer is not None:
+                                    writer.close()
+                                    written[writer.key] = writer.rows
+                                writer = _PartitionWriter(directory, key, schema, file_format)
+                            writer.write(pa.Table.from_arrays(
+                                [pa.array(values, type=field.type)
+                                 for values, field in zip(zip(*rows[start:i]), schema)],
+                                schema=schema))
+                            start = i
+                    if writer is not None:
+                        writer.close()
+                        written[writer.key] = writer.rows
+            finally:
+                conn.rollback()
+
+    removed = [key for key in old_partitions if key not in current]
+    for key in removed:
+        shutil.rmtree(os.path.join(directory, key), ignore_errors=True)
+    if previous is not None and previous["format"] != file_format:
+        # The partitions were all rewritten in the new format; drop the old files.
+        for key, entry in old_partitions.items():
+            if key not in removed and os.path.exists(os.path.join(directory, entry["file"])):
+                os.remove(os.path.join(directory, entry["file"]))
+
+    partitions = {}
+    for key, (league_id, season, rows, fingerprint) in current.items():
+        if key in written or key in old_partitions:
+            partitions[key] = {"league_id": league_id, "season": season, "rows": rows,
+                               "fingerprint": fingerprint, "file": f"{key}/{FORMATS[file_format]}"}
+    _write_manifest(directory, {
+        "format": file_format,
+        "columns": columns,
+        "exported_at": datetime.now(timezone.utc).isoformat(),
+        "partitions": partitions,
+    })
+    print(f"Exported {len(written)} partitions ({sum(written.values())} rows); "
+          f"{len(current) - len(written)} unchanged, {len(removed)} removed.")
+    return {"written": sorted(written), "unchanged": len(current) - len(written), "removed": removed}
+
+class Snapshot:
+    """Reads an exported snapshot, memory-mapping its files instead of loading them."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.manifest = _load_manifest(directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No snapshot manifest in {directory}")
+        self.format = self.manifest["format"]
+
+    def partitions(self, league_id=None, season=None):
+        """Returns the manifest entries of the partitions for a league and/or season."""
+        return [
+            entry for _, entry in sorted(self.manifest["partitions"].items())
+            if (league_id is None or entry["league_id"] == league_id)
+            and (season is None or entry["season"] == season)
+        ]
+
+    def read(self, league_id=None, season=None, columns=None):
+        """Returns a pyarrow Table of the selected partitions and columns.
+
+        Arrow IPC partitions are memory-mapped, so column buffers point straight into the
+        files and nothing is read until it is used.
+        """
+        tables = []
+        for entry in self.partitions(league_id, season):
+            path = os.path.join(self.directory, entry["file"])
+            if self.format == "parquet":
+                tables.append(pq.read_table(path, columns=columns, memory_map=True))
+            else:
+                table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+                tables.append(table.select(columns) if columns else table)
+        if not tables:
+            return None
+        return pa.concat_tables(tables)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export match_statistics to partitioned Arrow/Parquet files.")
+    parser.add_argument("directory", help="snapshot directory (created if missing)")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="arrow",
+                        help="arrow (memory-mappable IPC, default) or parquet (compressed)")
+    parser.add_argument("--full", action="store_true", help="rewrite every partition")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    export_snapshot(args.directory, args.format, full=args.full)
@@ -0,0 +1,205 @@
+import os
+import re
+import time
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+import metrics
+try:
+    import orjson
+except ImportError:
+    orjson = None
+from response_cache import CacheMiss, cache_from_env
+
+# Load environment variables from .env file
+load_dotenv()
+
+BASE_URL = os.getenv("SOFASCORE_BASE_URL", "https://www.sofascore.com/api/v1")
+
+OFFLINE = os.getenv("SOFASCORE_OFFLINE", "0") == "1"
+
+# Marks the cache argument as "use the one configured in .env".
+_ENV_CACHE = object()
+
+# Status codes worth retrying: rate limited or a transient server-side failure.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def endpoint_label(path):
+    """Returns a path with its IDs and dates replaced, e.g. "event/{id}/statistics", for metric labels."""
+    return re.sub(r'/\d[\d-]*', '/{id}', '/' + path.strip('/'))[1:]
+
+def decode_json(response):
+    """Decodes a response body, with orjson when it's installed (several times faster on stat payloads)."""
+    if orjson is None:
+        return response.json()
+    try:
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError as e:
+        # Raise what response.json() would, so callers catching RequestException still see it.
+        raise requests.exceptions.JSONDecodeError(e.msg, e.doc, e.pos)
+
+class TokenBucket:
+    """Thread-safe token-bucket rate limiter."""
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available; returns True if the caller had to wait."""
+        waited = False
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            waited = True
+            time.sleep(delay)
+
+    def set_rate(self, rate, burst=None):
+        """Changes the refill rate (and optionally the burst) of a limiter that may be in use."""
+        with self._lock:
+            self.rate = float(rate)
+            if burst is not None:
+                self.capacity = float(burst)
+                self.tokens = min(self.tokens, self.capacity)
+
+# One limiter shared by every client in the process so concurrent workers respect a single budget.
+shared_rate_limiter = TokenBucket(
+    rate=float(os.getenv("SOFASCORE_RATE_LIMIT", "5")),
+    burst=int(os.getenv("SOFASCORE_BURST", "10"))
+)
+
+class SofaScoreClient:
+    """Fetch client for the SofaScore event endpoints with pooling, retries and rate limiting."""
+
+    def __init__(self, base_url=BASE_URL, timeout=None, max_retries=None, backoff=None,
+                 pool_size=None, rate_limiter=shared_rate_limiter, cache=_ENV_CACHE, offline=OFFLINE):
+        self.base_url = base_url.rstrip('/')
+        self.cache = cache_from_env() if cache is _ENV_CACHE else cache
+        self.offline = offline
+        self.timeout = timeout if timeout is not None else float(os.getenv("SOFASCORE_TIMEOUT", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("SOFASCORE_MAX_RETRIES", "4"))
+        self.backoff = backoff if backoff is not None else float(os.getenv("SOFASCORE_BACKOFF", "0.5"))
+        self.rate_limiter = rate_limiter
+
+        pool_size = pool_size if pool_size is not None else int(os.getenv("SOFASCORE_POOL_SIZE", "16"))
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"User-Agent": "Mozilla/5.0", "Accept": "application/json"})
+
+        self.counters = {"requests": 0, "retries": 0, "throttled": 0, "rate_limited_waits": 0, "errors": 0,
+                         "cache_hits": 0, "cache_misses": 0}
+        self._counter_lock = threading.Lock()
+
+    def _count(self, name):
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def get_stats(self):
+        """Returns a snapshot of the request counters."""
+        with self._counter_lock:
+            return dict(self.counters)
+
+    def _backoff_delay(self, attempt, response=None):
+        """Exponential backoff with full jitter, honouring Retry-After when the server sends one."""
+        if response is not None:
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def get_json(self, path):
+        """GETs a path below the API base URL and returns the decoded JSON body."""
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        endpoint = endpoint_label(path)
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None and self.rate_limiter.acquire():
+                self._count("rate_limited_waits")
+            self._count("requests")
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.inc("http_errors_total", endpoint=endpoint,
+                            reason="timeout" if isinstance(e, requests.Timeout) else "connection")
+                if attempt >= self.max_retries:
+                    self._count("errors")
+                    raise
+                self._count("retries")
+                time.sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+
+            # The whole request, and the part spent waiting for the response headers; the
+            # difference is connection setup (DNS, TCP, TLS) and reading the body.
+            metrics.observe("http_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+            metrics.observe("http_server_wait_seconds", response.elapsed.total_seconds(), endpoint=endpoint)
+            metrics.inc("http_responses_total", endpoint=endpoint, status=str(response.status_code))
+
+            if response.status_code in RETRY_STATUSES:
+                if response.status_code == 429:
+                    self._count("throttled")
+                if attempt >= self.max_retries:
+                    self._count("errors")
+                    response.raise_for_status()
+                self._count("retries")
+                time.sleep(self._backoff_delay(attempt, response))
+                attempt += 1
+                continue
+
+            if not response.ok:
+                self._count("errors")
+            response.raise_for_status()
+            with metrics.span("decode", endpoint=endpoint):
+                return decode_json(response)
+
+    def _cached(self, endpoint, match_id, path, status_of):
+        """Serves a payload from the cache, fetching and storing it on a miss."""
+        if self.cache is not None:
+            payload = self.cache.get(endpoint, match_id, allow_stale=self.offline)
+            if payload is not None:
+                self._count("cache_hits")
+                return payload
+            self._count("cache_misses")
+        if self.offline:
+            raise CacheMiss(f"{endpoint} for match {match_id} is not cached (offline mode)")
+
+        payload = self.get_json(path)
+        if self.cache is not None:
+            self.cache.put(endpoint, match_id, payload, status_of(payload))
+        return payload
+
+    def get_event(self, match_id):
+        """Fetches the /event/{id} payload."""
+        return self._cached("event", match_id, f"event/{match_id}",
+                            lambda payload: payload.get('event', {}).get('status', {}).get('type'))
+
+    def get_statistics(self, match_id):
+        """Fetches the /event/{id}/statistics payload; its TTL follows the cached event status."""
+        return self._cached("statistics", match_id, f"event/{match_id}/statistics",
+                            lambda payload: self.cache.get_status(match_id))
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+def get_client():
+    """Returns the process-wide client, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = SofaScoreClient()
+            metrics.register_collector("sofascore", _default_client.get_stats)
+        return _default_client
@@ -0,0 +1,408 @@
+import os
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from db_operations import clean_stat_value, period_rows, stat_params
+from pg_dump import read_dump, unescape_copy_value
+from stat_columns import registry, stat_index
+
+# Load environment variables from .env file
+load_dotenv()
+
+SQLITE_PATH = os.getenv("SQLITE_PATH", "football.db")
+
+# SQLite column types of the typed match_statistics layout, by stat kind.
+SQLITE_TYPES = {"count": "INTEGER", "percentage": "INTEGER", "decimal": "REAL"}
+
+# Lookup tables: (id column, name column).
+LOOKUPS = {
+    "leagues": ("league_id", "league_name"),
+    "teams": ("team_id", "team_name"),
+    "statistic_names": ("stat_id", "stat_name"),
+}
+
+# Seasons start in July, as in team_aggregates.SEASON_SQL.
+SEASON_SQL = "CAST(strftime('%Y', m.date, '-6 months') AS INTEGER)"
+
+def _require_no_job_queue(job_queue):
+    if job_queue:
+        raise RuntimeError("The ingest job queue needs PostgreSQL (STORAGE_BACKEND=postgres).")
+
+class SQLiteStore:
+    """Embedded storage backend: the typed match_statistics schema in one WAL-mode SQLite file.
+
+    Writers are serialized by SQLite (BEGIN IMMEDIATE), so the team season aggregates are
+    maintained in the same transaction without any extra locking.
+    """
+
+    def __init__(self, path=SQLITE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._ids = {table: None for table in LOOKUPS}
+        self._sql = {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.ensure_schema()
+
+    def connection(self):
+        """Returns this thread's connection (sqlite3 connections can't be shared between threads)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Autocommit mode: transactions are opened explicitly by transaction().
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA temp_store=MEMORY")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Yields the connection inside a write transaction that commits on success."""
+        conn = self.connection()
+        # IMMEDIATE takes the write lock up front, so two writers never deadlock upgrading.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def ensure_schema(self):
+        """Creates the tables, the averages view and the indexes the analytics queries use."""
+        plan = registry.plan(True)
+        stat_columns = ", ".join(f"{col.column} {SQLITE_TYPES.get(col.kind, 'REAL')}" for col in plan.columns)
+        with self.transaction() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS leagues "
+                         "(league_id INTEGER PRIMARY KEY, league_name TEXT NOT NULL UNIQUE)")
+            conn.execute("CREATE TABLE IF NOT EXISTS teams "
+                         "(team_id INTEGER PRIMARY KEY, team_name TEXT NOT NULL UNIQUE)")
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS match_statistics (
+                    match_id INTEGER PRIMARY KEY,
+                    date TEXT NOT NULL,
+                    league_id INTEGER,
+                    home_team_id INTEGER,
+                    away_team_id INTEGER,
+                    {stat_columns}
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS match_statistics_date ON match_statistics (date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS match_statistics_league_date "
+                         "ON match_statistics (league_id, date)")
+            conn.execute("CREATE TABLE IF NOT EXISTS statistic_names "
+                         "(stat_id INTEGER PRIMARY KEY, stat_name TEXT NOT NULL UNIQUE)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS match_period_statistics (
+                    match_id INTEGER NOT NULL,
+                    period TEXT NOT NULL,
+                    stat_id INTEGER NOT NULL REFERENCES statistic_names (stat_id),
+                    home REAL,
+                    away REAL,
+                    home_attempted INTEGER,
+                    away_attempted INTEGER,
+                    PRIMARY KEY (match_id, period, stat_id)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS team_season_stats (
+                    team_id INTEGER NOT NULL,
+                    league_id INTEGER NOT NULL,
+                    season INTEGER NOT NULL,
+                    stat TEXT NOT NULL,
+                    n INTEGER NOT NULL,
+                    total REAL NOT NULL,
+                    total_sq REAL NOT NULL,
+                    PRIMARY KEY (team_id, league_id, season, stat)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("""
+                CREATE VIEW IF NOT EXISTS team_season_averages AS
+                SELECT team_id, league_id, season, stat, n, total,
+                       total / NULLIF(n, 0) AS mean,
+                       (total_sq - total * total / NULLIF(n, 0)) / NULLIF(n - 1, 0) AS variance
+                FROM team_season_stats
+                WHERE n > 0
+            """)
+
+    def table_columns(self):
+        """Returns the columns match_statistics currently has."""
+        return {row[1] for row in self.connection().execute("PRAGMA table_info(match_statistics)")}
+
+    def add_columns(self, columns, typed=True):
+        """Adds numeric stat columns to match_statistics (the SQLite layout is always typed)."""
+        existing = self.table_columns()
+        with self.transaction() as conn:
+            for column in columns:
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE match_statistics ADD COLUMN {column} REAL")
+
+    def resolve(self, table, names, cursor=None):
+        """Returns {name: id} for a lookup table, creating unknown names in their own transaction.
+
+        cursor is accepted for PostgresStore.resolve's signature and ignored.
+        """
+        id_column, name_column = LOOKUPS[table]
+        conn = self.connection()
+        if self._ids[table] is None:
+            rows = conn.execute(f"SELECT {name_column}, {id_column} FROM {table}").fetchall()
+            with self._lock:
+                self._ids[table] = dict(rows)
+        ids = self._ids[table]
+
+        names = set(names)
+        missing = [name for name in names if name not in ids]
+        if missing:
+            with self.transaction() as conn:
+                conn.executemany(f"INSERT OR IGNORE INTO {table} ({name_column}) VALUES (?)",
+                                 [(name,) for name in missing])
+                rows = conn.execute(
+                    f"SELECT {name_column}, {id_column} FROM {table} "
+                    f"WHERE {name_column} IN (SELECT value FROM json_each(?))", (json.dumps(missing),)
+                ).fetchall()
+            with self._lock:
+                ids.update(rows)
+        return {name: ids[name] for name in names}
+
+    def resolve_match_ids(self, league, home_team, away_team):
+        """Returns (league_id, home_team_id, away_team_id) for one match."""
+        teams = self.resolve("teams", [home_team, away_team])
+        return self.resolve("leagues", [league])[league], teams[home_team], teams[away_team]
+
+    def _upsert_sql(self, plan):
+        sql = self._sql.get(("upsert", plan.name))
+        if sql is None:
+            names = plan.column_names
+            updates = ", ".join(f"{name} = excluded.{name}" for name in names[1:])
+            sql = (f"INSERT INTO match_statistics ({', '.join(names)}) VALUES ({', '.join('?' * len(names))}) "
+                   f"ON CONFLICT (match_id) DO UPDATE SET {updates}")
+            self._sql[("upsert", plan.name)] = sql
+        return sql
+
+    def _contribution_sql(self, plan, where, sign):
+        """Generates the statement adding (sign 1) or subtracting (sign -1) matches' stats.
+
+        The SQLite counterpart of team_aggregates._contribution: every stat column becomes
+        one row per match through a CASE over a numbered list of the columns.
+        """
+        cache_key = ("contribution", plan.name, where, sign)
+        sql = self._sql.get(cache_key)
+        if sql is not None:
+            return sql
+
+        stats = []
+        cases = []
+        for col in plan.columns:
+            if col.part != "value":
+                continue
+            name, _, side = col.key.rpartition('_')
+            literal = name.replace("'", "''")
+            stats.append(f"({len(stats)}, '{literal}', {int(side == 'home')})")
+            cases.append(f"WHEN {len(cases)} THEN m.{col.column}")
+
+        sql = f"""
+            INSERT INTO team_season_stats (team_id, league_id, season, stat, n, total, total_sq)
+            SELECT team_id, league_id, season, stat, {sign} * count(*), {sign} * sum(value), {sign} * sum(value * value)
+            FROM (
+                SELECT CASE WHEN s.home THEN m.home_team_id ELSE m.away_team_id END AS team_id,
+                       m.league_id, {SEASON_SQL} AS season, s.stat,
+                       CASE s.i {' '.join(cases)} END AS value
+                FROM match_statistics m
+                CROSS JOIN (SELECT column1 AS i, column2 AS stat, column3 AS home
+                            FROM (VALUES {', '.join(stats)})) AS s
+                WHERE {where}
+            )
+            WHERE value IS NOT NULL AND team_id IS NOT NULL AND league_id IS NOT NULL
+            GROUP BY team_id, league_id, season, stat
+            ON CONFLICT (team_id, league_id, season, stat) DO UPDATE
+            SET n = n + excluded.n, total = total + excluded.total, total_sq = total_sq + excluded.total_sq
+        """
+        self._sql[cache_key] = sql
+        return sql
+
+    def _row(self, plan, match_id, match_date, league_id, home_team_id, away_team_id, statistics, scores):
+        return (match_id, str(match_date), league_id, home_team_id, away_team_id) + stat_params(plan, True, statistics, scores)
+
+    def write_match(self, match_id, match_date, league_id, home_team_id, away_team_id, statistics,
+                    scores=None, periods=None, job_queue=None):
+        """Inserts or updates one match with resolved IDs; returns "inserted" or "updated"."""
+        _require_no_job_queue(job_queue)
+        plan = registry.plan(True)
+        row = self._row(plan, match_id, match_date, league_id, home_team_id, away_team_id, statistics, scores)
+        stat_ids = self._period_stat_ids(periods) if periods else None
+        with self.transaction() as conn:
+            exists = conn.execute("SELECT 1 FROM match_statistics WHERE match_id = ?", (match_id,)).fetchone()
+            conn.execute(self._contribution_sql(plan, "m.match_id = ?", -1), (match_id,))
+            conn.execute(self._upsert_sql(plan), row)
+            conn.execute(self._contribution_sql(plan, "m.match_id = ?", 1), (match_id,))
+            if periods:
+                self._write_periods(conn, {match_id: periods}, stat_ids)
+        return "updated" if exists else "inserted"
+
+    def write_matches(self, matches, job_queue=None):
+        """Bulk inserts or updates insert_matches-style tuples in one transaction; returns the rows written."""
+        _require_no_job_queue(job_queue)
+        for match in matches:
+            registry.ensure_stats(match[5], True)
+        plan = registry.plan(True)
+        league_ids = self.resolve("leagues", {match[4] for match in matches})
+        team_ids = self.resolve("teams", {team for match in matches for team in (match[2], match[3])})
+
+        rows = {}
+        periods = {}
+        for match_id, match_date, home_team, away_team, league, statistics, *rest in matches:
+            # A batch containing the same match twice keeps the last one.
+            rows[match_id] = self._row(plan, match_id, match_date, league_ids[league], team_ids[home_team],
+                                       team_ids[away_team], statistics, rest[0] if rest else None)
+            if len(rest) > 1 and rest[1]:
+                periods[match_id] = rest[1]
+        stat_ids = self._period_stat_ids(*periods.values()) if periods else None
+
+        staged = "m.match_id IN (SELECT match_id FROM temp.batch_matches)"
+        with self.transaction() as conn:
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS batch_matches (match_id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM temp.batch_matches")
+            conn.executemany("INSERT INTO temp.batch_matches VALUES (?)", [(match_id,) for match_id in rows])
+            conn.execute(self._contribution_sql(plan, staged, -1))
+            conn.executemany(self._upsert_sql(plan), rows.values())
+            conn.execute(self._contribution_sql(plan, staged, 1))
+            if periods:
+                self._write_periods(conn, periods, stat_ids)
+        return len(rows)
+
+    def update_match_columns(self, match_id, changes):
+        """Writes only the given {column: value} changes of an existing match; returns True if a row was updated."""
+        plan = registry.plan(True)
+        columns = list(changes)
+        with self.transaction() as conn:
+            conn.execute(self._contribution_sql(plan, "m.match_id = ?", -1), (match_id,))
+            updated = conn.execute(
+                f"UPDATE match_statistics SET {', '.join(f'{col} = ?' for col in columns)} WHERE match_id = ?",
+                [changes[col] for col in columns] + [match_id]
+            ).rowcount == 1
+            conn.execute(self._contribution_sql(plan, "m.match_id = ?", 1), (match_id,))
+        return updated
+
+    def _period_stat_ids(self, *period_sets):
+        return self.resolve("statistic_names", {stat_index.refs[stat_id].name for periods in period_sets
+                                                for stats in periods.values() for stat_id in stats})
+
+    def _write_periods(self, conn, periods_by_match, stat_ids):
+        conn.executemany("DELETE FROM match_period_statistics WHERE match_id = ?",
+                         [(match_id,) for match_id in periods_by_match])
+        conn.executemany("INSERT INTO match_period_statistics VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         period_rows(periods_by_match, stat_ids))
+
+    def write_periods(self, match_id, periods):
+        """Replaces the per-period statistics of one match."""
+        stat_ids = self._period_stat_ids(periods)
+        with self.transaction() as conn:
+            self._write_periods(conn, {match_id: periods}, stat_ids)
+
+    def delete_matches(self, match_ids):
+        """Deletes matches with their period statistics and aggregate contribution; returns the rows deleted."""
+        where = "match_id IN (SELECT value FROM json_each(?))"
+        ids = json.dumps(list(match_ids))
+        with self.transaction() as conn:
+            conn.execute(self._contribution_sql(registry.plan(True), f"m.{where}", -1), (ids,))
+            conn.execute(f"DELETE FROM match_period_statistics WHERE {where}", (ids,))
+            return conn.execute(f"DELETE FROM match_statistics WHERE {where}", (ids,)).rowcount
+
+    def migrate_to_typed_storage(self):
+        print("The SQLite backend always stores typed columns; nothing to migrate.")
+
+    def rebuild_aggregates(self):
+        """Recomputes team_season_stats from every row of match_statistics."""
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM team_season_stats")
+            conn.execute(self._contribution_sql(registry.plan(True), "1", 1))
+            rows = conn.execute("SELECT count(*) FROM team_season_stats").fetchone()[0]
+        print(f"Rebuilt team_season_stats ({rows} rows).")
+        return rows
+
+    def import_dump(self, path):
+        """Loads leagues, teams and match_statistics from a plain pg_dump such as backup.sql.
+
+        Text stat values ('72%', 'N/A') are converted the way migrate_to_typed_storage does.
+        Everything is written in one transaction with syncing off, and the aggregates are
+        rebuilt once at the end instead of per match.
+        """
+        start = time.perf_counter()
+        plan = registry.plan(True)
+        kinds = {col.column: col.kind for col in plan.columns if col.part == "value"}
+        known = set(self.table_columns())
+        counts = {}
+        conn = self.connection()
+        conn.execute("PRAGMA synchronous=OFF")
+        try:
+            with self.transaction() as conn:
+                for part in read_dump(path):
+                    if part[0] != "copy":
+                        continue
+                    _, table, columns, data = part
+                    table = table.split(".")[-1]
+                    if table not in LOOKUPS and table != "match_statistics":
+                        continue
+                    keep = [i for i, column in enumerate(columns) if column in known or table != "match_statistics"]
+                    if len(keep) < len(columns):
+                        print(f"Skipped columns without a match_statistics column: "
+                              f"{', '.join(columns[i] for i in range(len(columns)) if i not in keep)}")
+                    names = [columns[i] for i in keep]
+                    rows = []
+                    for line in data.splitlines():
+                        if not line:
+                            continue
+                        fields = line.split("\t")
+                        rows.append([self._import_value(names[j], kinds, unescape_copy_value(fields[i]))
+                                     for j, i in enumerate(keep)])
+                    conn.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(names)}) "
+                                     f"VALUES ({', '.join('?' * len(names))})", rows)
+                    counts[table] = len(rows)
+        finally:
+            conn.execute("PRAGMA synchronous=NORMAL")
+        with self._lock:
+            self._ids = {table: None for table in LOOKUPS}
+        print(f"Imported {', '.join(f'{rows} {table}' for table, rows in counts.items())} from {path} "
+              f"in {time.perf_counter() - start:.2f}s.")
+        self.rebuild_aggregates()
+        return counts
+
+    @staticmethod
+    def _import_value(column, kinds, value):
+        kind = kinds.get(column)
+        if value is None or kind is None:
+            return value
+        return clean_stat_value(value, kind, typed=True)
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """Returns the process-wide store for SQLITE_PATH, creating it on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SQLiteStore()
+        return _store
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage the embedded SQLite database.")
+    parser.add_argument("--path", default=SQLITE_PATH, help=f"database file (default: {SQLITE_PATH})")
+    parser.add_argument("--import-dump", metavar="FILE", help="load a plain pg_dump such as backup.sql")
+    parser.add_argument("--rebuild-team-aggregates", action="store_true", help="recompute team_season_stats")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    store = SQLiteStore(args.path)
+    if args.import_dump:
+        store.import_dump(args.import_dump)
+    elif args.rebuild_team_aggregates:
+        store.rebuild_aggregates()
@@ -0,0 +1,347 @@
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+import psycopg2
+from db_connection import transaction
+from storage import embedded, get_backend
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Add columns for statistics SofaScore starts reporting that the table doesn't have yet.
+AUTO_ADD_COLUMNS = os.getenv("AUTO_ADD_STAT_COLUMNS", "1") == "1"
+
+# SofaScore statistic names stored in match_statistics; each has a _home and _away column.
+STAT_NAMES = [
+    "ball possession", "expected goals", "big chances", "total shots", "shots on target",
+    "shots off target", "blocked shots", "goalkeeper saves", "corner kicks", "fouls", "passes",
+    "tackles", "free kicks", "yellow cards", "red cards", "hit woodwork", "shots inside box",
+    "shots outside box", "big chances scored", "big chances missed", "through balls",
+    "touches in penalty area", "fouled in final third", "offsides", "accurate passes", "throw-ins",
+    "final third entries", "accurate long balls", "accurate crosses", "duels", "dispossessed",
+    "ground duels", "aerial duels", "dribbles", "tackles won", "interceptions", "recoveries",
+    "clearances", "goals prevented", "high claims", "goal kicks"
+]
+
+# How each statistic is stored in typed mode; anything not listed is a plain count.
+STAT_KINDS = {
+    "ball possession": "percentage", "duels": "percentage", "ground duels": "percentage",
+    "aerial duels": "percentage", "dribbles": "percentage", "tackles won": "percentage",
+    "expected goals": "decimal", "goals prevented": "decimal",
+}
+KIND_SQL_TYPES = {"count": "integer", "percentage": "smallint", "decimal": "numeric(6,2)"}
+
+# Statistics SofaScore reports as '41/57 (72%)'; typed mode keeps both parts in
+# extra <column>_made and <column>_attempted integer columns.
+FRACTION_STATS = [
+    "accurate passes", "accurate long balls", "accurate crosses", "ground duels",
+    "aerial duels", "dribbles", "tackles won"
+]
+
+# Score by period from the event payload's homeScore/awayScore objects.
+SCORE_PERIODS = ["period1", "period2", "period3", "period4", "normaltime"]
+
+SIDES = ("home", "away")
+
+# The identifying columns every match row starts with.
+KEY_COLUMNS = ["match_id", "date", "league_id", "home_team_id", "away_team_id"]
+
+# One stored column: where its value comes from ("value", "made", "attempted" of a
+# statistic, or "score" of a period) and the kind that decides its typed SQL type.
+StatColumn = namedtuple("StatColumn", ["column", "key", "part", "kind"])
+
+# Everything needed to write match rows for one registry version and storage mode.
+WritePlan = namedtuple("WritePlan", ["name", "columns", "column_names", "upsert_sql", "prepare_sql", "execute_sql"])
+
+def stat_key(name, side):
+    """Returns the statistics dict key for a SofaScore stat name, e.g. "Ball possession" -> "ball possession_home"."""
+    return f"{name.lower()}_{side}"
+
+def stat_column(name, side):
+    """Returns the column name for a statistic, e.g. ("throw-ins", "home") -> "throw_ins_home".
+
+    Names come from the API, so everything but letters and digits becomes an underscore:
+    the result is always a plain SQL identifier ("Keeper's sweeper (%)" -> "keeper_s_sweeper_home").
+    """
+    column = re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_')
+    if not column or column[0].isdigit():
+        column = f"stat_{column}".rstrip('_')
+    return f"{column}_{side}"
+
+def score_key(side, period):
+    """Returns the key (and column) holding a side's score for a period, e.g. "home_period1"."""
+    return f"{side}_{period}"
+
+def numeric_sql(column, typed, sql_type="float8", missing="NULL"):
+    """Returns a SQL expression reading a stat column as a number, `missing` when it has none.
+
+    The expression contains doubled percent signs, so it must be run with query parameters.
+    """
+    if typed:
+        return f"COALESCE({column}::{sql_type}, {missing})"
+    # Text storage: '72%' -> 72, '1.34' -> 1.34, 'N/A' and anything else -> missing.
+    return (f"CASE WHEN {column} ~ '^\\s*-?[0-9]+(\\.[0-9]+)?\\s*%%?\\s*$' "
+            f"THEN regexp_replace({column}, '[%%\\s]', '', 'g')::{sql_type} ELSE {missing} END")
+
+# One statistic as SofaScore names it, resolved once: a dense ID and its statistics dict keys.
+StatRef = namedtuple("StatRef", ["id", "name", "home_key", "away_key"])
+
+class StatIndex:
+    """Interns SofaScore statistic names so parsing a payload is one dict lookup per item."""
+
+    def __init__(self, stat_names):
+        self.refs = []
+        self._by_name = {}
+        self._lock = threading.Lock()
+        for name in stat_names:
+            # Pre-resolve both the stored (lower case) and the display spelling.
+            self.resolve(name)
+            self.resolve(name[0].upper() + name[1:])
+
+    def resolve(self, raw_name):
+        """Returns the StatRef of a SofaScore statistic name, e.g. "Ball possession"."""
+        ref = self._by_name.get(raw_name)
+        if ref is not None:
+            return ref
+        with self._lock:
+            name = raw_name.lower()
+            ref = self._by_name.get(name)
+            if ref is None:
+                ref = StatRef(len(self.refs), name, stat_key(name, "home"), stat_key(name, "away"))
+                self.refs.append(ref)
+                self._by_name[name] = ref
+            self._by_name[raw_name] = ref
+        return ref
+
+_typed_storage = None
+
+def typed_storage():
+    """Returns True when match_statistics uses typed (numeric) stat columns.
+
+    STAT_STORAGE=typed|text in .env forces a mode; otherwise the table is inspected once.
+    The SQLite backend always stores typed columns.
+    """
+    global _typed_storage
+    if embedded():
+        return True
+    if _typed_storage is None:
+        mode = os.getenv("STAT_STORAGE")
+        if mode:
+            _typed_storage = mode == "typed"
+        else:
+            with transaction() as cursor:
+                cursor.execute("""
+                    SELECT data_type FROM information_schema.columns
+                    WHERE table_name = 'match_statistics' AND column_name = 'ball_possession_home'
+                """)
+                row = cursor.fetchone()
+            _typed_storage = bool(row) and row[0] != "text"
+    return _typed_storage
+
+_partitioned_storage = None
+
+def partitioned_storage():
+    """Returns True when match_statistics is range-partitioned by date (see partitions.py).
+
+    A partitioned table's primary key has to include the date, so its rows are keyed by
+    (match_id, date) rather than match_id alone. The table is inspected once; the SQLite
+    backend is never partitioned.
+    """
+    global _partitioned_storage
+    if embedded():
+        return False
+    if _partitioned_storage is None:
+        with transaction() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+                           "WHERE partrelid = to_regclass('match_statistics'))")
+            _partitioned_storage = cursor.fetchone()[0]
+    return _partitioned_storage
+
+def match_key():
+    """Returns the conflict target of match_statistics upserts."""
+    return "match_id, date" if partitioned_storage() else "match_id"
+
+class StatRegistry:
+    """The single mapping from SofaScore statistics to match_statistics columns.
+
+    The upsert statement is generated from it once per registry version and storage mode,
+    and prepared once per connection.
+    """
+
+    def __init__(self, stat_names):
+        self.stat_names = list(stat_names)
+        self.version = 0
+        self._known = set(self.stat_names)
+        self._table_columns = None
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def columns(self, typed):
+        """Returns the StatColumns written for a match, in parameter order."""
+        return self.plan(typed).columns
+
+    def column_names(self, typed):
+        """Returns every column of a match row, identifying columns first."""
+        return self.plan(typed).column_names
+
+    def plan(self, typed):
+        """Returns the write plan (columns and generated SQL) for the current registry version.
+
+        Callers take one plan per write so a concurrent registry change can't mix column sets.
+        """
+        plan = self._plans.get((self.version, typed, partitioned_storage()))
+        if plan is not None:
+            return plan
+        with self._lock:
+            return self._build_plan(typed)
+
+    def _build_plan(self, typed):
+        """Generates the columns and SQL for a plan; called with the registry lock held."""
+        partitioned = partitioned_storage()
+        cache_key = (self.version, typed, partitioned)
+        columns = []
+        for name in self.stat_names:
+            kind = STAT_KINDS.get(name, "count" if name in STAT_NAMES else "new")
+            for side in SIDES:
+                columns.append(StatColumn(stat_column(name, side), stat_key(name, side), "value", kind))
+        if typed:
+            for name in FRACTION_STATS:
+                for side in SIDES:
+                    for part in ("made", "attempted"):
+                        columns.append(StatColumn(f"{stat_column(name, side)}_{part}", stat_key(name, side), part, "count"))
+        for side in SIDES:
+            for period in SCORE_PERIODS:
+                key = score_key(side, period)
+                columns.append(StatColumn(key, key, "score", "count"))
+
+        names = KEY_COLUMNS + [col.column for col in columns]
+        updates = ", ".join(f"{name} = EXCLUDED.{name}" for name in names[1:])
+        # xmax is 0 only for freshly inserted rows, which tells inserts from updates. Partitioned
+        # tables can't return system columns, so there the caller checks for the row beforehand.
+        returning = "NULL" if partitioned else "(xmax = 0)"
+        upsert = (f"INSERT INTO match_statistics ({', '.join(names)}) VALUES ({{values}}) "
+                  f"ON CONFLICT ({match_key()}) DO UPDATE SET {updates} RETURNING {returning} AS inserted")
+        name = f"upsert_match_v{self.version}_{'typed' if typed else 'text'}{'_partitioned' if partitioned else ''}"
+        plan = WritePlan(
+            name=name,
+            columns=tuple(columns),
+            column_names=names,
+            upsert_sql=upsert.format(values=", ".join(["%s"] * len(names))),
+            prepare_sql=upsert.format(values=", ".join(f"${i}" for i in range(1, len(names) + 1))),
+            execute_sql=f"EXECUTE {name} ({', '.join(['%s'] * len(names))})"
+        )
+        self._plans[cache_key] = plan
+        return plan
+
+    def execute_upsert(self, cursor, plan, params):
+        """Runs the plan's upsert through a server-side prepared statement; returns True if the row was new.
+
+        Returns None for partitioned storage, which can't tell.
+        """
+        prepared = getattr(cursor.connection, "prepared_statements", None)
+        if prepared is None:
+            cursor.execute(plan.upsert_sql, params)
+        else:
+            if plan.name not in prepared:
+                cursor.execute(f"PREPARE {plan.name} AS {plan.prepare_sql}")
+                prepared.add(plan.name)
+            cursor.execute(plan.execute_sql, params)
+        return cursor.fetchone()[0]
+
+    def ensure_stats(self, statistics, typed):
+        """Registers statistics this registry hasn't seen, adding their columns when allowed."""
+        new_names = []
+        for key in statistics:
+            name, _, side = key.rpartition('_')
+            if side in SIDES and name and name not in self._known:
+                new_names.append(name)
+        if not new_names:
+            return []
+
+        with self._lock:
+            new_names = sorted({name for name in new_names if name not in self._known})
+            if not new_names:
+                return []
+            if self._table_columns is None:
+                self._table_columns = self._load_table_columns()
+
+            missing = [name for name in new_names
+                       if not all(stat_column(name, side) in self._table_columns for side in SIDES)]
+            if missing and not AUTO_ADD_COLUMNS:
+                print(f"Ignoring statistics without a column: {', '.join(missing)}")
+                self._known.update(missing)
+                new_names = [name for name in new_names if name not in missing]
+                missing = []
+            if missing:
+                columns = sorted({stat_column(name, side) for name in missing for side in SIDES})
+                try:
+                    self._add_columns(columns, typed)
+                except (psycopg2.Error, sqlite3.Error) as e:
+                    # Remembered as ignored, so one stat the table can't take doesn't fail every write.
+                    print(f"Ignoring statistics whose columns couldn't be added ({e}): {', '.join(missing)}")
+                    self._known.update(missing)
+                    new_names = [name for name in new_names if name not in missing]
+                    if not new_names:
+                        return []
+                else:
+                    self._table_columns.update(columns)
+                    print(f"Added columns for new statistics: {', '.join(missing)}")
+
+            self.stat_names.extend(new_names)
+            self._known.update(new_names)
+            self.version += 1
+        return new_names
+
+    def _load_table_columns(self):
+        """Returns the columns match_statistics currently has."""
+        return get_backend().table_columns()
+
+    def _add_columns(self, columns, typed):
+        """Adds stat columns to match_statistics."""
+        get_backend().add_columns(columns, typed)
+
+    def migrate_to_typed_storage(self):
+        """Converts match_statistics' text stat columns to typed columns in place.
+
+        '72%' becomes 72 and 'N/A' (or anything else that isn't a number) becomes NULL.
+        Rows loaded from backup.sql only kept one part of fraction stats, so their new
+        _made/_attempted columns start out NULL.
+        """
+        global _typed_storage
+        with transaction() as cursor:
+            cursor.execute("SELECT column_name FROM information_schema.columns "
+                           "WHERE table_name = 'match_statistics' AND data_type = 'text'")
+            text_columns = {row[0] for row in cursor.fetchall()}
+
+        # Registered stats get their kind's type; columns auto-added for stats this process
+        # hasn't seen yet become plain numeric.
+        column_types = {col.column: KIND_SQL_TYPES.get(col.kind, "numeric")
+                        for col in self.columns(typed=False) if col.part == "value"}
+        for column in text_columns:
+            if column.endswith(("_home", "_away")):
+                column_types.setdefault(column, "numeric")
+
+        actions = []
+        for column, sql_type in column_types.items():
+            if column not in text_columns:
+                continue
+            actions.append(
+                f"ALTER COLUMN {column} TYPE {sql_type} "
+                f"USING CASE WHEN {column} ~ '^\\s*-?[0-9]+(\\.[0-9]+)?\\s*%?\\s*$' "
+                f"THEN regexp_replace({column}, '[%\\s]', '', 'g')::{sql_type} END"
+            )
+        for col in self.columns(typed=True):
+            if col.part in ("made", "attempted"):
+                actions.append(f"ADD COLUMN IF NOT EXISTS {col.column} integer")
+
+        # One ALTER TABLE statement so the table is rewritten only once.
+        with transaction() as cursor:
+            cursor.execute(f"ALTER TABLE match_statistics {', '.join(actions)}")
+        _typed_storage = True
+        print(f"Migrated match_statistics to typed storage ({len(actions)} schema changes).")
+
+registry = StatRegistry(STAT_NAMES)
+stat_index = StatIndex(STAT_NAMES)
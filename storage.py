@@ -0,0 +1,43 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+_backend = None
+_backend_lock = threading.Lock()
+
+def backend_name():
+    """Returns STORAGE_BACKEND: "postgres" (default) or "sqlite" for the embedded backend in sqlite_storage.py.
+
+    It is read when called rather than at import, so a caller can still choose the backend
+    after importing the modules that use it.
+    """
+    return os.getenv("STORAGE_BACKEND", "postgres").lower()
+
+def embedded():
+    """Returns True when the embedded SQLite backend is in use."""
+    return backend_name() == "sqlite"
+
+def get_backend():
+    """Returns the storage backend for STORAGE_BACKEND, chosen on first use.
+
+    Both backends expose the same writes: resolve, resolve_match_ids, write_match,
+    write_matches, write_periods, update_match_columns, delete_matches, table_columns,
+    add_columns, migrate_to_typed_storage and rebuild_aggregates.
+    """
+    global _backend
+    if _backend is None:
+        # The backends are imported here because both build on db_operations and stat_columns,
+        # which use this module.
+        if embedded():
+            from sqlite_storage import get_store
+            backend = get_store()
+        else:
+            from postgres_storage import PostgresStore
+            backend = PostgresStore()
+        with _backend_lock:
+            if _backend is None:
+                _backend = backend
+    return _backend
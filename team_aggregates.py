@@ -0,0 +1,162 @@
+import os
+import threading
+from dotenv import load_dotenv
+from db_connection import AGGREGATE_LOCK_NAMESPACE, MATCH_LOCK_NAMESPACE, transaction
+from stat_columns import numeric_sql
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Keep team_season_stats up to date on every match write.
+MAINTAIN_AGGREGATES = os.getenv("MAINTAIN_TEAM_AGGREGATES", "1") == "1"
+
+# Seasons are named by the year they start in; a season starts in July.
+SEASON_SQL = "EXTRACT(YEAR FROM m.date - INTERVAL '6 months')::int"
+
+_table_ready = False
+_table_lock = threading.Lock()
+_contribution_sql = {}
+
+def ensure_aggregate_tables(plan, typed):
+    """Creates team_season_stats and its derived averages view.
+
+    A new team_season_stats is filled from the stored matches in the same transaction, so
+    the incremental updates never start from an empty table.
+    """
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        with transaction() as cursor:
+            # Other processes creating it wait here, and with them their match writes.
+            cursor.execute("SELECT pg_advisory_xact_lock(%s, 0)", (AGGREGATE_LOCK_NAMESPACE,))
+            cursor.execute("SELECT to_regclass('team_season_stats') IS NULL")
+            created = cursor.fetchone()[0]
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS team_season_stats (
+                    team_id integer NOT NULL,
+                    league_id integer NOT NULL,
+                    season integer NOT NULL,
+                    stat text NOT NULL,
+                    n bigint NOT NULL,
+                    total numeric NOT NULL,
+                    total_sq numeric NOT NULL,
+                    PRIMARY KEY (team_id, league_id, season, stat)
+                )
+            """)
+            cursor.execute("""
+                CREATE OR REPLACE VIEW team_season_averages AS
+                SELECT team_id, league_id, season, stat, n, total,
+                       total / NULLIF(n, 0) AS mean,
+                       (total_sq - total * total / NULLIF(n, 0)) / NULLIF(n - 1, 0) AS variance
+                FROM team_season_stats
+                WHERE n > 0
+            """)
+            if created:
+                cursor.execute(_contribution(plan, typed, "TRUE", 1), ())
+                print(f"Created team_season_stats ({cursor.rowcount} rows from the stored matches).")
+        _table_ready = True
+
+def _contribution(plan, typed, where, sign):
+    """Generates the statement adding (sign 1) or subtracting (sign -1) matches' stats.
+
+    Every stored statistic of the matching rows counts once for the home team and once
+    for the away team, in the league and season of the match. The statement is run with
+    parameters, so `where` uses %s placeholders.
+    """
+    cache_key = (plan.name, where, sign)
+    sql = _contribution_sql.get(cache_key)
+    if sql is not None:
+        return sql
+    sql = f"""
+        INSERT INTO team_season_stats AS t (team_id, league_id, season, stat, n, total, total_sq)
+        SELECT s.team_id, m.league_id, {SEASON_SQL}, s.stat,
+               {sign} * count(*), {sign} * sum(s.value), {sign} * sum(s.value * s.value)
+        FROM match_statistics m
+        CROSS JOIN LATERAL (VALUES {_stat_values(plan, typed)}) AS s(team_id, stat, value)
+        WHERE ({where}) AND s.value IS NOT NULL AND s.team_id IS NOT NULL AND m.league_id IS NOT NULL
+        GROUP BY s.team_id, m.league_id, {SEASON_SQL}, s.stat
+        ON CONFLICT (team_id, league_id, season, stat) DO UPDATE
+        SET n = t.n + EXCLUDED.n, total = t.total + EXCLUDED.total, total_sq = t.total_sq + EXCLUDED.total_sq
+    """
+    _contribution_sql[cache_key] = sql
+    return sql
+
+def _stat_values(plan, typed):
+    """Returns the VALUES rows turning a match row (alias m) into (team_id, stat, value), one per stored stat.
+
+    Like the numeric_sql expressions in them, a % is written as %% for statements run with parameters.
+    """
+    values = []
+    for col in plan.columns:
+        if col.part != "value":
+            continue
+        name, _, side = col.key.rpartition('_')
+        literal = name.replace("'", "''").replace("%", "%%")
+        values.append(f"(m.{side}_team_id, '{literal}', {numeric_sql('m.' + col.column, typed, 'numeric')})")
+    return ", ".join(values)
+
+def replace_sql(plan, typed, old, new):
+    """Generates the statement moving matches' contribution from their `old` rows to their `new` ones.
+
+    old and new name relations (e.g. CTEs) with match_statistics' columns. The statement takes
+    no parameters, so its % aren't doubled.
+    """
+    cache_key = (plan.name, old, new)
+    sql = _contribution_sql.get(cache_key)
+    if sql is not None:
+        return sql
+    sql = f"""
+        INSERT INTO team_season_stats AS t (team_id, league_id, season, stat, n, total, total_sq)
+        SELECT s.team_id, m.league_id, {SEASON_SQL}, s.stat,
+               sum(m.sign), sum(m.sign * s.value), sum(m.sign * s.value * s.value)
+        FROM (SELECT -1 AS sign, * FROM {old} UNION ALL SELECT 1 AS sign, * FROM {new}) m
+        CROSS JOIN LATERAL (VALUES {_stat_values(plan, typed)}) AS s(team_id, stat, value)
+        WHERE s.value IS NOT NULL AND s.team_id IS NOT NULL AND m.league_id IS NOT NULL
+        GROUP BY s.team_id, m.league_id, {SEASON_SQL}, s.stat
+        ON CONFLICT (team_id, league_id, season, stat) DO UPDATE
+        SET n = t.n + EXCLUDED.n, total = t.total + EXCLUDED.total, total_sq = t.total_sq + EXCLUDED.total_sq
+    """.replace("%%", "%")
+    _contribution_sql[cache_key] = sql
+    return sql
+
+def subtract_matches(cursor, plan, typed, where, params):
+    """Removes the current contribution of the match_statistics rows matching `where` (alias m)."""
+    if not MAINTAIN_AGGREGATES:
+        return
+    ensure_aggregate_tables(plan, typed)
+    cursor.execute(_contribution(plan, typed, where, -1), params)
+
+def add_matches(cursor, plan, typed, where, params):
+    """Adds the contribution of the match_statistics rows matching `where` (alias m)."""
+    if not MAINTAIN_AGGREGATES:
+        return
+    ensure_aggregate_tables(plan, typed)
+    cursor.execute(_contribution(plan, typed, where, 1), params)
+
+def lock_matches(cursor, match_ids):
+    """Serializes writers of the same matches until the transaction ends.
+
+    Row locks can't cover a match that doesn't exist yet, so two first writes of one match
+    would otherwise both skip the subtraction and count it twice.
+    """
+    if not MAINTAIN_AGGREGATES:
+        return
+    # Sorted so two batches sharing matches always lock them in the same order.
+    cursor.execute("SELECT pg_advisory_xact_lock(%s, id) FROM unnest(%s::int[]) AS t(id) ORDER BY id",
+                   (MATCH_LOCK_NAMESPACE, sorted(set(match_ids))))
+
+def rebuild_aggregates(plan, typed):
+    """Recomputes team_season_stats from scratch from every row of match_statistics."""
+    ensure_aggregate_tables(plan, typed)
+    with transaction() as cursor:
+        # Block match writes while rebuilding so no contribution is lost or counted twice.
+        cursor.execute("LOCK TABLE match_statistics IN SHARE MODE")
+        cursor.execute("TRUNCATE team_season_stats")
+        cursor.execute(_contribution(plan, typed, "TRUE", 1), ())
+        cursor.execute("SELECT count(*) FROM team_season_stats")
+        rows = cursor.fetchone()[0]
+    print(f"Rebuilt team_season_stats ({rows} rows).")
+    return rows
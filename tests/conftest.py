@@ -0,0 +1,69 @@
+import os
+import sys
+import itertools
+import pytest
+
+# The modules live flat in the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Registry versions handed to each test, spaced out so the ones a test bumps to stay unique:
+# plans, their prepared statements and the aggregate SQL are cached by version.
+_registry_versions = itertools.count(1000, 1000)
+
+def _fresh_registry(monkeypatch):
+    """Gives the test a stat registry without the stats earlier tests added."""
+    import stat_columns
+    registry = stat_columns.registry
+    monkeypatch.setattr(registry, "stat_names", list(stat_columns.STAT_NAMES))
+    monkeypatch.setattr(registry, "_known", set(stat_columns.STAT_NAMES))
+    monkeypatch.setattr(registry, "version", next(_registry_versions))
+    monkeypatch.setattr(registry, "_plans", {})
+    # The registry caches the columns of whichever database it saw first.
+    monkeypatch.setattr(registry, "_table_columns", None)
+
+@pytest.fixture
+def sqlite_store(tmp_path, monkeypatch):
+    """Routes every write to a fresh embedded SQLite database for the test."""
+    import sqlite_storage
+    import storage
+    monkeypatch.setenv("STORAGE_BACKEND", "sqlite")
+    monkeypatch.setattr(storage, "_backend", None)
+    _fresh_registry(monkeypatch)
+    store = sqlite_storage.SQLiteStore(str(tmp_path / "football.db"))
+    monkeypatch.setattr(sqlite_storage, "_store", store)
+    return store
+
+@pytest.fixture(scope="session")
+def postgres_database():
+    """Creates a throwaway PostgreSQL database seeded from backup.sql on the server in .env.
+
+    Skips the tests that use it when the server isn't reachable.
+    """
+    import psycopg2
+    from benchmarks.dump import DEFAULT_DUMP
+    from benchmarks.run import _admin_connection, create_database, drop_database
+    from db_connection import close_pool
+    try:
+        _admin_connection().close()
+    except psycopg2.OperationalError as e:
+        pytest.skip(f"PostgreSQL isn't reachable: {e}")
+    name = f"football_test_{os.getpid()}"
+    create_database(name, DEFAULT_DUMP)
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv("DB_NAME", name)
+        close_pool()
+        yield name
+        close_pool()
+    drop_database(name)
+
+@pytest.fixture
+def postgres(postgres_database, monkeypatch):
+    """Routes every write to the throwaway PostgreSQL database, with fresh storage caches."""
+    import stat_columns
+    import storage
+    monkeypatch.setenv("STORAGE_BACKEND", "postgres")
+    monkeypatch.setattr(storage, "_backend", None)
+    _fresh_registry(monkeypatch)
+    monkeypatch.setattr(stat_columns, "_typed_storage", None)
+    monkeypatch.setattr(stat_columns, "_partitioned_storage", None)
+    return postgres_database
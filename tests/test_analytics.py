@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from analytics import MatchTable
+
+NAN = np.nan
+
+@pytest.fixture
+def table():
+    """Four matches between teams 1, 2 and 3 in leagues 10 and 20."""
+    teams = np.array([None, "A", "B", "C", None], dtype=object)
+    leagues = np.array([None] * 21 + [None], dtype=object)
+    leagues[10], leagues[20] = "League X", "League Y"
+    return MatchTable(
+        match_ids=np.array([101, 102, 103, 104]),
+        dates=np.array(["2024-01-01", "2024-01-08", "2024-01-15", "2024-01-22"], dtype="datetime64[D]"),
+        league_ids=np.array([10, 10, 10, 20]),
+        home_team_ids=np.array([1, 2, 1, 3]),
+        away_team_ids=np.array([2, 3, 3, 1]),
+        stats={"total shots": (np.array([10.0, 4.0, NAN, 8.0]), np.array([6.0, 2.0, 5.0, 12.0]))},
+        home_goals=np.array([2.0, 0.0, 1.0, NAN]),
+        away_goals=np.array([1.0, 0.0, 3.0, NAN]),
+        team_names=teams,
+        league_names=leagues,
+    )
+
+def _by_team(table, values):
+    """Groups a team-view array into {team ID: [values in date order]}."""
+    grouped = {}
+    for team, value in zip(table.team, values):
+        grouped.setdefault(int(team), []).append(value)
+    return grouped
+
+def test_rolling_mean_stays_within_each_team(table):
+    rolling = _by_team(table, table.rolling_mean("total shots", 2))
+    # Team 1: 10 (home), NaN (home, skipped), 12 (away).
+    np.testing.assert_allclose(rolling[1], [10.0, 10.0, 12.0])
+    # Team 2: 6 (away), 4 (home).
+    np.testing.assert_allclose(rolling[2], [6.0, 5.0])
+    # Team 3: 2 (away), 5 (away), 8 (home).
+    np.testing.assert_allclose(rolling[3], [2.0, 3.5, 6.5])
+
+def test_rolling_mean_is_nan_without_values(table):
+    table.team_stats["total shots"][:] = NAN
+    assert np.isnan(table.rolling_mean("total shots", 3)).all()
+
+def test_team_form_uses_the_latest_window(table):
+    assert table.team_form("total shots", last_n=3) == {"A": 11.0, "B": 5.0, "C": 5.0}
+
+def test_league_percentiles(table):
+    percentiles = table.league_percentiles("total shots", percentiles=(0, 50, 100))
+    np.testing.assert_allclose(percentiles["League X"], [2.0, 5.0, 10.0])
+    np.testing.assert_allclose(percentiles["League Y"], [8.0, 10.0, 12.0])
+
+def test_league_percentiles_skip_leagues_without_values(table):
+    table.team_stats["total shots"][table.team_league == 20] = NAN
+    assert list(table.league_percentiles("total shots")) == ["League X"]
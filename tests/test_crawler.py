@@ -0,0 +1,98 @@
+from datetime import date
+import pytest
+import crawler
+from benchmarks.fake_sofascore import FakeSofaScore
+from job_queue import dead_letters
+from sofascore_client import SofaScoreClient
+
+def _event(event_id, timestamp, status="finished", tournament_id=17):
+    return {"id": event_id, "startTimestamp": timestamp, "status": {"type": status},
+            "tournament": {"uniqueTournament": {"id": tournament_id}}}
+
+PAYLOADS = {
+    "sport/football/scheduled-events/2024-08-17": {"events": [
+        _event(1, 1723900000), _event(2, 1723910000, status="inprogress"), _event(3, 1723920000, tournament_id=8),
+    ]},
+    "sport/football/scheduled-events/2024-08-18": {"events": [_event(4, 1723990000)]},
+    "unique-tournament/17/season/1/events/last/0": {"hasNextPage": True, "events": [
+        _event(10, 500), _event(11, 600),
+    ]},
+    "unique-tournament/17/season/1/events/last/1": {"hasNextPage": True, "events": [
+        _event(8, 300), _event(9, 400, status="postponed"),
+    ]},
+    "unique-tournament/17/season/1/events/last/2": {"hasNextPage": False, "events": [
+        _event(6, 100), _event(7, 200),
+    ]},
+}
+
+@pytest.fixture
+def fake_api():
+    fake = FakeSofaScore(PAYLOADS)
+    client = SofaScoreClient(fake.start(), max_retries=0, rate_limiter=None, cache=None)
+    yield fake, client
+    fake.stop()
+
+def test_discover_by_dates_keeps_finished_events_of_every_day(fake_api):
+    _, client = fake_api
+    assert crawler.discover_by_dates(date(2024, 8, 17), date(2024, 8, 18), client=client) == {
+        1: 1723900000, 3: 1723920000, 4: 1723990000}
+    assert crawler.discover_by_dates(date(2024, 8, 17), date(2024, 8, 18), tournament_id=17, client=client) == {
+        1: 1723900000, 4: 1723990000}
+
+def test_discover_by_season_reads_every_page(fake_api):
+    _, client = fake_api
+    assert crawler.discover_by_season(17, 1, client=client) == {10: 500, 11: 600, 8: 300, 6: 100, 7: 200}
+
+def test_discover_by_season_stops_at_the_high_water_mark(fake_api):
+    fake, client = fake_api
+    assert crawler.discover_by_season(17, 1, since=350, client=client) == {10: 500, 11: 600}
+    # Page 1 reaches back to the mark, so page 2 is never requested.
+    assert fake.counters["requests"] == 2
+
+def test_crawler_refuses_sqlite(sqlite_store):
+    with pytest.raises(RuntimeError, match="PostgreSQL"):
+        crawler.ensure_sync_state_table()
+    with pytest.raises(RuntimeError, match="PostgreSQL"):
+        crawler.missing_match_ids([1])
+
+def test_missing_match_ids_keeps_the_discovery_order(postgres):
+    from db_connection import transaction
+    with transaction() as cursor:
+        cursor.execute("SELECT match_id FROM match_statistics ORDER BY match_id LIMIT 2")
+        stored = [row[0] for row in cursor.fetchall()]
+    assert crawler.missing_match_ids([999999002, stored[0], 999999001, stored[1]]) == [999999002, 999999001]
+    assert crawler.missing_match_ids([]) == []
+
+@pytest.fixture
+def sync(postgres, monkeypatch):
+    """Runs _sync with ingest_batch replaced by one failing the given {match_id: reason}."""
+    crawler.ensure_sync_state_table()
+    key = f"test:{id(monkeypatch)}"
+
+    def run(discovered, failures=None, stored=None):
+        if stored is not None:
+            crawler.set_high_water(key, stored)
+        monkeypatch.setattr(crawler, "ingest_batch", lambda match_ids, workers: {"failures": dict(failures or {})})
+        crawler._sync(key, discovered, workers=1)
+        return crawler.get_high_water(key)
+
+    run.key = key
+    return run
+
+DISCOVERED = {999999101: 1000, 999999102: 2000, 999999103: 3000}
+
+def test_high_water_advances_to_the_newest_match(sync):
+    assert sync(DISCOVERED) == 3000
+    # A run over older dates never moves it back.
+    assert sync({999999100: 500}) == 3000
+
+def test_transient_failure_holds_the_mark_back(sync):
+    assert sync(DISCOVERED, {999999102: "timeout", 999999103: "http_503"}) == 1999
+
+def test_transient_failure_moves_the_mark_below_a_newer_one(sync):
+    # As after `--full`: the failure predates the stored mark but still has to be retried.
+    assert sync(DISCOVERED, {999999101: "db_error"}, stored=5000) == 999
+
+def test_permanent_failure_is_dead_lettered_and_skipped(sync):
+    assert sync(DISCOVERED, {999999101: "http_404", 999999103: "http_429"}) == 2999
+    assert [(row[0], row[2]) for row in dead_letters(sync.key)] == [(999999101, "http_404")]
@@ -0,0 +1,93 @@
+from decimal import Decimal
+import pytest
+from benchmarks.dump import DEFAULT_DUMP
+from db_operations import ParsedStat, parse_stat_value
+from pg_dump import copy_rows
+
+@pytest.mark.parametrize("value, expected", [
+    ("41/57 (72%)", ParsedStat(41, 41, 57, 72)),
+    ("41/57", ParsedStat(41, 41, 57, None)),
+    ("60%", ParsedStat(None, None, None, 60)),
+    ("33.3%", ParsedStat(None, None, None, 33.3)),
+    ("1.34", ParsedStat(1.34, None, None, None)),
+    ("-0.5", ParsedStat(-0.5, None, None, None)),
+    ("12", ParsedStat(12, None, None, None)),
+    (7, ParsedStat(7, None, None, None)),
+    ("N/A", ParsedStat(None, None, None, None)),
+    ("", ParsedStat(None, None, None, None)),
+    (None, ParsedStat(None, None, None, None)),
+])
+def test_parse_stat_value(value, expected):
+    assert parse_stat_value(value) == expected
+
+# Rows of backup.sql checked after converting to typed storage.
+SAMPLE = 50
+
+def _dump_values():
+    """Returns {match_id: {stat column: text}} of the first SAMPLE rows of backup.sql."""
+    rows = copy_rows(DEFAULT_DUMP, "match_statistics")[:SAMPLE]
+    return {int(row["match_id"]): {column: value for column, value in row.items()
+                                   if column.endswith(("_home", "_away"))} for row in rows}
+
+def _expected(text):
+    """The number a text stat value ('72%', '1.34', 'N/A') is stored as in typed storage."""
+    if text is None or text == "N/A":
+        return None
+    return Decimal(text.rstrip("%"))
+
+def _assert_converted(stored, texts):
+    for match_id, columns in texts.items():
+        for column, text in columns.items():
+            value = stored[match_id][column]
+            assert (None if value is None else Decimal(str(value))) == _expected(text), (match_id, column, text)
+
+def test_dump_import_converts_text_stats(sqlite_store):
+    sqlite_store.import_dump(DEFAULT_DUMP)
+    texts = _dump_values()
+    columns = sorted(next(iter(texts.values())))
+    conn = sqlite_store.connection()
+    rows = conn.execute(f"SELECT match_id, {', '.join(columns)} FROM match_statistics "
+                        f"WHERE match_id IN ({', '.join('?' * len(texts))})", list(texts)).fetchall()
+    _assert_converted({row[0]: dict(zip(columns, row[1:])) for row in rows}, texts)
+
+@pytest.fixture
+def text_database(postgres_database, monkeypatch):
+    """A second throwaway PostgreSQL database with backup.sql's text stat columns, for migrations."""
+    import stat_columns
+    import storage
+    from benchmarks.run import create_database, drop_database
+    from conftest import _fresh_registry
+    from db_connection import close_pool
+    name = f"{postgres_database}_migrate"
+    create_database(name, DEFAULT_DUMP)
+    close_pool()
+    monkeypatch.setenv("DB_NAME", name)
+    monkeypatch.setenv("STORAGE_BACKEND", "postgres")
+    monkeypatch.delenv("STAT_STORAGE", raising=False)
+    monkeypatch.setattr(storage, "_backend", None)
+    _fresh_registry(monkeypatch)
+    monkeypatch.setattr(stat_columns, "_typed_storage", None)
+    monkeypatch.setattr(stat_columns, "_partitioned_storage", None)
+    yield name
+    close_pool()
+    drop_database(name)
+
+def test_migrate_to_typed_storage_round_trip(text_database):
+    from db_connection import transaction
+    from db_operations import migrate_to_typed_storage
+    from stat_columns import typed_storage
+    assert not typed_storage()
+    migrate_to_typed_storage()
+    assert typed_storage()
+
+    texts = _dump_values()
+    columns = sorted(next(iter(texts.values())))
+    with transaction() as cursor:
+        cursor.execute(f"SELECT match_id, {', '.join(columns)} FROM match_statistics WHERE match_id = ANY(%s)",
+                       (list(texts),))
+        rows = cursor.fetchall()
+        cursor.execute("SELECT DISTINCT data_type FROM information_schema.columns "
+                       "WHERE table_name = 'match_statistics' AND column_name = ANY(%s)", (columns,))
+        types = {row[0] for row in cursor.fetchall()}
+    assert "text" not in types
+    _assert_converted({row[0]: dict(zip(columns, row[1:])) for row in rows}, texts)
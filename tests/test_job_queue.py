@@ -0,0 +1,23 @@
+import job_queue
+from db_connection import transaction
+
+def _expire_leases(queue):
+    with transaction() as cursor:
+        cursor.execute("UPDATE ingest_jobs SET lease_until = now() - interval '1 second' WHERE queue = %s", (queue,))
+
+def test_only_the_lease_holder_completes_a_job(postgres):
+    queue = "test:lease"
+    job_queue.enqueue([999999201, 999999202], queue)
+    assert job_queue.claim(queue, worker="host:1") == [999999201, 999999202]
+    # The first worker stalls past its lease and another one takes a job over.
+    _expire_leases(queue)
+    assert job_queue.claim(queue, limit=1, worker="host:2") == [999999201]
+
+    with transaction() as cursor:
+        assert job_queue.complete_jobs(cursor, queue, [999999201, 999999202], worker="host:1") == [999999202]
+    assert job_queue.queue_stats(queue)["running"] == 1
+    with transaction() as cursor:
+        assert job_queue.complete_jobs(cursor, queue, [999999201], worker="host:2") == [999999201]
+        # Done jobs aren't completed twice.
+        assert job_queue.complete_jobs(cursor, queue, [999999202], worker="host:1") == []
+    assert job_queue.queue_stats(queue)["done"] == 2
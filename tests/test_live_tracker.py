@@ -0,0 +1,29 @@
+import pytest
+from live_tracker import (FIRST_HALF, HALFTIME, INTERVAL_CLOSING_MINUTES, INTERVAL_HALFTIME, INTERVAL_IN_PLAY,
+                          INTERVAL_NEAR_KICKOFF, INTERVAL_OTHER, KICKOFF_LEAD, SECOND_HALF, next_poll_delay)
+
+NOW = 1_700_000_000
+
+def _event(status_type, code=None, start=None, period_start=None):
+    event = {"status": {"type": status_type, "code": code}, "startTimestamp": start}
+    if period_start is not None:
+        event["time"] = {"currentPeriodStartTimestamp": period_start}
+    return event
+
+@pytest.mark.parametrize("event, delay", [
+    (_event("finished"), None),
+    (_event("canceled"), None),
+    # Sleeps until shortly before kickoff, at most an hour at a time.
+    (_event("notstarted", start=NOW + KICKOFF_LEAD + 300), 300),
+    (_event("notstarted", start=NOW + 5 * 60 * 60), 60 * 60),
+    (_event("notstarted", start=NOW + 60), INTERVAL_NEAR_KICKOFF),
+    (_event("inprogress", HALFTIME), INTERVAL_HALFTIME),
+    (_event("inprogress", FIRST_HALF, period_start=NOW - 20 * 60), INTERVAL_IN_PLAY),
+    (_event("inprogress", FIRST_HALF, period_start=NOW - 43 * 60), INTERVAL_CLOSING_MINUTES),
+    (_event("inprogress", SECOND_HALF, period_start=NOW - 20 * 60), INTERVAL_IN_PLAY),
+    (_event("inprogress", SECOND_HALF, period_start=NOW - 36 * 60), INTERVAL_CLOSING_MINUTES),
+    (_event("inprogress", SECOND_HALF), INTERVAL_IN_PLAY),
+    (_event("postponed"), INTERVAL_OTHER),
+])
+def test_next_poll_delay(event, delay):
+    assert next_poll_delay(event, NOW) == delay
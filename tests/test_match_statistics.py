@@ -0,0 +1,41 @@
+import pytest
+from match_statistics import extract_periods, extract_statistics, full_match_period, period_statistics
+from stat_columns import stat_index
+
+def _block(period, *items):
+    return {"period": period, "groups": [{"statisticsItems": [
+        {"name": name, "home": home, "away": away} for name, home, away in items]}]}
+
+def _ids(stats):
+    return {stat_index.refs[stat_id].name: values for stat_id, values in stats.items()}
+
+def test_extract_periods_reads_every_period():
+    data = {"statistics": [
+        _block("ALL", ("Ball possession", "60%", "40%"), ("Total shots", 12, 7)),
+        _block("1ST", ("Ball possession", "55%", "45%")),
+        _block("2ND", ("Ball possession", "65%", "35%"), ("Expected goals", "1.34", "0.5")),
+    ]}
+    periods = extract_periods(data)
+    assert list(periods) == ["ALL", "1ST", "2ND"]
+    assert _ids(periods["ALL"]) == {"ball possession": ("60%", "40%"), "total shots": ("12", "7")}
+    assert _ids(periods["2ND"])["expected goals"] == ("1.34", "0.5")
+
+def test_extract_periods_fills_in_missing_sides():
+    periods = extract_periods({"statistics": [{"groups": [{"statisticsItems": [{"name": "Corner kicks", "home": 3}]}]}]})
+    assert _ids(periods["ALL"]) == {"corner kicks": ("3", "N/A")}
+
+@pytest.mark.parametrize("data", [{}, {"statistics": None}, {"statistics": [{"groups": None}]}, {"statistics": "x"}])
+def test_extract_periods_tolerates_malformed_payloads(data):
+    assert all(not stats for stats in extract_periods(data).values())
+
+def test_full_match_period_prefers_all():
+    assert full_match_period({"1ST": {0: ("1", "2")}, "ALL": {0: ("3", "4")}}) == {0: ("3", "4")}
+
+def test_full_match_period_falls_back_to_the_first_period():
+    assert full_match_period({"1ST": {0: ("1", "2")}, "2ND": {0: ("3", "4")}}) == {0: ("1", "2")}
+    assert full_match_period({}) == {}
+
+def test_extract_statistics_flattens_the_full_match():
+    data = {"statistics": [_block("1ST", ("Ball possession", "55%", "45%"))]}
+    assert extract_statistics(data) == {"ball possession_home": "55%", "ball possession_away": "45%"}
+    assert period_statistics({}) == {}
@@ -0,0 +1,40 @@
+from datetime import date
+from read_api import INVALIDATION_LOG_SIZE, ResponseLRU
+
+MATCH = (1, date(2024, 5, 1), 10, 100, 101)
+
+def test_invalidation_drops_entries_by_tag_and_date():
+    lru = ResponseLRU()
+    lru.put("team", b"1", [("team", 100)])
+    lru.put("other team", b"2", [("team", 200)])
+    lru.put("may", b"3", [], (date(2024, 5, 1), date(2024, 5, 31)))
+    lru.put("june", b"4", [], (date(2024, 6, 1), date(2024, 6, 30)))
+    assert lru.invalidate(*MATCH) == 2
+    assert lru.get("team") is None and lru.get("may") is None
+    assert lru.get("other team") == b"2" and lru.get("june") == b"4"
+
+def test_put_is_only_rejected_by_invalidations_of_its_own_keys():
+    lru = ResponseLRU()
+    generation = lru.generation
+    lru.invalidate(*MATCH)
+    for key, tags, dates in [("team", [("team", 101)], None), ("league", [("league", 10)], None),
+                             ("match", [("match", 1)], None), ("may", [], (date(2024, 4, 1), date(2024, 5, 1)))]:
+        lru.put(key, b"stale", tags, dates, generation)
+        assert lru.get(key) is None
+    for key, tags, dates in [("other team", [("team", 200)], None), ("june", [], (date(2024, 6, 1), date(2024, 6, 30)))]:
+        lru.put(key, b"fresh", tags, dates, generation)
+        assert lru.get(key) == b"fresh"
+    assert lru.stats()["stale_puts"] == 4
+
+def test_put_is_rejected_after_a_clear_or_too_many_invalidations():
+    lru = ResponseLRU()
+    generation = lru.generation
+    lru.clear()
+    lru.put("team", b"1", [("team", 200)], None, generation)
+    assert lru.get("team") is None
+
+    generation = lru.generation
+    for match_id in range(INVALIDATION_LOG_SIZE + 1):
+        lru.invalidate(match_id, date(2024, 5, 1), 10, 100, 101)
+    lru.put("team", b"1", [("team", 200)], None, generation)
+    assert lru.get("team") is None
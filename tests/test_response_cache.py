@@ -0,0 +1,85 @@
+import pytest
+import response_cache
+from response_cache import DEFAULT_TTL, ResponseCache, ttl_for_status
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(response_cache, "time", clock)
+    return clock
+
+@pytest.mark.parametrize("status, ttl", [
+    ("finished", None), ("inprogress", 30), ("notstarted", 15 * 60), ("postponed", DEFAULT_TTL), (None, DEFAULT_TTL),
+])
+def test_ttl_for_status(status, ttl):
+    assert ttl_for_status(status) == ttl
+
+def test_entries_expire_by_status(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("event", 1, {"live": True}, "inprogress")
+    cache.put("event", 2, {"done": True}, "finished")
+    clock.now += 29
+    assert cache.get("event", 1) == {"live": True}
+    clock.now += 2
+    assert cache.get("event", 1) is None
+    # Offline mode still serves the stale copy; finished matches never expire.
+    assert cache.get("event", 1, allow_stale=True) == {"live": True}
+    clock.now += 10 * 365 * 24 * 60 * 60
+    assert cache.get("event", 2) == {"done": True}
+    assert cache.get_status(1) == "inprogress"
+    assert cache.get("statistics", 1) is None
+
+def test_evicts_least_recently_used_past_the_limit(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    payload = {"values": list(range(200))}
+    for match_id in (1, 2, 3):
+        cache.put("event", match_id, payload, "finished")
+        clock.now += 120
+    entry_size = cache.stats()["bytes"] // 3
+    cache.max_bytes = entry_size * 3
+    # Reading match 1 makes match 2 the least recently used.
+    assert cache.get("event", 1) == payload
+    clock.now += 120
+    cache.put("event", 4, payload, "finished")
+    assert cache.stats() == {"entries": 3, "bytes": entry_size * 3}
+    assert cache.get("event", 2) is None
+    assert all(cache.get("event", match_id) == payload for match_id in (1, 3, 4))
+
+def test_nothing_is_evicted_within_the_limit(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=10 ** 6)
+    for match_id in range(20):
+        cache.put("event", match_id, {"id": match_id}, "finished")
+    assert cache.evict() == 0
+    assert cache.stats()["entries"] == 20
+
+def test_size_total_follows_replacements_and_existing_caches(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(path)
+    cache.put("event", 1, {"values": list(range(200))}, "inprogress")
+    cache.put("event", 1, {"values": []}, "finished")
+    cache.put("event", 2, {"values": list(range(50))}, "finished")
+    conn = cache._connection()
+    assert cache.stats()["bytes"] == conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+    # A cache written before the size table is counted once when opened.
+    conn.execute("DROP TABLE cache_size")
+    conn.commit()
+    assert ResponseCache(path).stats()["bytes"] == conn.execute("SELECT SUM(size) FROM responses").fetchone()[0]
+
+def test_hits_rewrite_last_access_at_most_once_a_minute(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("event", 1, {"done": True}, "finished")
+    stored = clock.now
+    last_access = lambda: cache._connection().execute("SELECT last_access FROM responses").fetchone()[0]
+    clock.now += 59
+    cache.get("event", 1)
+    assert last_access() == stored
+    clock.now += 1
+    cache.get("event", 1)
+    assert last_access() == stored + 60
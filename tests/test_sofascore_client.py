@@ -0,0 +1,82 @@
+import pytest
+import requests
+import sofascore_client
+from benchmarks.fake_sofascore import FakeSofaScore
+from sofascore_client import SofaScoreClient, TokenBucket
+
+class FakeClock:
+    """Stands in for the time module: sleeping advances the clock instantly."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    perf_counter = monotonic
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sofascore_client, "time", clock)
+    return clock
+
+def test_token_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket(rate=2, burst=3)
+    assert [bucket.acquire() for _ in range(3)] == [False, False, False]
+    assert clock.slept == []
+    assert bucket.acquire() is True
+    assert clock.slept == [pytest.approx(0.5)]
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(rate=1, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 10
+    # Refilled only up to the burst size.
+    assert [bucket.acquire() for _ in range(3)] == [False, False, True]
+
+def test_token_bucket_set_rate(clock):
+    bucket = TokenBucket(rate=1, burst=5)
+    bucket.set_rate(4, burst=1)
+    assert bucket.acquire() is False
+    bucket.acquire()
+    assert clock.slept == [pytest.approx(0.25)]
+
+class _Response:
+    def __init__(self, headers):
+        self.headers = headers
+
+def test_backoff_honours_retry_after():
+    client = SofaScoreClient("http://unused", backoff=100, rate_limiter=None, cache=None)
+    assert client._backoff_delay(3, _Response({"Retry-After": "7"})) == 7.0
+    # Without a usable Retry-After it falls back to jittered exponential backoff.
+    assert 0 <= client._backoff_delay(1, _Response({"Retry-After": "soon"})) <= 200
+
+@pytest.fixture
+def throttling_api():
+    fake = FakeSofaScore({"event/1": {"event": {"id": 1}}}, throttle_rate=1.0)
+    yield fake
+    fake.stop()
+
+def test_429_is_retried_then_raised(throttling_api):
+    client = SofaScoreClient(throttling_api.start(), max_retries=2, backoff=0, rate_limiter=None, cache=None)
+    with pytest.raises(requests.HTTPError) as error:
+        client.get_json("event/1")
+    assert error.value.response.status_code == 429
+    assert throttling_api.counters["throttled"] == 3
+    assert client.get_stats()["throttled"] == 3
+    assert client.get_stats()["retries"] == 2
+
+def test_429_retried_until_served(throttling_api):
+    throttling_api.throttle_rate = 0.5
+    throttling_api.random.seed(1)
+    client = SofaScoreClient(throttling_api.start(), max_retries=20, backoff=0, rate_limiter=None, cache=None)
+    for _ in range(5):
+        assert client.get_json("event/1") == {"event": {"id": 1}}
+    assert client.get_stats()["retries"] == throttling_api.counters["throttled"] > 0
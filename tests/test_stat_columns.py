@@ -0,0 +1,52 @@
+import sqlite3
+import pytest
+from stat_columns import STAT_NAMES, StatRegistry, stat_column
+
+@pytest.mark.parametrize("name, column", [
+    ("ball possession", "ball_possession_home"),
+    ("throw-ins", "throw_ins_home"),
+    ("Keeper's sweeper (%)", "keeper_s_sweeper_home"),
+    ("passes 50/50", "passes_50_50_home"),
+    ("1st serve %", "stat_1st_serve_home"),
+    ("%", "stat_home"),
+])
+def test_stat_column_is_a_plain_identifier(name, column):
+    assert stat_column(name, "home") == column
+
+def test_stat_column_keeps_existing_columns():
+    for name in STAT_NAMES:
+        assert stat_column(name, "away") == name.replace(" ", "_").replace("-", "_").replace("/", "_") + "_away"
+
+def test_ensure_stats_adds_columns_for_odd_names(sqlite_store):
+    registry = StatRegistry(STAT_NAMES)
+    statistics = {"keeper's sweeper (%)_home": "3", "keeper's sweeper (%)_away": "1"}
+
+    assert registry.ensure_stats(statistics, True) == ["keeper's sweeper (%)"]
+    assert {"keeper_s_sweeper_home", "keeper_s_sweeper_away"} <= sqlite_store.table_columns()
+    assert registry.ensure_stats(statistics, True) == []
+    assert "keeper_s_sweeper_home" in registry.plan(True).column_names
+
+def test_ensure_stats_ignores_stats_whose_columns_fail(sqlite_store, monkeypatch):
+    registry = StatRegistry(STAT_NAMES)
+    calls = []
+
+    def fail(columns, typed):
+        calls.append(columns)
+        raise sqlite3.OperationalError("unrecognized token")
+    monkeypatch.setattr(registry, "_add_columns", fail)
+
+    statistics = {"bad stat_home": "1", "bad stat_away": "2"}
+    assert registry.ensure_stats(statistics, True) == []
+    assert registry.ensure_stats(statistics, True) == []
+    assert len(calls) == 1
+    assert "bad_stat_home" not in registry.plan(True).column_names
+
+def test_insert_match_with_odd_stat_name(sqlite_store):
+    from db_operations import insert_match
+    statistics = {"total shots_home": "12", "total shots_away": "7",
+                  "keeper's sweeper (%)_home": "2", "keeper's sweeper (%)_away": "4"}
+    for match_id in (1, 2):
+        assert insert_match(match_id, "2024-09-01", "Home", "Away", "League", statistics) == "inserted"
+    rows = sqlite_store.connection().execute(
+        "SELECT keeper_s_sweeper_home, keeper_s_sweeper_away FROM match_statistics ORDER BY match_id").fetchall()
+    assert rows == [(2, 4), (2, 4)]
@@ -0,0 +1,47 @@
+import team_aggregates
+from db_connection import transaction
+from db_operations import insert_match, rebuild_team_aggregates
+
+def _aggregates():
+    with transaction() as cursor:
+        cursor.execute("SELECT team_id, league_id, season, stat, n, total, total_sq FROM team_season_stats "
+                       "WHERE n <> 0 ORDER BY 1, 2, 3, 4")
+        return cursor.fetchall()
+
+def test_first_write_fills_a_new_table_from_the_stored_matches(postgres, monkeypatch):
+    with transaction() as cursor:
+        cursor.execute("DROP TABLE IF EXISTS team_season_stats CASCADE")
+        cursor.execute("SELECT match_id, date FROM match_statistics ORDER BY match_id LIMIT 1")
+        match_id, match_date = cursor.fetchone()
+    monkeypatch.setattr(team_aggregates, "_table_ready", False)
+
+    statistics = {"total shots_home": "9", "total shots_away": "4", "ball possession_home": "51%",
+                  "ball possession_away": "49%"}
+    assert insert_match(match_id, match_date, "Aggregate Home FC", "Aggregate Away FC", "Aggregate League",
+                        statistics) == "updated"
+    incremental = _aggregates()
+    rebuild_team_aggregates()
+    assert incremental and incremental == _aggregates()
+
+def test_deleting_matches_subtracts_their_contribution(postgres):
+    from storage import get_backend
+    with transaction() as cursor:
+        cursor.execute("SELECT match_id FROM match_statistics ORDER BY match_id LIMIT 3")
+        match_ids = [row[0] for row in cursor.fetchall()]
+    rebuild_team_aggregates()
+    assert get_backend().delete_matches(match_ids) == 3
+    incremental = _aggregates()
+    rebuild_team_aggregates()
+    assert incremental == _aggregates()
+
+def test_sqlite_delete_subtracts_their_contribution(sqlite_store):
+    from benchmarks.dump import DEFAULT_DUMP
+    sqlite_store.import_dump(DEFAULT_DUMP)
+    conn = sqlite_store.connection()
+    match_ids = [row[0] for row in conn.execute("SELECT match_id FROM match_statistics ORDER BY match_id LIMIT 3")]
+    aggregates = lambda: conn.execute("SELECT team_id, league_id, season, stat, n, round(total, 6) "
+                                      "FROM team_season_stats WHERE n <> 0 ORDER BY 1, 2, 3, 4").fetchall()
+    assert sqlite_store.delete_matches(match_ids) == 3
+    incremental = aggregates()
+    sqlite_store.rebuild_aggregates()
+    assert incremental == aggregates()